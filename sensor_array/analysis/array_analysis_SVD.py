@@ -19,7 +19,7 @@ import yaml
 
 def yaml_loader(filepath):
     with open(filepath, 'r') as yaml_file:
-        data = yaml.load(yaml_file)
+        data = yaml.safe_load(yaml_file)
     return(data)
 
 
@@ -51,13 +51,12 @@ the same keyword whenever the argument was the same for clarity.
 # --------------------------------------------------
 import copy
 import csv
-import operator
+import heapq
 import os
 import sys
 from datetime import datetime
-from functools import reduce
 from itertools import combinations
-from math import isnan, log
+from math import isnan
 import random
 
 import numpy as np
@@ -71,17 +70,28 @@ from scipy.spatial import Delaunay
 from scipy.interpolate import spline
 import ternary
 
+from pmf_matrix import (read_data_as_dict,
+                        read_results_store,
+                        results_store_as_dict,
+                        moving_average_smooth_matrix,
+                        simulated_mass_matrix,
+                        experimental_masses,
+                        calculate_element_pmf_matrix,
+                        element_pmfs_from_results,
+                        calculate_all_array_pmfs,
+                        digitize_compositions,
+                        bin_array_pmfs,
+                        calculate_array_klds,
+                        array_pmfs_as_dict,
+                        array_pmfs_from_dict,
+                        binned_pmfs_as_dict,
+                        binned_pmfs_from_dict)
+
 # --------------------------------------------------
 # ----- User-defined Python Functions --------------
 # --------------------------------------------------
 
 # ----- Read and Write Data Files -----
-def read_data_as_dict(filename):
-    with open(filename,newline='') as csvfile:
-        output_data = csv.DictReader(csvfile, delimiter="\t")
-        return list(output_data)
-
-
 def write_data_as_tabcsv(filename, data):
     with open(filename,'w', newline='') as csvfile:
         writer = csv.writer(csvfile, delimiter="\t")
@@ -92,7 +102,7 @@ def write_data_as_tabcsv(filename, data):
 
 def yaml_loader(filepath):
     with open(filepath, 'r') as yaml_file:
-        data = yaml.load(yaml_file)
+        data = yaml.safe_load(yaml_file)
     return data
 
 
@@ -164,68 +174,10 @@ def moving_average_smooth(sim_results_import, mof_list, gases, comp_list, mole_f
     Smooth a set of simulated data by averageing the data points around a given value. Central points
     sample from points in all directions. Boundary points sample from points along the boundary.
     Corner points remain unchanged.
-    With current data strucutre, this function will be highly inefficient. May not be slow enough to
-    warrant changing, but worth noting.
+    The data of all MOFs is averaged at once on the lattice of mole fractions, see
+    moving_average_smooth_matrix in pmf_matrix.py.
     """
-
-    # Create a temporary data set for the mof of interest. Consider doing this in a separate function.
-    data_smoothed = []
-    for mof in mof_list:
-
-        temp_data = []
-        for row in sim_results_import:
-            if row['MOF'] == mof:
-                temp_data.extend([row])
-
-        for comp_main in comp_list:
-            temp_dict = {}
-            for row in temp_data:
-                if [float(row[gas]) for gas in gases] == [comp_main[gas] for gas in gases]:
-                    temp_dict = dict(row)
-            for gas in gases:
-                temp_dict[gas] = comp_main[gas]
-
-            # Create list of possible compoenent mole fractions to use in determining neighbors.
-            allowed_comps = {}
-            for gas in gases:
-                index = mole_fractions[gas].index(comp_main[gas])
-                for i in range(0, num_points+1):
-                    if index-i >= 0 and index+i <= len(mole_fractions[gas])-1:
-                        allowed_comps[gas] = [mole_fractions[gas][i] for i in range(index-i, index+i+1)]
-
-            # Extract a list of neighbors (include main point) based on the allowed composititons.
-            # Since this includes the main point, len(temp_data_subset) will always >= 1.
-            temp_data_subset = []
-            for row in temp_data:
-                boolean_array = []
-                for gas in gases:
-                    if allowed_comps.get(gas) != None:
-                        if float(row[gas]) in allowed_comps[gas]:
-                            boolean_array.extend([1])
-                        else:
-                            boolean_array.extend([0])
-                    else:
-                        boolean_array.extend([0])
-                boolean_array = [i for i in boolean_array if i == 0]
-                if len(boolean_array) == 0:
-                    temp_data_subset.extend([row])
-
-            # Calculate the average mass of all points in the subset.
-            if len(temp_data_subset) != 0:
-                mass_total = 0.0
-                for row in temp_data_subset:
-                    mass_total += float(row['Mass_mg/cm3'])
-                mass_average = mass_total / len(temp_data_subset)
-                temp_dict['Mass_mg/cm3'] = mass_average
-                temp_dict['Num_points'] = len(temp_data_subset)
-            else:
-                mass_average = 0.0
-                temp_dict['Mass_mg/cm3'] = temp_dict['Mass_mg/cm3']
-                temp_dict['Num_points'] = len(temp_data_subset)
-
-            data_smoothed.extend([temp_dict])
-
-    return data_smoothed
+    return moving_average_smooth_matrix(sim_results_import, mof_list, gases, comp_list, mole_fractions, num_points)
 
 
 def reintroduce_random_error(sim_results_import, error=1, seed=0):
@@ -311,62 +263,23 @@ def calculate_element_pmf(exp_results_full, sim_results_full, mof_list, stdev, m
     the real mass falls in a small range around the measured mass. Examine the
     difference between these two approaches in more detail, along with the effects
     of the employed error function parameters.
-    """
+    Both are evaluated for all MOFs and compositions at once by calculate_element_pmf_matrix.
+    """
+    # Evaluate the pmfs of all MOFs at once, as (MOFs x compositions) matrices. With more than
+    # one experimental result for a MOF, the last one is used.
+    sim_masses = simulated_mass_matrix(sim_results_full, mof_list)
+    exp_masses = experimental_masses(exp_results_full, mof_list)
+    pmf_range, pmf_exact = calculate_element_pmf_matrix(sim_masses, exp_masses, stdev, mrange, type=type)
+
+    # Copy each simulated result with the pmfs of its MOF and composition
+    all_results_sim = {mof: [] for mof in mof_list}
+    for row in sim_results_full:
+        if row['MOF'] in all_results_sim:
+            all_results_sim[row['MOF']].append(row)
     element_pmf_results = []
-    for mof in mof_list:
-        # Isolate the simulated results for the mof
-        all_results_sim = [row for row in sim_results_full if row['MOF'] == mof]
-        all_masses_sim = [row['Mass_mg/cm3'] for row in all_results_sim]
-
-        # Isolate the experimental result(s) for the mof
-        all_results_exp = [row for row in exp_results_full if row['MOF'] == mof]
-        all_masses_exp = [row['Mass_mg/cm3'] for row in all_results_exp]
-
-        # Calculate all pmfs based on the experimental mass and truncated normal
-        # probability distribution.
-        mof_temp_dict = []
-        for mass_exp in all_masses_exp:
-            probs_range = []
-            probs_exact = []
-            if type == 'mass':
-                a, b = 0, 2*float(max(all_masses_sim))
-                mu, sigma = float(mass_exp), float(stdev)
-                alpha, beta = ((a-mu)/sigma), ((b-mu)/sigma)
-            if type == 'percent':
-                a, b = 0, float(max(all_masses_sim)) * (1 + mrange)
-                mu, sigma = float(mass_exp), float(stdev)*float(mass_exp)
-                alpha, beta = ((a-mu)/sigma), ((b-mu)/sigma)
-            for mass_sim in all_masses_sim:
-                upper_prob = ss.truncnorm.cdf(float(mass_sim) * (1 + mrange), alpha, beta, loc = mu, scale = sigma)
-                lower_prob = ss.truncnorm.cdf(float(mass_sim) * (1 - mrange), alpha, beta, loc = mu, scale = sigma)
-                probs_range.append(upper_prob - lower_prob)
-                prob_singlepoint = ss.truncnorm.pdf(float(mass_sim), alpha, beta, loc=mu, scale=sigma)
-                probs_exact.append(prob_singlepoint)
-            sum_probs_range = sum(probs_range)
-            norm_probs_range = [(i/sum_probs_range) for i in probs_range]
-            sum_probs_exact = sum(probs_exact)
-            norm_probs_exact = [(i/sum_probs_exact) for i in probs_exact]
-
-            # Update dictionary with pmf for each MOF
-            new_temp_dict = []
-            # Initialize the dictioary
-            if mof_temp_dict == []:
-                for index in range(len(norm_probs_range)):
-                    mof_temp_dict = all_results_sim[index].copy()
-                    mof_temp_dict['PMF_Range'] = norm_probs_range[index]
-                    mof_temp_dict['PMF_Exact'] = norm_probs_exact[index]
-                    new_temp_dict.extend([mof_temp_dict])
-                new_temp_dict_2 = new_temp_dict
-            # Add to the exisitng dictionary
-            else:
-                for index in range(len(norm_probs_range)):
-                    mof_temp_dict = new_temp_dict_2[index].copy()
-                    mof_temp_dict['PMF_Range'] = norm_probs_range[index]
-                    mof_temp_dict['PMF_Exact'] = norm_probs_exact[index]
-                    new_temp_dict.extend([mof_temp_dict])
-                new_temp_dict_2 = new_temp_dict
-
-        element_pmf_results.extend(new_temp_dict_2)
+    for i, mof in enumerate(mof_list):
+        for index, row in enumerate(all_results_sim[mof]):
+            element_pmf_results.append(dict(row, PMF_Range=pmf_range[i, index], PMF_Exact=pmf_exact[i, index]))
 
     return element_pmf_results
 
@@ -404,8 +317,8 @@ def calculate_all_arrays_list(mof_list, num_mofs):
 def calculate_all_arrays(mof_list, num_mofs, element_pmf_results, gases):
     """
     ----- Calculates all possible arrays and corresponding pmfs ----
-    Sets up all combinations of MOF arrays, uses function 'calculate_array_pmf'
-    to get pmf values for every array/gas/experiment combination
+    Sets up all combinations of MOF arrays, uses function 'enumerate_array_pmfs'
+    (through 'calculate_all_array_pmfs') to get pmf values for every array/gas/experiment combination
     Keyword arguments:
         mof_list -- list of all mofs
         num_mofs -- lower and upper limit of desired number of mofs in array
@@ -413,31 +326,14 @@ def calculate_all_arrays(mof_list, num_mofs, element_pmf_results, gases):
         gases -- list of gases
     """
 
-    # Creates list of MOF arrays, all combinations from min to max number of MOFs
-    mof_array_list = []
-    array_size = min(num_mofs)
-    while array_size <= max(num_mofs):
-        mof_array_list.extend(list(combinations(mof_list, array_size)))
-        array_size += 1
-
-    # Save list of dictionaries for first MOF for use as a list of all gas mole fractions
-    comp_set_dict = [row for row in element_pmf_results if row['MOF'] == mof_list[0]]
-
-    # Calculate and save the pmfs for each of the generated arrys
-    all_array_pmf_results = []
-    for mof_array in mof_array_list:
-        single_array_pmf_results = calculate_array_pmf(mof_array, element_pmf_results)
-        if mof_array == mof_array_list[0]:
-            # First Array: Set up dictionary with keys
-            for index in range(len(comp_set_dict)):
-                array_dict = {' '.join(mof_array) : single_array_pmf_results[index]}
-                for gas in gases:
-                    array_dict[gas] = float(comp_set_dict[index][gas])
-                all_array_pmf_results.extend([array_dict])
-        else:
-            # Not First Array: Update Dictionary
-            for index in range(len(comp_set_dict)):
-                all_array_pmf_results[index][' '.join(mof_array)] = single_array_pmf_results[index]
+    # Enumerate the arrays and their pmfs as a matrix (see enumerate_array_pmfs), then convert
+    # to a dictionary per composition with a key for each array
+    element_pmfs = element_pmfs_from_results(element_pmf_results, mof_list, gases)
+    skipped = []
+    mof_array_list, array_pmfs = calculate_all_array_pmfs(element_pmfs, num_mofs, skipped)
+    if skipped:
+        print("Left out %s arrays whose PMF is zero at every composition" % sum(skipped))
+    all_array_pmf_results = array_pmfs_as_dict(element_pmfs, mof_array_list, array_pmfs)
 
     return mof_array_list, all_array_pmf_results
 
@@ -460,6 +356,14 @@ def create_bins(gases, num_bins, mof_list, element_pmf_results):
     #     comps_array.append([float(row[gas]) for gas in gases])
     comps_array = np.array([[float(row[gas]) for gas in gases] for row in comp_set_dict])
     # Figure out what is different between commented approach and current one!
+    return create_bins_from_comps(gases, num_bins, comps_array)
+
+
+def create_bins_from_comps(gases, num_bins, comps_array):
+    """
+    ----- Creates bins for all gases from a (compositions x gases) array -----
+    Used by create_bins, and directly with the comps of element_pmfs (see pmf_matrix.py).
+    """
 
     # Determine the set of points used to create bins
     bin_points = []
@@ -488,6 +392,23 @@ def create_comp_set_dict(element_pmf_results, mof_list):
     return comp_set_dict
 
 
+def bin_array_dicts(gases, bins, list_of_arrays, all_array_pmf_results, maximum=True):
+    # bin_compositions, on the matrix of the array pmfs (see bin_array_pmfs in pmf_matrix.py)
+    comps = np.array([[float(row[gas]) for gas in gases] for row in all_array_pmf_results]).reshape(-1, len(gases))
+    comp_bins = digitize_compositions(comps, gases, bins)
+    for g, gas in enumerate(gases):
+        for row, i in zip(all_array_pmf_results, comp_bins[:, g]):
+            if i >= 0:
+                row['%s bin' % gas] = bins[i][gas]
+
+    array_pmfs = array_pmfs_from_dict(list_of_arrays, all_array_pmf_results)
+    binned_sum, binned_max = bin_array_pmfs(array_pmfs, comp_bins, len(bins)-1, maximum=maximum)
+    binned_probabilities_sum = binned_pmfs_as_dict(gases, bins, list_of_arrays, binned_sum)
+    if not maximum:
+        return binned_probabilities_sum, None
+    return binned_probabilities_sum, binned_pmfs_as_dict(gases, bins, list_of_arrays, binned_max)
+
+
 def bin_compositions_single_array(gases, bins, array, single_array_pmf_results, comp_set_dict):
     # Create a dictionary from array_pmf_results
     array_key = ' '.join(array)
@@ -499,37 +420,8 @@ def bin_compositions_single_array(gases, bins, array, single_array_pmf_results,
             array_dict_temp[gas] = float(comp_set_dict[index][gas])
         array_dict.append(array_dict_temp)
 
-    # Loop through dictionary and assign bins
-    for gas in gases:
-        for row in array_dict:
-            for i in range(1,len(bins)):
-                lower_bin = bins[i-1][gas]
-                upper_bin = bins[i][gas]
-                gas_comp = float(row[gas])
-                if gas_comp >= lower_bin and gas_comp < upper_bin:
-                    row['%s bin' % gas] = lower_bin
-
-    # Loops through all of the bins and takes sum over all pmfs in that bin.
-    binned_probabilities_sum = []
-    for gas in gases:
-        all_bins_temp_sum = []
-        for bin in bins[0:len(bins)-1]:
-            pmfs_temp = []
-            for row in array_dict:
-                if bin[gas] == row['%s bin' % gas]:
-                    pmfs_temp.append(row[array_key])
-
-            single_bin_temp = {'%s bin' % gas : bin[gas]}
-            with_sum = copy.deepcopy(single_bin_temp)
-            if pmfs_temp == []:
-                with_sum[array_key] = 0
-            else:
-                with_sum[array_key] = sum(pmfs_temp)
-            all_bins_temp_sum.append(with_sum)
-
-        # Creates list of binned probabilities, already normalized
-        binned_probabilities_sum.extend(all_bins_temp_sum)
-
+    # Assign bins, and take the sum over all pmfs in each bin
+    binned_probabilities_sum, _ = bin_array_dicts(gases, bins, [array], array_dict, maximum=False)
     return binned_probabilities_sum, array_dict
 
 
@@ -548,76 +440,13 @@ def bin_compositions(gases, bins, list_of_arrays, all_array_pmf_results):
         all_array_pmf_results -- list of dictionaries, arrays, joint pmfs
     """
 
-    binned_probabilities_sum = []
-    binned_probabilities_max = []
-    for gas in gases:
-        # Assigns pmf to bin value (dictionary) by checking whether mole frac is
-        # between the current and next bin value.
-        # Current method likely inefficient, but it works. Can revisit later.
-        for row in all_array_pmf_results:
-             for i in range(1, len(bins)):
-                 lower_bin = bins[i-1][gas]
-                 upper_bin = bins[i][gas]
-                 gas_comp = float(row[gas])
-                 if gas_comp >= lower_bin and gas_comp < upper_bin:
-                     row['%s bin' % gas] = lower_bin
-
-        # Loops through all of the bins and takes sum over all pmfs in that bin.
-        all_bins_temp_sum = []
-        all_bins_temp_max = []
-        array_names = [' '.join(array) for array in list_of_arrays]
-        for bin in bins[0:len(bins)-1]:
-            array_pmfs_temp = {array: [] for array in array_names}
-            for row in all_array_pmf_results:
-                if bin[gas] == row['%s bin' % gas]:
-                    for array in array_names:
-                        array_pmfs_temp[array].append(row[array])
-
-            # Updates pmfs for each array for current bin
-            # Many methods here of handling multiple data points.
-            # Currently, can sum all pmfs, or take the max value.
-            single_bin_temp = {'%s bin' % gas : bin[gas]}
-            with_sum = copy.deepcopy(single_bin_temp)
-            with_max = copy.deepcopy(single_bin_temp)
-            for array in array_names:
-                if array_pmfs_temp[array] == []:
-                    with_sum[array] = 0
-                    with_max[array] = 0
-                else:
-                    with_sum[array] = sum(array_pmfs_temp[array])
-                    with_max[array] = max(array_pmfs_temp[array])
-            all_bins_temp_sum.append(with_sum)
-            all_bins_temp_max.append(with_max)
-
-        # Creates list of binned probabilities, already normalized
-        binned_probabilities_sum.extend(all_bins_temp_sum)
-        binned_probabilities_max.extend(all_bins_temp_max)
-
-    return binned_probabilities_sum, binned_probabilities_max
+    return bin_array_dicts(gases, bins, list_of_arrays, all_array_pmf_results)
 
 
 def calculate_single_array_kld(gases, array, bins, single_array_pmf_results, binned_probabilities):
-    dict_temp = {'MOF_Array' : array}
-    array_name = ' '.join(array)
-
-    # Calculate Absolute KLD
-    reference_prob_abs = 1/len(single_array_pmf_results)
-    abs_kld = sum([float(pmf)*log(float(pmf)/reference_prob_abs,2) for pmf in single_array_pmf_results if pmf != 0])
-    dict_temp['Absolute_KLD'] = round(abs_kld,4)
-
-    # Calculate Component KLD
-    for gas in gases:
-        reference_prob_comp = 1/len(bins)
-        pmfs_per_array_comp = [row[array_name] for row in binned_probabilities if '%s bin' % gas in row.keys()]
-        kld_comp = sum([float(pmf)*log(float(pmf)/reference_prob_comp,2) for pmf in pmfs_per_array_comp if pmf != 0])
-        dict_temp['%s KLD' % gas] = round(kld_comp,4)
-
-    # Calculate Joint KLD
-    product_temp = reduce(operator.mul, [dict_temp['%s KLD' % gas] for gas in gases], 1)
-    dict_temp['Joint_KLD'] = product_temp
-    dict_temp['Array_Size'] = len(dict_temp['MOF_Array'])
-
-    return dict_temp
+    array_pmfs = np.array(single_array_pmf_results, dtype=float).reshape(1, -1)
+    binned_pmfs = binned_pmfs_from_dict(gases, [array], binned_probabilities)
+    return calculate_array_klds(gases, [array], bins, array_pmfs, binned_pmfs)[0]
 
 
 def calculate_kld(gases, list_of_arrays, bins, all_array_pmf_results, binned_probabilities):
@@ -630,31 +459,9 @@ def calculate_kld(gases, list_of_arrays, bins, all_array_pmf_results, binned_pro
         binned_probabilities -- list of dictionaries, mof array, gas, pmfs
     """
 
-    array_kld_results = []
-    for array in list_of_arrays:
-        dict_temp = {'MOF_Array' : array}
-        array_name = ' '.join(array)
-
-        # Calculate Absolute KLD
-        pmfs_per_array_abs = [row[array_name] for row in all_array_pmf_results]
-        reference_prob_abs = 1/len(pmfs_per_array_abs)
-        abs_kld = sum([float(pmf)*log(float(pmf)/reference_prob_abs,2) for pmf in pmfs_per_array_abs if pmf != 0])
-        dict_temp['Absolute_KLD'] = round(abs_kld,4)
-
-        # Calculate Component KLD
-        for gas in gases:
-            reference_prob_comp = 1/len(bins)
-            pmfs_per_array_comp = [row[array_name] for row in binned_probabilities if '%s bin' % gas in row.keys()]
-            kld_comp = sum([float(pmf)*log(float(pmf)/reference_prob_comp,2) for pmf in pmfs_per_array_comp if pmf != 0])
-            dict_temp['%s KLD' % gas] = round(kld_comp,4)
-
-        # Calculate Joint KLD
-        product_temp = reduce(operator.mul, [dict_temp['%s KLD' % gas] for gas in gases], 1)
-        dict_temp['Joint_KLD'] = product_temp
-        dict_temp['Array_Size'] = len(dict_temp['MOF_Array'])
-        array_kld_results.append(dict_temp)
-
-    return array_kld_results
+    array_pmfs = array_pmfs_from_dict(list_of_arrays, all_array_pmf_results)
+    binned_pmfs = binned_pmfs_from_dict(gases, list_of_arrays, binned_probabilities)
+    return calculate_array_klds(gases, list_of_arrays, bins, array_pmfs, binned_pmfs)
 
 
 def choose_arrays(gases, num_mofs, array_kld_results, num_best_worst):
@@ -710,6 +517,61 @@ def choose_arrays(gases, num_mofs, array_kld_results, num_best_worst):
     return best_and_worst_arrays_by_absKLD, best_and_worst_arrays_by_jointKLD, best_and_worst_arrays_by_gasKLD
 
 
+def push_bounded(heap, item, size):
+    # keeps the size largest items pushed to heap
+    if len(heap) < size:
+        heapq.heappush(heap, item)
+    elif size > 0 and item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def choose_arrays_streaming(gases, num_mofs, array_kld_results, num_best_worst):
+    """
+    ----- Rank MOF arrays by KLD as they are calculated -----
+    Returns the same lists as choose_arrays, but array_kld_results can be any iterable of results,
+    such as the generator evaluate_all_arrays, and is only read once. For every KLD and array
+    size only the num_best_worst best and worst arrays so far are kept, in heaps, so memory does
+    not grow with the number of arrays. Arrays with equal KLDs are ranked in the order they come,
+    as by the (stable) sorts of choose_arrays.
+    Keyword arguments:
+        gases -- list of gases
+        num_mofs -- minimum and maximum number of mofs in an array, usr specified in config file
+        array_kld_results -- iterable of dictionaries including, mof array, gas, and corresponding kld
+        num_best_worst - number of the best and worst mofs of eash array size to save
+    """
+    kld_keys = ['Absolute_KLD', 'Joint_KLD'] + ['%s KLD' % gas for gas in gases]
+    array_sizes = range(min(num_mofs), max(num_mofs)+1)
+    best = {(kld_key, array_size): [] for kld_key in kld_keys for array_size in array_sizes}
+    worst = {(kld_key, array_size): [] for kld_key in kld_keys for array_size in array_sizes}
+
+    # Heap items are (KLD, -order) for the best and (-KLD, -order) for the worst, so the root is
+    # always the array to drop next; order is unique, so the dictionaries are never compared.
+    for order, array in enumerate(array_kld_results):
+        array_size = len(array['MOF_Array'])
+        if array_size not in array_sizes:
+            continue
+        for kld_key in kld_keys:
+            push_bounded(best[(kld_key, array_size)], (array[kld_key], -order, array), num_best_worst)
+            push_bounded(worst[(kld_key, array_size)], (-array[kld_key], -order, array), num_best_worst)
+
+    def ranked(heap):
+        return [item[2] for item in sorted(heap, reverse=True)]
+
+    best_and_worst_arrays_by_absKLD = []
+    best_and_worst_arrays_by_jointKLD = []
+    for heaps in [best, worst]:
+        for array_size in array_sizes:
+            best_and_worst_arrays_by_absKLD.extend(ranked(heaps[('Absolute_KLD', array_size)]))
+            best_and_worst_arrays_by_jointKLD.extend(ranked(heaps[('Joint_KLD', array_size)]))
+    best_and_worst_arrays_by_gasKLD = []
+    for gas in gases:
+        for array_size in array_sizes:
+            best_and_worst_arrays_by_gasKLD.extend(ranked(best[('%s KLD' % gas, array_size)]))
+            best_and_worst_arrays_by_gasKLD.extend(ranked(worst[('%s KLD' % gas, array_size)]))
+
+    return best_and_worst_arrays_by_absKLD, best_and_worst_arrays_by_jointKLD, best_and_worst_arrays_by_gasKLD
+
+
 def assign_array_ids(list_of_arrays):
     """
     Assign numbers to each array for shorthand notation
@@ -0,0 +1,185 @@
+"""
+Parallel brute force analysis of all possible arrays. The arrays (in the order of
+calculate_all_arrays_list) are split into shards of consecutive positions, each evaluated by
+evaluate_all_arrays from its first array (found by unranking, see unrank_combination) and ranked
+by choose_arrays_streaming. The shards are spread over the cores of a node, which read the element
+PMFs from shared memory, and over the tasks of a SLURM job array.
+
+Every finished shard writes its best and worst arrays to a file in the shard directory, so an
+interrupted run skips the shards already done, and merge_shards ranks the arrays of all shards.
+"""
+
+# --------------------------------------------------
+# ----- Import Python Packages ---------------------
+# --------------------------------------------------
+import csv
+import hashlib
+import os
+from math import comb
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import yaml
+
+from brute_force_analysis import choose_arrays_streaming
+from genetic_algorithm_analysis import read_GA_results_messy
+from pmf_matrix import count_arrays, evaluate_all_arrays, mof_indices, rank_combination
+
+# element PMFs of a worker process, with the PMF matrix in shared memory
+worker_element_pmfs = None
+
+# --------------------------------------------------
+# ----- User-defined Python Functions --------------
+# --------------------------------------------------
+def shard_ranges(num_arrays, num_shards):
+    # (start, stop) positions of num_shards shards of (nearly) equal size
+    bounds = [num_arrays * shard // num_shards for shard in range(num_shards+1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def shard_filename(shard_dir, shard):
+    return os.path.join(shard_dir, 'shard_%05d.csv' % shard)
+
+
+def array_position(element_pmfs, num_mofs, mof_array):
+    # position of an array (tuple of MOF names) in the enumeration of all arrays
+    num_elements = len(element_pmfs['mofs'])
+    smaller_arrays = count_arrays(num_elements, [min(num_mofs), len(mof_array)]) - comb(num_elements, len(mof_array))
+    return smaller_arrays + rank_combination(num_elements, [int(i) for i in mof_indices(element_pmfs, mof_array)])
+
+
+def write_shard_settings(shard_dir, settings):
+    """
+    ----- Records the settings of a sharded run in its shard directory -----
+    Shard files are only valid for the settings they were calculated with, so a shard directory
+    keeps them in shards.yaml, and resuming a run with different settings is an error.
+    """
+    filename = os.path.join(shard_dir, 'shards.yaml')
+    os.makedirs(shard_dir, exist_ok=True)
+    if os.path.exists(filename):
+        with open(filename) as yaml_file:
+            saved_settings = yaml.safe_load(yaml_file)
+        if saved_settings != settings:
+            raise ValueError("Shard directory %s was written with different settings (%s); use a new directory"
+                             % (shard_dir, filename))
+    else:
+        # tasks of a job array may start at once, so write it whole or not at all
+        with open('%s.%s' % (filename, os.getpid()), 'w') as yaml_file:
+            yaml.safe_dump(settings, yaml_file)
+        os.replace('%s.%s' % (filename, os.getpid()), filename)
+
+
+def share_element_pmfs(element_pmfs):
+    # copies the PMF matrix to a new block of shared memory, which the caller closes and unlinks
+    pmf = element_pmfs['pmf']
+    shm = shared_memory.SharedMemory(create=True, size=max(pmf.nbytes, 1))
+    np.ndarray(pmf.shape, dtype=pmf.dtype, buffer=shm.buf)[:] = pmf
+    return shm
+
+
+def attach_element_pmfs(shm_name, shape, dtype, element_pmfs):
+    # initializer of worker processes: element PMFs with the PMF matrix in shared memory
+    global worker_element_pmfs
+    shm = shared_memory.SharedMemory(name=shm_name)
+    worker_element_pmfs = dict(element_pmfs, pmf=np.ndarray(shape, dtype=dtype, buffer=shm.buf), shm=shm)
+
+
+def evaluate_shard(shard, start, stop, num_mofs, bins, comp_bins, num_best_worst, shard_dir):
+    """
+    ----- Finds the best and worst arrays of one shard -----
+    Keyword arguments:
+        shard -- number of the shard
+        start, stop -- positions of the first and one past the last array of the shard
+        num_mofs -- lower and upper limit of the number of MOFs in an array
+        bins -- bin edges from create_bins
+        comp_bins -- bin of each composition and gas from composition_bins
+        num_best_worst -- number of the best and worst arrays of each size to keep
+        shard_dir -- directory of the shard files
+    Runs in a worker process (see run_shards). Writes the best and worst arrays of the shard by
+    every KLD, each once, with their position, to the shard file; it is written to a temporary
+    file first, so a shard file that exists is complete. Returns the number of arrays left out
+    for a PMF of zero at every composition (see enumerate_array_pmfs).
+    """
+    element_pmfs = worker_element_pmfs
+    gases = element_pmfs['gases']
+    skipped = []
+    array_kld_results = evaluate_all_arrays(element_pmfs, num_mofs, bins, comp_bins, start, stop, skipped)
+    chosen_arrays = {}
+    for arrays in choose_arrays_streaming(gases, num_mofs, array_kld_results, num_best_worst):
+        for array in arrays:
+            chosen_arrays[array['MOF_Array']] = array
+
+    filename = shard_filename(shard_dir, shard)
+    with open(filename + '.tmp', 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter="\t")
+        for mof_array, array in chosen_arrays.items():
+            writer.writerow([array_position(element_pmfs, num_mofs, mof_array), array])
+    os.replace(filename + '.tmp', filename)
+    return sum(skipped)
+
+
+def run_shards(element_pmfs, num_mofs, bins, comp_bins, num_best_worst, shard_dir, num_shards,
+               processes=None, task_id=0, num_tasks=1):
+    """
+    ----- Evaluates the shards of all possible arrays in parallel -----
+    Keyword arguments:
+        element_pmfs -- element PMFs from create_element_pmfs
+        num_mofs -- lower and upper limit of the number of MOFs in an array
+        bins -- bin edges from create_bins
+        comp_bins -- bin of each composition and gas from composition_bins
+        num_best_worst -- number of the best and worst arrays of each size to keep
+        shard_dir -- directory of the shard files
+        num_shards -- number of shards to split the arrays into
+        processes -- number of worker processes (default: all cores)
+        task_id, num_tasks -- evaluate only every num_tasks-th shard, from shard task_id, e.g.
+            one task of a SLURM job array
+    Shards of this task with a shard file already are skipped. Returns the number of shards
+    evaluated.
+    """
+    num_arrays = count_arrays(len(element_pmfs['mofs']), num_mofs)
+    # the checksum changes with anything the PMFs or bins depend on (stdev, mrange, num_bins, ...)
+    checksum = hashlib.sha1(element_pmfs['pmf'].tobytes() + np.ascontiguousarray(comp_bins).tobytes()).hexdigest()
+    write_shard_settings(shard_dir, {'mofs': list(element_pmfs['mofs']), 'gases': list(element_pmfs['gases']),
+                                     'num_mofs': [min(num_mofs), max(num_mofs)], 'num_arrays': num_arrays,
+                                     'num_shards': num_shards, 'num_best_worst': num_best_worst,
+                                     'checksum': checksum})
+    shards = [(shard, start, stop) for shard, (start, stop) in enumerate(shard_ranges(num_arrays, num_shards))
+              if shard % num_tasks == task_id and not os.path.exists(shard_filename(shard_dir, shard))]
+    print("Evaluating %s shards of %s arrays (%s shards in total)" % (len(shards), num_arrays, num_shards))
+    if not shards:
+        return 0
+
+    shm = share_element_pmfs(element_pmfs)
+    pmf = element_pmfs['pmf']
+    worker_settings = {key: element_pmfs[key] for key in ['mofs', 'mof_index', 'gases', 'comps']}
+    try:
+        with Pool(processes, initializer=attach_element_pmfs,
+                  initargs=(shm.name, pmf.shape, pmf.dtype, worker_settings)) as pool:
+            results = pool.starmap_async(evaluate_shard, [(shard, start, stop, num_mofs, bins, comp_bins,
+                                                           num_best_worst, shard_dir) for shard, start, stop in shards],
+                                         chunksize=1)
+            skipped = sum(results.get())
+    finally:
+        shm.close()
+        shm.unlink()
+    if skipped:
+        print("Left out %s arrays whose PMF is zero at every composition" % skipped)
+    return len(shards)
+
+
+def merge_shards(gases, num_mofs, num_best_worst, shard_dir, num_shards):
+    """
+    ----- Ranks the arrays of all shards -----
+    Returns the same lists as choose_arrays would for all arrays. Every array among the best (or
+    worst) of all arrays is among the best (or worst) of its shard, so ranking the arrays of the
+    shard files, in order of their position, gives the same arrays and ties.
+    """
+    missing_shards = [shard for shard in range(num_shards) if not os.path.exists(shard_filename(shard_dir, shard))]
+    if missing_shards:
+        raise ValueError("%s of %s shards are missing from %s, e.g. shard %s"
+                         % (len(missing_shards), num_shards, shard_dir, missing_shards[0]))
+    chosen_arrays = []
+    for shard in range(num_shards):
+        chosen_arrays.extend(read_GA_results_messy(shard_filename(shard_dir, shard)))
+    chosen_arrays.sort(key=lambda row: row[0])
+    return choose_arrays_streaming(gases, num_mofs, [array for _, array in chosen_arrays], num_best_worst)
@@ -9,6 +9,8 @@ import pandas as pd
 from datetime import datetime
 from brute_force_analysis import (
     read_data_as_dict,
+    read_results_store,
+    results_store_as_dict,
     write_data_as_tabcsv,
     yaml_loader,
     import_experimental_data,
@@ -23,11 +25,13 @@ from brute_force_analysis import (
     calculate_all_arrays,
     calculate_single_array_kld,
     create_bins,
+    create_bins_from_comps,
     create_comp_set_dict,
     bin_compositions,
     bin_compositions_single_array,
     calculate_kld,
     choose_arrays,
+    choose_arrays_streaming,
     assign_array_ids,
     save_element_pmf_data,
     save_unbinned_array_pmf_data,
@@ -36,6 +40,18 @@ from brute_force_analysis import (
     save_binned_array_pmf_data,
     plot_binned_array_pmf_data)
 from genetic_algorithm_analysis import read_GA_results_messy
+from pmf_matrix import (
+    create_element_pmfs,
+    mof_indices,
+    calculate_array_pmfs,
+    enumerate_array_pmfs,
+    evaluate_all_arrays,
+    composition_bins,
+    bin_membership,
+    bin_array_pmfs,
+    calculate_array_klds,
+    array_pmfs_as_dict,
+    binned_pmfs_as_dict)
 
 # --------------------------------------------------
 # ----- Import RASPA Data and yaml File ------------
@@ -45,8 +61,8 @@ filepath = 'config_files/process_config.sample.yaml'
 data = yaml_loader(filepath)
 
 # Redefine key variables in yaml file
-sim_data = data['sim_data']
-exp_data = data['exp_data']
+sim_data = data.get('sim_data')
+exp_data = data.get('exp_data')
 num_mofs = data['number_mofs']
 num_mixtures = data['num_mixtures']
 num_bins = data['num_bins']
@@ -60,9 +76,14 @@ for mof in mof_list:
     mof_densities.copy()
     mof_densities.update({ mof : data['mofs'][mof]['density']})
 
-# Import results as dictionary
-sim_results_import = read_data_as_dict(sim_data)
-exp_results_import = read_data_as_dict(exp_data)
+# Import results as dictionary, from a results store written by consolidate_results.py if one is given
+if 'results_store' in data:
+    results_store = read_results_store(data['results_store'], mmap=True)
+    sim_results_import = results_store_as_dict(results_store, pressure=data.get('pressure'), campaign=data.get('campaign'))
+    exp_results_import = results_store_as_dict(results_store, composition_id=data['exp_composition_id'], pressure=data.get('pressure'), campaign=data.get('campaign'))
+else:
+    sim_results_import = read_data_as_dict(sim_data)
+    exp_results_import = read_data_as_dict(exp_data)
 
 # --------------------------------------------------
 # ----- Calculate arrays, PMFs, KLDs, etc. ---------
@@ -79,18 +100,27 @@ sim_results_full = \
     reintroduce_random_error(sim_results_full, error=1, seed=0)
 exp_results_full = \
     convert_experimental_data(exp_results_full, sim_results_full, mof_list, gases)
-element_pmf_results = \
-    calculate_element_pmf(exp_results_full, sim_results_full, mof_list, stdev, mrange)
-list_of_arrays, all_array_pmf_results = \
-    calculate_all_arrays(mof_list, num_mofs, element_pmf_results, gases)
+element_pmfs = \
+    create_element_pmfs(exp_results_full, sim_results_full, mof_list, gases, stdev, mrange)
 bins = \
-    create_bins(gases, num_bins, mof_list, element_pmf_results)
-binned_probabilities_sum, binned_probabilities_max = \
-    bin_compositions(gases, bins, list_of_arrays, all_array_pmf_results)
-array_kld_results = \
-    calculate_kld(gases, list_of_arrays, bins, all_array_pmf_results, binned_probabilities_sum)
+    create_bins_from_comps(gases, num_bins, element_pmfs['comps'])
+comp_bins = \
+    composition_bins(element_pmfs, bins)
+skipped = []
 best_and_worst_arrays_by_absKLD, best_and_worst_arrays_by_jointKLD, best_and_worst_arrays_by_gasKLD = \
-    choose_arrays(gases, num_mofs, array_kld_results, num_best_worst)
+    choose_arrays_streaming(gases, num_mofs, evaluate_all_arrays(element_pmfs, num_mofs, bins, comp_bins, skipped=skipped), num_best_worst)
+if skipped:
+    print("Left out %s arrays whose PMF is zero at every composition" % sum(skipped))
+
+# Only the PMFs of the chosen arrays are kept for saving and plotting
+list_of_arrays = []
+for array in best_and_worst_arrays_by_absKLD + best_and_worst_arrays_by_jointKLD + best_and_worst_arrays_by_gasKLD:
+    if array['MOF_Array'] not in list_of_arrays:
+        list_of_arrays.append(array['MOF_Array'])
+array_pmfs = \
+    calculate_array_pmfs(element_pmfs, [mof_indices(element_pmfs, array) for array in list_of_arrays])
+binned_probabilities_sum, _ = \
+    bin_array_pmfs(array_pmfs, comp_bins, len(bins)-1, maximum=False)
 
 # --------------------------------------------------
 # ----- Calculate arrays, PMFs, KLDs, etc. ---------
@@ -108,34 +138,36 @@ sim_results_full = \
     reintroduce_random_error(sim_results_full, error=1, seed=0)
 exp_results_full = \
     convert_experimental_data(exp_results_full, sim_results_full, mof_list, gases)
-element_pmf_results = \
-    calculate_element_pmf(exp_results_full, sim_results_full, mof_list, stdev, mrange)
-list_of_arrays = \
-    calculate_all_arrays_list(mof_list, num_mofs)
+element_pmfs = \
+    create_element_pmfs(exp_results_full, sim_results_full, mof_list, gases, stdev, mrange)
 bins = \
-     create_bins(gases, num_bins, mof_list, element_pmf_results)
-comp_set_dict = \
-    create_comp_set_dict(element_pmf_results, mof_list)
+     create_bins_from_comps(gases, num_bins, element_pmfs['comps'])
 
 import numpy as np
 for row in bins:
     for gas in gases:
         row[gas] = np.round(row[gas],4)
+comp_bins = \
+    composition_bins(element_pmfs, bins)
+membership = \
+    bin_membership(comp_bins, len(bins)-1)
 
 filename = '/Users/brian_day/Desktop/ram_saver_bruteforce_test.csv'
 
 csvfile = open(filename,'w+', newline='')
 writer = csv.writer(csvfile, delimiter="\t")
-for array in list_of_arrays:
-    single_array_pmf_results = \
-        calculate_array_pmf(array, element_pmf_results)
-    binned_probabilities_sum, array_dict = \
-        bin_compositions_single_array(gases, bins, array, single_array_pmf_results, comp_set_dict)
-    array_kld_results = \
-        calculate_single_array_kld(gases, array, bins, single_array_pmf_results, binned_probabilities_sum)
-    writer.writerow([array_kld_results])
+skipped = []
+for arrays, block_pmfs in enumerate_array_pmfs(element_pmfs, num_mofs, skipped=skipped):
+    block_arrays = [tuple([mof_list[i] for i in array]) for array in arrays]
+    # per block, so binned_probabilities_sum still holds the chosen arrays of list_of_arrays
+    block_binned_sum, _ = \
+        bin_array_pmfs(block_pmfs, comp_bins, len(bins)-1, membership, maximum=False)
+    for array_kld_results in calculate_array_klds(gases, block_arrays, bins, block_pmfs, block_binned_sum):
+        writer.writerow([array_kld_results])
 
 csvfile.close()
+if skipped:
+    print("Left out %s arrays whose PMF is zero at every composition" % sum(skipped))
 
 all_array_data = read_GA_results_messy(filename)
 all_array_data = [row[0] for row in all_array_data]
@@ -160,10 +192,12 @@ csvfile.close()
 list_of_array_ids = assign_array_ids(list_of_arrays)
 timestamp = (datetime.now().strftime("%Y_%m_%d__%H_%M_%S"))
 save_element_pmf_data(element_pmf_results_df, stdev, mrange, timestamp)
+all_array_pmf_results = array_pmfs_as_dict(element_pmfs, list_of_arrays, array_pmfs)
+binned_probabilities = binned_pmfs_as_dict(gases, bins, list_of_arrays, binned_probabilities_sum)
 save_unbinned_array_pmf_data(gases, list_of_arrays, list_of_array_ids, all_array_pmf_results, timestamp)
 plot_unbinned_array_pmf_data(gases, list_of_arrays, list_of_array_ids, all_array_pmf_results, timestamp)
-save_binned_array_pmf_data(gases, list_of_arrays, list_of_array_ids, bins, binned_probabilities_sum, timestamp)
-plot_binned_array_pmf_data(gases, list_of_arrays, list_of_array_ids, bins, binned_probabilities_sum, timestamp)
+save_binned_array_pmf_data(gases, list_of_arrays, list_of_array_ids, bins, binned_probabilities, timestamp)
+plot_binned_array_pmf_data(gases, list_of_arrays, list_of_array_ids, bins, binned_probabilities, timestamp)
 write_data_as_tabcsv('saved_array_kld/best_and_worst_arrays_by_absKLD_%s.csv' % timestamp, best_and_worst_arrays_by_absKLD)
 write_data_as_tabcsv('saved_array_kld/best_and_worst_arrays_by_jointKLD_%s.csv' % timestamp, best_and_worst_arrays_by_jointKLD)
 write_data_as_tabcsv('saved_array_kld/best_and_worst_arrays_by_gasKLD_%s.csv' % timestamp, best_and_worst_arrays_by_gasKLD)
@@ -9,6 +9,8 @@ import pandas as pd
 from datetime import datetime
 from brute_force_analysis import (
     read_data_as_dict,
+    read_results_store,
+    results_store_as_dict,
     write_data_as_tabcsv,
     yaml_loader,
     import_experimental_data,
@@ -19,6 +21,7 @@ from brute_force_analysis import (
     calculate_all_arrays,
     calculate_single_array_kld,
     create_bins,
+    create_bins_from_comps,
     create_comp_set_dict,
     bin_compositions,
     bin_compositions_single_array,
@@ -32,6 +35,13 @@ from brute_force_analysis import (
     save_binned_array_pmf_data,
     plot_binned_array_pmf_data)
 from genetic_algorithm_analysis import read_GA_results_messy
+from pmf_matrix import (
+    create_element_pmfs,
+    mof_indices,
+    calculate_array_pmfs,
+    composition_bins,
+    bin_array_pmfs,
+    calculate_array_klds)
 
 # --------------------------------------------------
 # ----- Import RASPA Data and yaml File ------------
@@ -41,7 +51,7 @@ filepath = 'config_files/process_config.sample_allkld.yaml'
 data = yaml_loader(filepath)
 
 # Redefine key variables in yaml file
-sim_data = data['sim_data']
+sim_data = data.get('sim_data')
 num_mofs = data['number_mofs']
 num_bins = data['num_bins']
 stdev = data['stdev']
@@ -53,8 +63,12 @@ for mof in mof_list:
     mof_densities.copy()
     mof_densities.update({ mof : data['mofs'][mof]['density']})
 
-# Import results as dictionary
-sim_results_import = read_data_as_dict(sim_data)
+# Import results as dictionary, from a results store written by consolidate_results.py if one is given
+if 'results_store' in data:
+    results_store = read_results_store(data['results_store'], mmap=True)
+    sim_results_import = results_store_as_dict(results_store, pressure=data.get('pressure'), campaign=data.get('campaign'))
+else:
+    sim_results_import = read_data_as_dict(sim_data)
 sim_results_full = \
     import_simulated_data(sim_results_import, mof_list, mof_densities, gases)
 
@@ -69,33 +83,36 @@ list_of_experiments = np.linspace(0,960,9611)
 
 all_kld_results = []
 for exp in list_of_experiments:
-    # Define Filepath
-    exp_data = data['exp_data_path']+'exp_data_'+str(int(exp))+'.csv'
-    exp_results_import = read_data_as_dict(exp_data)
+    # Define Filepath (or select the composition from the results store)
+    if 'results_store' in data:
+        exp_results_import = results_store_as_dict(results_store, composition_id=int(exp), pressure=data.get('pressure'), campaign=data.get('campaign'))
+    else:
+        exp_data = data['exp_data_path']+'exp_data_'+str(int(exp))+'.csv'
+        exp_results_import = read_data_as_dict(exp_data)
 
     # Import Corresponding Results
     exp_results_full, exp_results_mass, exp_mof_list = \
         import_experimental_data(exp_results_import, mof_list, mof_densities, gases)
-    element_pmf_results = \
-        calculate_element_pmf(exp_results_full, sim_results_full, mof_list, stdev, mrange)
+    element_pmfs = \
+        create_element_pmfs(exp_results_full, sim_results_full, mof_list, gases, stdev, mrange)
     bins = \
-         create_bins(gases, num_bins, mof_list, element_pmf_results)
-    comp_set_dict = \
-        create_comp_set_dict(element_pmf_results, mof_list)
+         create_bins_from_comps(gases, num_bins, element_pmfs['comps'])
 
     # Round Bins (Fix Later)
     import numpy as np
     for row in bins:
         for gas in gases:
             row[gas] = np.round(row[gas],4)
+    comp_bins = \
+        composition_bins(element_pmfs, bins)
 
     # Calculate KLD
-    single_array_pmf_results = \
-        calculate_array_pmf(array, element_pmf_results)
-    binned_probabilities_sum, array_dict = \
-        bin_compositions_single_array(gases, bins, array, single_array_pmf_results, comp_set_dict)
+    single_array_pmfs = \
+        calculate_array_pmfs(element_pmfs, [mof_indices(element_pmfs, array)])
+    binned_probabilities_sum, _ = \
+        bin_array_pmfs(single_array_pmfs, comp_bins, len(bins)-1, maximum=False)
     array_kld_results = \
-        calculate_single_array_kld(gases, array, bins, single_array_pmf_results, binned_probabilities_sum)
+        calculate_array_klds(gases, [array], bins, single_array_pmfs, binned_probabilities_sum)[0]
     array_kld_results['run_id'] = int(exp)
     all_kld_results.append(array_kld_results)
     
@@ -14,8 +14,8 @@ filepath = 'config_files/process_config.sample.yaml'
 data = yaml_loader(filepath)
 
 # Redefine key varaibles in yaml file
-sim_data = data['sim_data']
-exp_data = data['exp_data']
+sim_data = data.get('sim_data')
+exp_data = data.get('exp_data')
 num_mofs = data['number_mofs']
 num_mixtures = data['num_mixtures']
 num_bins = data['num_bins']
@@ -29,9 +29,14 @@ for mof in mof_list:
     mof_densities.copy()
     mof_densities.update({ mof : data['mofs'][mof]['density']})
 
-# Import results as dictionary
-sim_results_import = read_data_as_dict(sim_data)
-exp_results_import = read_data_as_dict(exp_data)
+# Import results as dictionary, from a results store written by consolidate_results.py if one is given
+if 'results_store' in data:
+    results_store = read_results_store(data['results_store'], mmap=True)
+    sim_results_import = results_store_as_dict(results_store, pressure=data.get('pressure'), campaign=data.get('campaign'))
+    exp_results_import = results_store_as_dict(results_store, composition_id=data['exp_composition_id'], pressure=data.get('pressure'), campaign=data.get('campaign'))
+else:
+    sim_results_import = read_data_as_dict(sim_data)
+    exp_results_import = read_data_as_dict(exp_data)
 
 # --------------------------------------------------
 # ----- Calculate all single MOF PMFs --------------
@@ -48,8 +53,8 @@ sim_results_full = \
     reintroduce_random_error(sim_results_full, error=1, seed=0)
 exp_results_full = \
     convert_experimental_data(exp_results_full, sim_results_full, mof_list, gases)
-element_pmf_results = \
-    calculate_element_pmf(exp_results_full, sim_results_full, mof_list, stdev, mrange)
+element_pmfs = \
+    create_element_pmfs(exp_results_full, sim_results_full, mof_list, gases, stdev, mrange)
 
 # --------------------------------------------------
 # ----- Run the Genetic Algorithm ------------------
@@ -76,7 +81,7 @@ for array_size in array_size_vect:
                 gen_start_num = 1
                 GA_array_list, GA_results = run_genetic_algorithm(first_gen, gen_start_num, \
                     array_size, mof_list, num_best, num_lucky, population_size, num_generations[0], mutation_rates[0], \
-                    element_pmf_results, gases, num_bins, seek=seek, seek_by=seek_by)
+                    element_pmfs, gases, num_bins, seek=seek, seek_by=seek_by)
             else:
                 GA_array_list_temp = []
                 GA_results_temp = []
@@ -84,7 +89,7 @@ for array_size in array_size_vect:
                 gen_start_num = np.sum(num_generations[0:j])+1
                 GA_array_list_temp, GA_results_temp = run_genetic_algorithm(first_gen, gen_start_num, \
                     array_size, mof_list, num_best, num_lucky, population_size, num_generations[j], mutation_rates[j], \
-                    element_pmf_results, gases, num_bins, seek=seek, seek_by=seek_by)
+                    element_pmfs, gases, num_bins, seek=seek, seek_by=seek_by)
                 GA_array_list.extend(GA_array_list_temp)
                 GA_results.extend(GA_results_temp)
 
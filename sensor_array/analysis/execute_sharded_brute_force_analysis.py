@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------
+# ----- Import Python Packages ---------------------
+# --------------------------------------------------
+import argparse
+import os
+from datetime import datetime
+from brute_force_analysis import (
+    read_data_as_dict,
+    read_results_store,
+    results_store_as_dict,
+    write_data_as_tabcsv,
+    yaml_loader,
+    import_experimental_data,
+    import_simulated_data,
+    create_comp_list,
+    moving_average_smooth,
+    reintroduce_random_error,
+    convert_experimental_data,
+    create_bins_from_comps)
+from brute_force_shards import run_shards, merge_shards
+from pmf_matrix import create_element_pmfs, composition_bins
+
+# --------------------------------------------------
+# ----- System Arguments ---------------------------
+# --------------------------------------------------
+parser = argparse.ArgumentParser(description="Brute force analysis of all possible arrays, split into shards that are "
+                                             "evaluated in parallel and can be resumed.")
+parser.add_argument('config', nargs='?', default='config_files/process_config.sample.yaml', help="analysis configuration file")
+parser.add_argument('--shard-dir', default='saved_array_kld/shards', help="directory of the shard files (default: %(default)s)")
+parser.add_argument('--shards', type=int, default=1000, help="number of shards to split the arrays into (default: %(default)s)")
+parser.add_argument('--processes', type=int, default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count())),
+                    help="number of worker processes (default: SLURM_CPUS_PER_TASK, or all cores)")
+parser.add_argument('--task-id', type=int,
+                    default=int(os.environ.get('SLURM_ARRAY_TASK_ID', 0)) - int(os.environ.get('SLURM_ARRAY_TASK_MIN', 0)),
+                    help="task of a job array, from 0 (default: from SLURM_ARRAY_TASK_ID)")
+parser.add_argument('--num-tasks', type=int, default=int(os.environ.get('SLURM_ARRAY_TASK_COUNT', 1)),
+                    help="number of tasks of the job array (default: SLURM_ARRAY_TASK_COUNT, or 1)")
+parser.add_argument('--merge', action='store_true',
+                    help="only merge the shard files and save the best and worst arrays (default when there is one task)")
+args = parser.parse_args()
+
+# --------------------------------------------------
+# ----- Import RASPA Data and yaml File ------------
+# --------------------------------------------------
+# Import yaml file as dictoncary
+data = yaml_loader(args.config)
+
+# Redefine key variables in yaml file
+sim_data = data.get('sim_data')
+exp_data = data.get('exp_data')
+num_mofs = data['number_mofs']
+num_bins = data['num_bins']
+num_best_worst = data['num_best_worst']
+stdev = data['stdev']
+mrange = data['mrange']
+gases = data['gases']
+mof_list = data['mof_list']
+mof_densities = {}
+for mof in mof_list:
+    mof_densities.update({ mof : data['mofs'][mof]['density']})
+
+# Import results as dictionary, from a results store written by consolidate_results.py if one is given
+if 'results_store' in data:
+    results_store = read_results_store(data['results_store'], mmap=True)
+    sim_results_import = results_store_as_dict(results_store, pressure=data.get('pressure'), campaign=data.get('campaign'))
+    exp_results_import = results_store_as_dict(results_store, composition_id=data['exp_composition_id'], pressure=data.get('pressure'), campaign=data.get('campaign'))
+else:
+    sim_results_import = read_data_as_dict(sim_data)
+    exp_results_import = read_data_as_dict(exp_data)
+
+# --------------------------------------------------
+# ----- Calculate the KLDs of all arrays, by shard -
+# --------------------------------------------------
+if not args.merge:
+    exp_results_full, exp_results_mass, exp_mof_list = \
+        import_experimental_data(exp_results_import, mof_list, mof_densities, gases)
+    sim_results_full = \
+        import_simulated_data(sim_results_import, mof_list, mof_densities, gases)
+    comp_list, mole_fractions = \
+        create_comp_list(sim_results_full, mof_list, gases)
+    sim_results_full = \
+        moving_average_smooth(sim_results_full, mof_list, gases, comp_list, mole_fractions, num_points = 2)
+    sim_results_full = \
+        reintroduce_random_error(sim_results_full, error=1, seed=0)
+    exp_results_full = \
+        convert_experimental_data(exp_results_full, sim_results_full, mof_list, gases)
+    element_pmfs = \
+        create_element_pmfs(exp_results_full, sim_results_full, mof_list, gases, stdev, mrange)
+    bins = \
+        create_bins_from_comps(gases, num_bins, element_pmfs['comps'])
+    comp_bins = \
+        composition_bins(element_pmfs, bins)
+    run_shards(element_pmfs, num_mofs, bins, comp_bins, num_best_worst, args.shard_dir, args.shards,
+               processes=args.processes, task_id=args.task_id, num_tasks=args.num_tasks)
+
+# --------------------------------------------------
+# ----- Merge the shards and save ------------------
+# --------------------------------------------------
+if args.merge or args.num_tasks == 1:
+    best_and_worst_arrays_by_absKLD, best_and_worst_arrays_by_jointKLD, best_and_worst_arrays_by_gasKLD = \
+        merge_shards(gases, num_mofs, num_best_worst, args.shard_dir, args.shards)
+    timestamp = (datetime.now().strftime("%Y_%m_%d__%H_%M_%S"))
+    write_data_as_tabcsv('saved_array_kld/best_and_worst_arrays_by_absKLD_%s.csv' % timestamp, best_and_worst_arrays_by_absKLD)
+    write_data_as_tabcsv('saved_array_kld/best_and_worst_arrays_by_jointKLD_%s.csv' % timestamp, best_and_worst_arrays_by_jointKLD)
+    write_data_as_tabcsv('saved_array_kld/best_and_worst_arrays_by_gasKLD_%s.csv' % timestamp, best_and_worst_arrays_by_gasKLD)
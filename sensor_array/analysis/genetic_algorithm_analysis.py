@@ -22,7 +22,6 @@ import copy
 import csv
 import functools
 import numpy as np
-import operator
 import os
 import pandas as pd
 import random
@@ -33,23 +32,37 @@ import time
 import yaml
 
 from datetime import datetime
-from functools import reduce
 from itertools import combinations
-from math import isnan, log
+from math import isnan
 from matplotlib import pyplot as plt
 from scipy.spatial import Delaunay
 from scipy.interpolate import spline
 
+from pmf_matrix import (read_data_as_dict,
+                        read_results_store,
+                        results_store_as_dict,
+                        moving_average_smooth_matrix,
+                        simulated_mass_matrix,
+                        experimental_masses,
+                        calculate_element_pmf_matrix,
+                        create_element_pmfs,
+                        mof_indices,
+                        array_pmf_products,
+                        normalize_block_pmfs,
+                        composition_bins,
+                        digitize_compositions,
+                        bin_membership,
+                        bin_array_pmfs,
+                        calculate_array_klds,
+                        array_pmfs_from_dict,
+                        binned_pmfs_as_dict,
+                        binned_pmfs_from_dict)
+
 # --------------------------------------------------
 # ----- Functions from process_mass_data.py --------
 # Try not to change these here! This will make recombining with other files
 # easier later.
 # --------------------------------------------------
-def read_data_as_dict(filename):
-    with open(filename,newline='') as csvfile:
-        output_data = csv.DictReader(csvfile, delimiter="\t")
-        return list(output_data)
-
 def write_data_as_tabcsv(filename, data):
     with open(filename,'w', newline='') as csvfile:
         writer = csv.writer(csvfile, delimiter="\t")
@@ -149,7 +162,7 @@ def plot_GA_results(filename, data, num_generations, array_size, seek='best', se
 
 def yaml_loader(filepath):
     with open(filepath, 'r') as yaml_file:
-        data = yaml.load(yaml_file)
+        data = yaml.safe_load(yaml_file)
     return(data)
 
 def import_experimental_data(exp_results_import, mof_list, mof_densities, gases):
@@ -220,68 +233,10 @@ def moving_average_smooth(sim_results_import, mof_list, gases, comp_list, mole_f
     Smooth a set of simulated data by averageing the data points around a given value. Central points
     sample from points in all directions. Boundary points sample from points along the boundary.
     Corner points remain unchanged.
-    With current data strucutre, this function will be highly inefficient. May not be slow enough to
-    warrant changing, but worth noting.
+    The data of all MOFs is averaged at once on the lattice of mole fractions, see
+    moving_average_smooth_matrix in pmf_matrix.py.
     """
-
-    # Create a temporary data set for the mof of interest. Consider doing this in a separate function.
-    data_smoothed = []
-    for mof in mof_list:
-
-        temp_data = []
-        for row in sim_results_import:
-            if row['MOF'] == mof:
-                temp_data.extend([row])
-
-        for comp_main in comp_list:
-            temp_dict = {}
-            for row in temp_data:
-                if [float(row[gas]) for gas in gases] == [comp_main[gas] for gas in gases]:
-                    temp_dict = dict(row)
-            for gas in gases:
-                temp_dict[gas] = comp_main[gas]
-
-            # Create list of possible compoenent mole fractions to use in determining neighbors.
-            allowed_comps = {}
-            for gas in gases:
-                index = mole_fractions[gas].index(comp_main[gas])
-                for i in range(0, num_points+1):
-                    if index-i >= 0 and index+i <= len(mole_fractions[gas])-1:
-                        allowed_comps[gas] = [mole_fractions[gas][i] for i in range(index-i, index+i+1)]
-
-            # Extract a list of neighbors (include main point) based on the allowed composititons.
-            # Since this includes the main point, len(temp_data_subset) will always >= 1.
-            temp_data_subset = []
-            for row in temp_data:
-                boolean_array = []
-                for gas in gases:
-                    if allowed_comps.get(gas) != None:
-                        if float(row[gas]) in allowed_comps[gas]:
-                            boolean_array.extend([1])
-                        else:
-                            boolean_array.extend([0])
-                    else:
-                        boolean_array.extend([0])
-                boolean_array = [i for i in boolean_array if i == 0]
-                if len(boolean_array) == 0:
-                    temp_data_subset.extend([row])
-
-            # Calculate the average mass of all points in the subset.
-            if len(temp_data_subset) != 0:
-                mass_total = 0.0
-                for row in temp_data_subset:
-                    mass_total += float(row['Mass_mg/cm3'])
-                mass_average = mass_total / len(temp_data_subset)
-                temp_dict['Mass_mg/cm3'] = mass_average
-                temp_dict['Num_points'] = len(temp_data_subset)
-            else:
-                mass_average = 0.0
-                temp_dict['Mass_mg/cm3'] = temp_dict['Mass_mg/cm3']
-                temp_dict['Num_points'] = len(temp_data_subset)
-
-            data_smoothed.extend([temp_dict])
-
-    return data_smoothed
+    return moving_average_smooth_matrix(sim_results_import, mof_list, gases, comp_list, mole_fractions, num_points)
 
 
 def reintroduce_random_error(sim_results_import, error=1, seed=0):
@@ -334,62 +289,23 @@ def calculate_element_pmf(exp_results_full, sim_results_full, mof_list, stdev, m
     the real mass falls in a small range around the measured mass. Examine the
     difference between these two approaches in more detail, along with the effects
     of the employed error function parameters.
+    Both are evaluated for all MOFs and compositions at once by calculate_element_pmf_matrix.
     """
+    # Evaluate the pmfs of all MOFs at once, as (MOFs x compositions) matrices. With more than
+    # one experimental result for a MOF, the last one is used.
+    sim_masses = simulated_mass_matrix(sim_results_full, mof_list)
+    exp_masses = experimental_masses(exp_results_full, mof_list)
+    pmf_range, pmf_exact = calculate_element_pmf_matrix(sim_masses, exp_masses, stdev, mrange, type=type)
+
+    # Copy each simulated result with the pmfs of its MOF and composition
+    all_results_sim = {mof: [] for mof in mof_list}
+    for row in sim_results_full:
+        if row['MOF'] in all_results_sim:
+            all_results_sim[row['MOF']].append(row)
     element_pmf_results = []
-    for mof in mof_list:
-        # Isolate the simulated results for the mof
-        all_results_sim = [row for row in sim_results_full if row['MOF'] == mof]
-        all_masses_sim = [row['Mass_mg/cm3'] for row in all_results_sim]
-
-        # Isolate the experimental result(s) for the mof
-        all_results_exp = [row for row in exp_results_full if row['MOF'] == mof]
-        all_masses_exp = [row['Mass_mg/cm3'] for row in all_results_exp]
-
-        # Calculate all pmfs based on the experimental mass and truncated normal
-        # probability distribution.
-        mof_temp_dict = []
-        for mass_exp in all_masses_exp:
-            probs_range = []
-            probs_exact = []
-            if type == 'mass':
-                a, b = 0, 2*float(max(all_masses_sim))
-                mu, sigma = float(mass_exp), float(stdev)
-                alpha, beta = ((a-mu)/sigma), ((b-mu)/sigma)
-            if type == 'percent':
-                a, b = 0, float(max(all_masses_sim)) * (1 + mrange)
-                mu, sigma = float(mass_exp), float(stdev)*float(mass_exp)
-                alpha, beta = ((a-mu)/sigma), ((b-mu)/sigma)
-            for mass_sim in all_masses_sim:
-                upper_prob = ss.truncnorm.cdf(float(mass_sim) * (1 + mrange), alpha, beta, loc = mu, scale = sigma)
-                lower_prob = ss.truncnorm.cdf(float(mass_sim) * (1 - mrange), alpha, beta, loc = mu, scale = sigma)
-                probs_range.append(upper_prob - lower_prob)
-                prob_singlepoint = ss.truncnorm.pdf(float(mass_sim), alpha, beta, loc=mu, scale=sigma)
-                probs_exact.append(prob_singlepoint)
-            sum_probs_range = sum(probs_range)
-            norm_probs_range = [(i/sum_probs_range) for i in probs_range]
-            sum_probs_exact = sum(probs_exact)
-            norm_probs_exact = [(i/sum_probs_exact) for i in probs_exact]
-
-            # Update dictionary with pmf for each MOF
-            new_temp_dict = []
-            # Initialize the dictioary
-            if mof_temp_dict == []:
-                for index in range(len(norm_probs_range)):
-                    mof_temp_dict = all_results_sim[index].copy()
-                    mof_temp_dict['PMF_Range'] = norm_probs_range[index]
-                    mof_temp_dict['PMF_Exact'] = norm_probs_exact[index]
-                    new_temp_dict.extend([mof_temp_dict])
-                new_temp_dict_2 = new_temp_dict
-            # Add to the exisitng dictionary
-            else:
-                for index in range(len(norm_probs_range)):
-                    mof_temp_dict = new_temp_dict_2[index].copy()
-                    mof_temp_dict['PMF_Range'] = norm_probs_range[index]
-                    mof_temp_dict['PMF_Exact'] = norm_probs_exact[index]
-                    new_temp_dict.extend([mof_temp_dict])
-                new_temp_dict_2 = new_temp_dict
-
-        element_pmf_results.extend(new_temp_dict_2)
+    for i, mof in enumerate(mof_list):
+        for index, row in enumerate(all_results_sim[mof]):
+            element_pmf_results.append(dict(row, PMF_Range=pmf_range[i, index], PMF_Exact=pmf_exact[i, index]))
 
     return element_pmf_results
 
@@ -430,6 +346,13 @@ def create_bins(gases, num_bins, mof_list, element_pmf_results):
     #     comps_array.append([float(row[gas]) for gas in gases])
     comps_array = np.array([[float(row[gas]) for gas in gases] for row in comp_set_dict])
     # Figure out what is different between commented approach and current one!
+    return(create_bins_from_comps(gases, num_bins, comps_array))
+
+def create_bins_from_comps(gases, num_bins, comps_array):
+    """
+    ----- Creates bins for all gases from a (compositions x gases) array -----
+    Used by create_bins, and directly with the comps of element_pmfs (see pmf_matrix.py).
+    """
 
     # Determine the set of points used to create bins
     bin_points = []
@@ -471,44 +394,17 @@ def bin_compositions(gases, bins, list_of_arrays, all_array_pmf_results):
         all_array_pmf_results -- list of dictionaries, arrays, joint pmfs
     """
 
-    binned_probabilities_sum = []
-    for gas in gases:
-        # Assigns pmf to bin value (dictionary) by checking whether mole frac is
-        # between the current and next bin value.
-        # Current method likely inefficient, but it works. Can revisit later.
-        for row in all_array_pmf_results:
-             for i in range(1, len(bins)):
-                 lower_bin = bins[i-1][gas]
-                 upper_bin = bins[i][gas]
-                 gas_comp = float(row[gas])
-                 if gas_comp >= lower_bin and gas_comp < upper_bin:
-                     row.update({'%s bin' % gas : lower_bin})
-
-        # Loops through all of the bins and takes sum over all pmfs in that bin.
-        all_bins_temp_sum = []
-        array_names = [' '.join(array) for array in list_of_arrays]
-        for bin in bins[0:len(bins)-1]:
-            array_pmfs_temp = {array: [] for array in array_names}
-            for row in all_array_pmf_results:
-                if bin[gas] == row['%s bin' % gas]:
-                    for array in array_names:
-                        array_pmfs_temp[array].append(row[array])
-
-
-            # Updates pmfs for each array for current bin
-            # Many methods here of handling multiple data points.
-            # Currently, can sum all pmfs, or take the max value.
-            single_bin_temp = {'%s bin' % gas : bin[gas]}
-            with_sum = {'%s bin' % gas : bin[gas]} #copy.deepcopy(single_bin_temp)
-            for array in array_names:
-                if array_pmfs_temp[array] == []:
-                    with_sum.update({array : 0})
-                else:
-                    with_sum.update({array : sum(array_pmfs_temp[array])})
-            all_bins_temp_sum.append(with_sum)
-
-        # Creates list of binned probabilities, already normalized
-        binned_probabilities_sum.extend(all_bins_temp_sum)
+    # Assigns each row to its bin of each gas, and sums the pmfs of each array in each bin
+    comps = np.array([[float(row[gas]) for gas in gases] for row in all_array_pmf_results]).reshape(-1, len(gases))
+    comp_bins = digitize_compositions(comps, gases, bins)
+    for g, gas in enumerate(gases):
+        for row, i in zip(all_array_pmf_results, comp_bins[:, g]):
+            if i >= 0:
+                row.update({'%s bin' % gas : bins[i][gas]})
+
+    array_pmfs = array_pmfs_from_dict(list_of_arrays, all_array_pmf_results)
+    binned_sum, _ = bin_array_pmfs(array_pmfs, comp_bins, len(bins)-1, maximum=False)
+    binned_probabilities_sum = binned_pmfs_as_dict(gases, bins, list_of_arrays, binned_sum)
 
     return(binned_probabilities_sum)
 
@@ -522,29 +418,9 @@ def calculate_kld(gases, list_of_arrays, bins, all_array_pmf_results, binned_pro
         binned_probabilities -- list of dictionaries, mof array, gas, pmfs
     """
 
-    array_kld_results = []
-    for array in list_of_arrays:
-        dict_temp = {'MOF_Array' : array}
-        array_name = '%s' % ' '.join(array)
-
-        # Calculate Aboslute KLD
-        pmfs_per_array_abs = [row[array_name] for row in all_array_pmf_results]
-        reference_prob_abs = 1/len(pmfs_per_array_abs)
-        abs_kld = sum([float(pmf)*log(float(pmf)/reference_prob_abs,2) for pmf in pmfs_per_array_abs if pmf != 0])
-        dict_temp.update({'Absolute_KLD' : round(abs_kld,4)})
-
-        # Calculate Component KLD
-        for gas in gases:
-            reference_prob_comp = 1/len(bins)
-            pmfs_per_array_comp = [row[array_name] for row in binned_probabilities if '%s bin' % gas in row.keys()]
-            kld_comp = sum([float(pmf)*log(float(pmf)/reference_prob_comp,2) for pmf in pmfs_per_array_comp if pmf != 0])
-            dict_temp.update({'%s KLD' % gas : round(kld_comp,4)})
-
-        # Calculate Joint KLD
-        product_temp = reduce(operator.mul, [dict_temp['%s KLD' % gas] for gas in gases], 1)
-        dict_temp.update({'Joint_KLD' : product_temp})
-        dict_temp.update({'Array_Size' : len(dict_temp['MOF_Array'])})
-        array_kld_results.append(dict_temp)
+    array_pmfs = array_pmfs_from_dict(list_of_arrays, all_array_pmf_results)
+    binned_pmfs = binned_pmfs_from_dict(gases, list_of_arrays, binned_probabilities)
+    array_kld_results = calculate_array_klds(gases, list_of_arrays, bins, array_pmfs, binned_pmfs)
 
     return(array_kld_results)
 
@@ -686,23 +562,33 @@ def create_children_by_mutation(parents, num_children, mutation_rate, mofs_list)
 # ----- Genetic Algorithm Function / Call ----------
 # --------------------------------------------------
 def run_genetic_algorithm(first_gen, generation_start_num, array_size, mofs_list, num_best, num_lucky, population_size, \
-    num_generations, mutation_rate, element_pmf_results, gases, num_bins, seek='best', seek_by='Absolute_KLD'):
+    num_generations, mutation_rate, element_pmfs, gases, num_bins, seek='best', seek_by='Absolute_KLD'):
+    """
+    Runs num_generations generations starting from first_gen. The element PMFs are passed as
+    element_pmfs (see create_element_pmfs in pmf_matrix.py), so the arrays of a generation are
+    evaluated as rows of a matrix rather than as keys of a dictionary per composition.
+    """
 
-    # Save list of dictionaries for first MOF for use as a list of all gas mole fractions
-    comp_set_dict = [row for row in element_pmf_results if row['MOF'] == mofs_list[0]]
+    # Bin the compositions once for all generations
+    bins = create_bins_from_comps(gases, num_bins, element_pmfs['comps'])
+    comp_bins = composition_bins(element_pmfs, bins)
+    membership = bin_membership(comp_bins, len(bins)-1)
 
     # Analyze first generation, generate and analyze subsequent generations
     all_arrays_list_by_generation = []
     all_array_results_by_generation = []
+    skipped = []
 
     # generation = create_first_generation(population_size,array_size,mofs_list)
     generation = remove_duplicate_arrays(first_gen, mofs_list)
 
     for i in range(num_generations):
         all_arrays_list_by_generation.append(generation)
-        genx_pmf_results = calculate_all_array_pmf(generation, gases, element_pmf_results, comp_set_dict)
-        genx_kld_results = calculate_all_array_kld(num_bins, mofs_list, generation, gases, \
-            element_pmf_results, genx_pmf_results)
+        # arrays whose PMF is zero at every composition have no KLD, and are left out of the population
+        genx_arrays, genx_array_pmfs = normalize_block_pmfs(
+            generation, array_pmf_products(element_pmfs, [mof_indices(element_pmfs, array) for array in generation]), skipped)
+        genx_binned_sum, _ = bin_array_pmfs(genx_array_pmfs, comp_bins, len(bins)-1, membership, maximum=False)
+        genx_kld_results = calculate_array_klds(gases, genx_arrays, bins, genx_array_pmfs, genx_binned_sum)
         genx_kld_results_sorted = sort_population(genx_kld_results, seek=seek, seek_by=seek_by)
         genx_list_sorted = [x['MOF_Array'] for x in genx_kld_results_sorted]
 
@@ -718,4 +604,6 @@ def run_genetic_algorithm(first_gen, generation_start_num, array_size, mofs_list
         children = remove_duplicate_arrays(children, mofs_list)
         generation = children
 
+    if skipped:
+        print("Left out %s arrays whose PMF is zero at every composition" % sum(skipped))
     return(all_arrays_list_by_generation, all_array_results_by_generation)
@@ -0,0 +1,736 @@
+"""
+Dense, NumPy-backed versions of the PMF calculations shared by brute_force_analysis.py and
+genetic_algorithm_analysis.py (and of reading the data files and results store and smoothing the
+simulated data, which precede them).
+Rather than one scipy call per MOF, experiment and simulated point, the probabilities of every MOF
+and composition are evaluated at once as a (MOFs x compositions) matrix.
+
+The element PMFs are kept in a dictionary (element_pmfs, see create_element_pmfs) holding that
+matrix along with the names of the MOFs (its rows) and the compositions (its columns). Arrays are
+given as row indices into it, and the PMFs of many arrays as a (arrays x compositions) matrix, in
+place of the lists of dictionaries keyed by MOF and array name.
+"""
+
+# --------------------------------------------------
+# ----- Import Python Packages ---------------------
+# --------------------------------------------------
+import csv
+import os
+import zipfile
+from itertools import combinations, product
+from math import comb
+
+import numpy as np
+from scipy import sparse
+from scipy.special import log_ndtr, logsumexp, xlogy
+
+LOG_SQRT_2PI = 0.5 * np.log(2 * np.pi)
+
+# --------------------------------------------------
+# ----- User-defined Python Functions --------------
+# --------------------------------------------------
+def read_results_store(filename, mmap=False):
+    """
+    ----- Loads a results store written by consolidate_results.py -----
+    Returns a dictionary of columns (numpy arrays) with one row per simulation, sorted by MOF,
+    campaign and run ID. With mmap=True the columns of an uncompressed store are memory-mapped rather than read,
+    so only the rows used are ever loaded.
+    """
+    with zipfile.ZipFile(filename) as archive:
+        members = archive.infolist()
+    if not mmap or any([member.compress_type != zipfile.ZIP_STORED for member in members]):
+        with np.load(filename) as store:
+            return {key: store[key] for key in store.files}
+
+    results_store = {}
+    with open(filename, 'rb') as f:
+        for member in members:
+            # Skip the local header of the zip member to the .npy header, and that to the data
+            f.seek(member.header_offset)
+            local_header = f.read(30)
+            f.seek(member.header_offset + 30 + int.from_bytes(local_header[26:28], 'little') + int.from_bytes(local_header[28:30], 'little'))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            key = member.filename[:-len('.npy')]
+            if np.prod(shape) == 0:
+                results_store[key] = np.empty(shape, dtype=dtype)
+            else:
+                results_store[key] = np.memmap(filename, dtype=dtype, mode='r', offset=f.tell(), shape=shape, order='F' if fortran_order else 'C')
+    return results_store
+
+
+def read_data_as_dict(filename):
+    """
+    ----- Reads a tab-separated data file as a list of dictionaries -----
+    Results files of the simulation script name the total mass 'total_mass' and the mole fractions
+    '<gas>_comp'; every row also gets these as 'Mass' and '<gas>', the columns of older results
+    files (and of results_store_as_dict), which the analysis reads.
+    """
+    with open(filename,newline='') as csvfile:
+        output_data = list(csv.DictReader(csvfile, delimiter="\t"))
+    for row in output_data:
+        if 'total_mass' in row:
+            row.setdefault('Mass', row['total_mass'])
+        for key in [key for key in row if isinstance(key, str) and key.endswith('_comp')]:
+            row.setdefault(key[:-len('_comp')], row[key])
+    return output_data
+
+
+def results_store_as_dict(results_store, composition_id=None, pressure=None, campaign=None):
+    """
+    ----- Converts (part of) a results store to the format of read_data_as_dict -----
+    One dictionary per simulation with its run ID, MOF, total mass ('Mass') and mole fraction of
+    each gas. Passing composition_id keeps only the simulations of that composition, i.e. the
+    'experimental' data of one mixture for every MOF; pressure keeps only those at one pressure;
+    campaign keeps only those of one campaign (output directory), given by its number or name.
+    Campaigns are not merged: if the rows kept hold a MOF, composition and pressure more than once
+    (from several campaigns), a ValueError asks for a campaign.
+    """
+    selected = np.ones(len(results_store['run_id']), dtype=bool)
+    if composition_id is not None:
+        selected &= results_store['composition_id'] == composition_id
+    if pressure is not None:
+        selected &= np.isclose(results_store['pressure'], pressure)
+    # stores written before campaigns were recorded hold one
+    campaigns = [str(name) for name in results_store['campaigns']] if 'campaigns' in results_store else []
+    if campaign is not None:
+        if isinstance(campaign, str):
+            names = [os.path.normpath(name) for name in campaigns]
+            if os.path.normpath(campaign) not in names:
+                raise ValueError("No campaign %s in the results store, which has %s" % (campaign, ", ".join(campaigns)))
+            campaign = names.index(os.path.normpath(campaign))
+        selected &= results_store['campaign'] == campaign
+    elif len(campaigns) > 1:
+        keys = list(zip(results_store['mof'][selected], results_store['composition_id'][selected], results_store['pressure'][selected]))
+        if len(set([(str(mof), int(composition), None if np.isnan(p) else float(p)) for mof, composition, p in keys])) < len(keys):
+            raise ValueError("The results store holds the same MOF and composition from more than one campaign (%s); "
+                             "choose one with campaign" % ", ".join(campaigns))
+    gases = [str(gas) for gas in results_store['gases']]
+    rows = []
+    for i in np.flatnonzero(selected):
+        row = {'Run ID': int(results_store['run_id'][i]), 'MOF': str(results_store['mof'][i]), 'Mass': float(results_store['total_mass'][i])}
+        for g, gas in enumerate(gases):
+            row[gas] = float(results_store['composition'][i, g])
+        rows.append(row)
+    return rows
+
+
+def simulated_mass_matrix(sim_results_full, mof_list):
+    """
+    ----- Arranges the simulated masses as a (MOFs x compositions) matrix -----
+    Rows follow mof_list and columns the order of the simulated results of each MOF, which must
+    list the same compositions in the same order for every MOF.
+    """
+    masses = {mof: [] for mof in mof_list}
+    for row in sim_results_full:
+        if row['MOF'] in masses:
+            masses[row['MOF']].append(float(row['Mass_mg/cm3']))
+    num_comps = set([len(masses[mof]) for mof in mof_list])
+    if len(num_comps) != 1:
+        raise ValueError("MOFs have different numbers of simulated compositions: %s" %
+                         {mof: len(masses[mof]) for mof in mof_list})
+    return np.array([masses[mof] for mof in mof_list])
+
+
+def experimental_masses(exp_results_full, mof_list):
+    """
+    ----- Experimental mass of each MOF, in the order of mof_list -----
+    With several experimental rows for a MOF the last one is used, as in calculate_element_pmf.
+    """
+    masses = {}
+    for row in exp_results_full:
+        masses[row['MOF']] = float(row['Mass_mg/cm3'])
+    missing = [mof for mof in mof_list if mof not in masses]
+    if missing:
+        raise ValueError("No experimental mass for %s" % ', '.join(missing))
+    return np.array([masses[mof] for mof in mof_list])
+
+
+def lattice_moving_average(grid_sum, grid_count, points, num_points):
+    """
+    ----- Box filter over a composition lattice, with windows shrunk at its boundaries -----
+    Keyword arguments:
+        grid_sum -- (MOFs x lattice) sums of the masses at each lattice point
+        grid_count -- (lattice) or (MOFs x lattice) number of masses at each lattice point
+        points -- (points x gases) lattice indices of the points to average around
+        num_points -- largest number of lattice steps to average over in each direction
+    For each point, the window of each gas extends the same number of steps each way, as many as
+    fit within the lattice (at most num_points). Returns the sums and the counts of the masses
+    within the window of each point, (MOFs x points) and (points) or (MOFs x points). The window
+    sums come from summed-area tables of the lattice, one inclusion-exclusion over the corners of
+    all windows, for all MOFs at once.
+    """
+    shape = np.array(grid_sum.shape[1:])
+    points = np.asarray(points, dtype=np.intp).reshape(-1, len(shape))
+    half_width = np.minimum(np.minimum(points, shape-1-points), max(num_points, 0))
+    lower, upper = points - half_width, points + half_width + 1
+
+    def window_sums(grid):
+        # summed-area table, padded with zeros in front so table[..., i] = sum(grid[..., :i])
+        table = np.pad(grid, [(0, 0)] * (grid.ndim-len(shape)) + [(1, 0)] * len(shape))
+        for axis in range(grid.ndim-len(shape), grid.ndim):
+            table = np.cumsum(table, axis=axis)
+        sums = 0
+        for corner in product([0, 1], repeat=len(shape)):
+            index = tuple([np.where(c, upper[:, g], lower[:, g]) for g, c in enumerate(corner)])
+            sign = (-1) ** (len(shape) - sum(corner))
+            sums = sums + sign * table[(Ellipsis,) + index]
+        return sums
+
+    counts = window_sums(grid_count)
+    if num_points < 0:
+        # no window at all, as in moving_average_smooth
+        counts = np.zeros_like(counts)
+    return window_sums(grid_sum), counts
+
+
+def moving_average_smooth_matrix(sim_results_import, mof_list, gases, comp_list, mole_fractions, num_points=1):
+    """
+    ----- moving_average_smooth on the composition lattice -----
+    The simulated points are placed on the lattice of the sorted mole_fractions of each gas (from
+    create_comp_list), and each point of comp_list is replaced, for every MOF, by the average of the
+    points within num_points lattice steps of it in each direction (lattice_moving_average); near
+    the boundaries the window shrinks symmetrically, so corner points remain unchanged. Returns the
+    same rows as moving_average_smooth, recording the number of points averaged as Num_points.
+    """
+    mof_index = {mof: i for i, mof in enumerate(mof_list)}
+    lattice_index = [{value: i for i, value in enumerate(mole_fractions[gas])} for gas in gases]
+    shape = (len(mof_list),) + tuple([len(mole_fractions[gas]) for gas in gases])
+    grid_sum = np.zeros(shape)
+    grid_count = np.zeros(shape, dtype=np.int64)
+
+    # The last row of each MOF and composition is the one kept in the output
+    rows_by_point = {}
+    for row in sim_results_import:
+        if row['MOF'] not in mof_index:
+            continue
+        comp = tuple([float(row[gas]) for gas in gases])
+        rows_by_point[(row['MOF'], comp)] = row
+        point = [lattice_index[g].get(value) for g, value in enumerate(comp)]
+        if None not in point:
+            point = (mof_index[row['MOF']],) + tuple(point)
+            grid_sum[point] += float(row['Mass_mg/cm3'])
+            grid_count[point] += 1
+
+    comps = [tuple([comp_main[gas] for gas in gases]) for comp_main in comp_list]
+    points = [[lattice_index[g][value] for g, value in enumerate(comp)] for comp in comps]
+    mass_sums, counts = lattice_moving_average(grid_sum, grid_count, points, num_points)
+
+    data_smoothed = []
+    for m, mof in enumerate(mof_list):
+        for p, comp in enumerate(comps):
+            temp_dict = dict(rows_by_point.get((mof, comp), {}))
+            temp_dict.update(zip(gases, comp))
+            if counts[m, p] != 0:
+                temp_dict['Mass_mg/cm3'] = float(mass_sums[m, p] / counts[m, p])
+            temp_dict['Num_points'] = int(counts[m, p])
+            data_smoothed.append(temp_dict)
+    return data_smoothed
+
+
+def log_ndtr_difference(upper, lower):
+    """
+    log(Norm_CDF(upper) - Norm_CDF(lower)) for upper >= lower. Both limits are reflected into the
+    lower tail, where log_ndtr keeps its precision, so tails far from the mean do not round to 0.
+    """
+    reflect = lower > 0
+    upper, lower = np.where(reflect, -lower, upper), np.where(reflect, -upper, lower)
+    log_upper = log_ndtr(upper)
+    with np.errstate(divide='ignore'):
+        return log_upper + np.log1p(-np.exp(log_ndtr(lower) - log_upper))
+
+
+def calculate_element_pmf_matrix(sim_masses, exp_masses, stdev, mrange, type='mass'):
+    """
+    ----- Calculates the PMFs of every MOF at every simulated composition at once -----
+    Keyword arguments:
+        sim_masses -- (MOFs x compositions) matrix of simulated masses
+        exp_masses -- experimental mass of each MOF
+        stdev -- standard deviation for the normal distribution
+        mrange -- range for which the difference between cdfs is calculated
+        type -- 'mass' for a fixed standard deviation, 'percent' for one relative to the mass
+    Returns the PMF_Range and PMF_Exact matrices of calculate_element_pmf, each row normalized.
+    ----------
+    Both PMFs follow the truncated normal distribution (ss.truncnorm) with the experimental mass
+    as its mean, truncated to [a,b] = [alpha,beta] in standard units. Within a row every value
+    shares the normalization of the truncated distribution, Norm_CDF(beta) - Norm_CDF(alpha) (and
+    sigma for the PDF), so only the untruncated terms are needed before normalizing the row:
+      PMF_Range ~ Norm_CDF(clip(z_upper)) - Norm_CDF(clip(z_lower))
+      PMF_Exact ~ Norm_PDF(z) for alpha <= z <= beta, 0 otherwise
+    Both are evaluated as logarithms and normalized with logsumexp.
+    """
+    sim_masses = np.asarray(sim_masses, dtype=float)
+    mu = np.asarray(exp_masses, dtype=float)[:, None]
+    max_masses = np.max(sim_masses, axis=1, keepdims=True)
+    if type == 'mass':
+        b = 2 * max_masses
+        sigma = float(stdev) * np.ones_like(mu)
+    elif type == 'percent':
+        b = max_masses * (1 + mrange)
+        sigma = float(stdev) * mu
+    else:
+        raise ValueError("Unknown type of PMF: %s" % type)
+    alpha, beta = (0 - mu) / sigma, (b - mu) / sigma
+
+    z_upper = np.clip((sim_masses * (1 + mrange) - mu) / sigma, alpha, beta)
+    z_lower = np.clip((sim_masses * (1 - mrange) - mu) / sigma, alpha, beta)
+    log_range = log_ndtr_difference(z_upper, z_lower)
+
+    z = (sim_masses - mu) / sigma
+    log_exact = np.where((z >= alpha) & (z <= beta), -0.5 * z**2 - LOG_SQRT_2PI, -np.inf)
+
+    pmf_range = np.exp(log_range - logsumexp(log_range, axis=1, keepdims=True))
+    pmf_exact = np.exp(log_exact - logsumexp(log_exact, axis=1, keepdims=True))
+    return pmf_range, pmf_exact
+
+
+def create_element_pmfs(exp_results_full, sim_results_full, mof_list, gases, stdev, mrange, type='mass', dtype=np.float64):
+    """
+    ----- Calculates the element PMFs as a dense matrix -----
+    Takes the same arguments as calculate_element_pmf, and returns a dictionary with
+        mofs -- names of the MOFs, one per row
+        mof_index -- row of each MOF
+        gases -- names of the gases, one per column of comps
+        comps -- (compositions x gases) mole fractions, one row per column of the PMF matrices
+        pmf -- (MOFs x compositions) PMF_Range of every MOF and composition
+        pmf_exact -- (MOFs x compositions) PMF_Exact of every MOF and composition
+    Use dtype=np.float32 to halve the memory of the matrices (and of the array PMFs computed
+    from them).
+    """
+    sim_masses = simulated_mass_matrix(sim_results_full, mof_list)
+    exp_masses = experimental_masses(exp_results_full, mof_list)
+    pmf_range, pmf_exact = calculate_element_pmf_matrix(sim_masses, exp_masses, stdev, mrange, type=type)
+    comps = [[float(row[gas]) for gas in gases] for row in sim_results_full if row['MOF'] == mof_list[0]]
+    return {'mofs': list(mof_list),
+            'mof_index': {mof: i for i, mof in enumerate(mof_list)},
+            'gases': list(gases),
+            'comps': np.array(comps),
+            'pmf': pmf_range.astype(dtype),
+            'pmf_exact': pmf_exact.astype(dtype)}
+
+
+def element_pmfs_from_results(element_pmf_results, mof_list, gases, dtype=np.float64):
+    """
+    ----- Converts the results of calculate_element_pmf to element_pmfs -----
+    """
+    rows_by_mof = {mof: [] for mof in mof_list}
+    for row in element_pmf_results:
+        if row['MOF'] in rows_by_mof:
+            rows_by_mof[row['MOF']].append(row)
+    return {'mofs': list(mof_list),
+            'mof_index': {mof: i for i, mof in enumerate(mof_list)},
+            'gases': list(gases),
+            'comps': np.array([[float(row[gas]) for gas in gases] for row in rows_by_mof[mof_list[0]]]),
+            'pmf': np.array([[row['PMF_Range'] for row in rows_by_mof[mof]] for mof in mof_list], dtype=dtype),
+            'pmf_exact': np.array([[row['PMF_Exact'] for row in rows_by_mof[mof]] for mof in mof_list], dtype=dtype)}
+
+
+def mof_indices(element_pmfs, mof_array):
+    # rows of the MOFs of an array
+    return np.array([element_pmfs['mof_index'][mof] for mof in mof_array], dtype=np.intp)
+
+
+def array_pmf_products(element_pmfs, arrays):
+    # (arrays x compositions) products of the element PMFs of each array, not yet normalized
+    pmf = element_pmfs['pmf']
+    array_pmfs = np.empty((len(arrays), pmf.shape[1]), dtype=pmf.dtype)
+    for i, array in enumerate(arrays):
+        np.prod(pmf[array], axis=0, out=array_pmfs[i])
+    return array_pmfs
+
+
+def calculate_array_pmfs(element_pmfs, arrays):
+    """
+    ----- Combines and normalizes the element PMFs of many arrays -----
+    Keyword arguments:
+        element_pmfs -- element PMFs from create_element_pmfs
+        arrays -- arrays as sequences of row indices (see mof_indices)
+    Returns a (arrays x compositions) matrix with the normalized PMF of each array, as
+    calculate_array_pmf returns for a single one. Raises ValueError for an array whose PMF is zero
+    at every composition (its MOFs have no composition in common within mrange); see
+    normalize_block_pmfs to leave those out instead.
+    """
+    array_pmfs = array_pmf_products(element_pmfs, arrays)
+    sums = np.sum(array_pmfs, axis=1, keepdims=True)
+    if not np.all(sums > 0):
+        array = arrays[int(np.argmin(sums[:, 0] > 0))]
+        raise ValueError("The PMF of array %s is zero at every composition, so it cannot be normalized"
+                         % ' '.join([element_pmfs['mofs'][i] for i in array]))
+    array_pmfs /= sums
+    return array_pmfs
+
+
+def count_arrays(num_elements, num_mofs):
+    # number of arrays of num_elements MOFs, for all array sizes within num_mofs
+    return sum([comb(num_elements, array_size) for array_size in range(min(num_mofs), max(num_mofs)+1)])
+
+
+def unrank_combination(num_elements, array_size, rank):
+    """
+    ----- Finds the combination at a position in lexicographic order -----
+    Keyword arguments:
+        num_elements -- number of elements to choose from
+        array_size -- number of elements in each combination
+        rank -- position of the combination in the order of itertools.combinations
+    Returns the rank-th combination of range(num_elements) as a tuple, using the combinatorial
+    number system: the number of combinations starting with element x (after the elements
+    already chosen) is comb(num_elements-x-1, remaining-1), so every element is found by skipping
+    whole groups of combinations rather than generating them.
+    """
+    if not 0 <= rank < comb(num_elements, array_size):
+        raise ValueError("No combination %s of %s elements choose %s" % (rank, num_elements, array_size))
+    combination = []
+    x = 0
+    for remaining in range(array_size, 0, -1):
+        while rank >= comb(num_elements-x-1, remaining-1):
+            rank -= comb(num_elements-x-1, remaining-1)
+            x += 1
+        combination.append(x)
+        x += 1
+    return tuple(combination)
+
+
+def rank_combination(num_elements, combination):
+    # position of a combination (sorted tuple) in lexicographic order, the inverse of unrank_combination
+    rank = 0
+    x = 0
+    for i, element in enumerate(combination):
+        remaining = len(combination) - i
+        while x < element:
+            rank += comb(num_elements-x-1, remaining-1)
+            x += 1
+        x += 1
+    return rank
+
+
+def combinations_from(num_elements, array_size, first):
+    # itertools.combinations(range(num_elements), array_size), starting at the combination first
+    combination = list(first)
+    while True:
+        yield tuple(combination)
+        i = array_size - 1
+        while i >= 0 and combination[i] == num_elements - array_size + i:
+            i -= 1
+        if i < 0:
+            return
+        combination[i] += 1
+        for j in range(i+1, array_size):
+            combination[j] = combination[j-1] + 1
+
+
+def normalize_block_pmfs(arrays, block_pmfs, skipped=None):
+    """
+    ----- Normalizes a block of array PMFs -----
+    Keyword arguments:
+        arrays -- the arrays (or any labels of them), one per row of block_pmfs
+        block_pmfs -- (arrays x compositions) products of the element PMFs, normalized in place
+        skipped -- list to append the number of arrays left out to, if any are
+    Returns (arrays, block_pmfs) without the arrays whose PMF is zero at every composition (no
+    composition within mrange of all their MOFs), which cannot be normalized.
+    """
+    sums = np.sum(block_pmfs, axis=1, keepdims=True)
+    nonzero = sums[:, 0] > 0
+    if not np.all(nonzero):
+        if skipped is not None:
+            skipped.append(int(np.sum(~nonzero)))
+        arrays = [array for array, keep in zip(arrays, nonzero) if keep]
+        block_pmfs, sums = block_pmfs[nonzero], sums[nonzero]
+    block_pmfs /= sums
+    return arrays, block_pmfs
+
+
+def enumerate_array_pmfs(element_pmfs, num_mofs, start=0, stop=None, skipped=None):
+    """
+    ----- Enumerates all possible arrays and their PMFs, block by block -----
+    Keyword arguments:
+        element_pmfs -- element PMFs from create_element_pmfs
+        num_mofs -- lower and upper limit of the number of MOFs in an array
+        start, stop -- enumerate only the arrays at positions start to stop-1 of the full
+            enumeration (of all array sizes, see count_arrays), e.g. one shard of a parallel run
+        skipped -- list to append the number of arrays left out of a block to (see below)
+    Yields (arrays, array_pmfs) for consecutive blocks of arrays, in the order of
+    calculate_all_arrays_list: arrays as tuples of row indices, and their normalized PMFs as an
+    (arrays x compositions) matrix. Only one block is held in memory at a time. Arrays whose PMF
+    is zero at every composition (no composition within mrange of all their MOFs) have no
+    normalized PMF and are left out (see normalize_block_pmfs).
+    ----------
+    Arrays are enumerated depth first over their first array_size-2 MOFs (the prefix), which
+    consecutive arrays mostly share. The product of the element PMFs of each level of the prefix
+    is cached, so moving to the next prefix costs one vector multiply for each level that changed.
+    The products of every pair of MOFs are computed once, in lexicographic order, so the arrays
+    completing a prefix are those of a contiguous run of pairs, and their PMFs are a single
+    multiplication of the prefix product with that run, instead of multiplying array_size element
+    PMFs for every array. The cached products are rescaled to a maximum of 1 at every level, which
+    cancels when the array PMFs are normalized and keeps products of many small PMFs from
+    underflowing. The first array of a range is found with unrank_combination, so a range starts
+    without enumerating the arrays before it.
+    """
+    pmf = element_pmfs['pmf']
+    num_elements, num_comps = pmf.shape
+    pairs = list(combinations(range(num_elements), 2))
+    # pairs[pair_start[i]:] are the pairs of MOFs i and later
+    pair_start = np.cumsum([0] + list(range(num_elements-1, 0, -1)))
+    pair_products = None
+
+    if stop is None:
+        stop = count_arrays(num_elements, num_mofs)
+    offset = 0
+    for array_size in range(min(num_mofs), min(max(num_mofs), num_elements)+1):
+        # the range within the arrays of this size
+        size_start = max(start - offset, 0)
+        size_stop = min(stop - offset, comb(num_elements, array_size))
+        offset += comb(num_elements, array_size)
+        if size_start >= size_stop:
+            continue
+        if array_size == 1:
+            yield normalize_block_pmfs([(i,) for i in range(size_start, size_stop)],
+                                       pmf[size_start:size_stop].copy(), skipped)
+            continue
+        if pair_products is None:
+            pair_products = np.array([pmf[i] * pmf[j] for i, j in pairs], dtype=pmf.dtype).reshape(len(pairs), num_comps)
+
+        # prefix_products[level] is the (rescaled) product over the first level MOFs of the current prefix
+        prefix_products = np.ones((array_size-1, num_comps), dtype=pmf.dtype)
+        previous_prefix = None
+        first_array = unrank_combination(num_elements, array_size, size_start)
+        remaining = size_stop - size_start
+        for prefix in combinations_from(num_elements-2, array_size-2, first_array[:-2]):
+            first_changed = 0
+            if previous_prefix is not None:
+                while prefix[first_changed] == previous_prefix[first_changed]:
+                    first_changed += 1
+            for level in range(first_changed, array_size-2):
+                product = np.multiply(prefix_products[level], pmf[prefix[level]], out=prefix_products[level+1])
+                # a prefix with a PMF of zero everywhere stays zero, and its arrays are left out below
+                if np.max(product) > 0:
+                    product /= np.max(product)
+
+            first_pair = pair_start[prefix[-1]+1] if prefix else 0
+            if previous_prefix is None:
+                # start at the pair completing the first array of the range
+                first_pair = pair_start[first_array[-2]] + first_array[-1] - first_array[-2] - 1
+            previous_prefix = prefix
+            last_pair = min(len(pairs), first_pair + remaining)
+            remaining -= last_pair - first_pair
+            arrays = [prefix + pair for pair in pairs[first_pair:last_pair]]
+            block_pmfs = prefix_products[-1] * pair_products[first_pair:last_pair]
+            yield normalize_block_pmfs(arrays, block_pmfs, skipped)
+            if remaining == 0:
+                break
+
+
+def calculate_all_array_pmfs(element_pmfs, num_mofs, skipped=None):
+    """
+    ----- Calculates all possible arrays and their PMFs -----
+    Dense counterpart of calculate_all_arrays: returns the list of arrays (tuples of MOF names,
+    in the same order) and the (arrays x compositions) matrix of their PMFs. skipped is passed
+    to enumerate_array_pmfs.
+    """
+    mofs = element_pmfs['mofs']
+    num_arrays = count_arrays(len(mofs), num_mofs)
+    list_of_arrays = []
+    array_pmfs = np.empty((num_arrays, element_pmfs['pmf'].shape[1]), dtype=element_pmfs['pmf'].dtype)
+    for arrays, block_pmfs in enumerate_array_pmfs(element_pmfs, num_mofs, skipped=skipped):
+        array_pmfs[len(list_of_arrays):len(list_of_arrays)+len(arrays)] = block_pmfs
+        list_of_arrays.extend([tuple([mofs[i] for i in array]) for array in arrays])
+    # arrays left out by enumerate_array_pmfs have no row
+    return list_of_arrays, array_pmfs[:len(list_of_arrays)]
+
+
+def digitize_compositions(comps, gases, bins):
+    """
+    ----- Assigns compositions to a bin of each gas -----
+    Keyword arguments:
+        comps -- (compositions x gases) mole fractions
+        gases -- list of gases
+        bins -- bin edges from create_bins
+    Returns a (compositions x gases) matrix of the index of the bin holding each mole fraction,
+    the i-th bin spanning [bins[i], bins[i+1]), or -1 for mole fractions outside all bins.
+    """
+    comp_bins = np.empty(np.shape(comps), dtype=np.intp)
+    for g, gas in enumerate(gases):
+        edges = np.array([row[gas] for row in bins])
+        comp_bins[:, g] = np.digitize(comps[:, g], edges) - 1
+    comp_bins[comp_bins >= len(bins)-1] = -1
+    return comp_bins
+
+
+def composition_bins(element_pmfs, bins):
+    """
+    ----- Assigns every composition to a bin of each gas -----
+    Keyword arguments:
+        element_pmfs -- element PMFs from create_element_pmfs
+        bins -- bin edges from create_bins
+    Returns the bins of the compositions of element_pmfs, see digitize_compositions.
+    """
+    return digitize_compositions(element_pmfs['comps'], element_pmfs['gases'], bins)
+
+
+def bin_membership(comp_bins, num_bins):
+    """
+    ----- Sparse bin membership of the compositions, for bin_array_pmfs -----
+    Keyword arguments:
+        comp_bins -- bin of each composition and gas from composition_bins
+        num_bins -- number of bins
+    Returns a dictionary with, for each gas, the one-hot (compositions x bins) matrix of the bin
+    of each composition (in CSC format), the compositions sorted by bin ('order', leaving out
+    those outside all bins), and where each non-empty bin starts in that order ('starts', with
+    the bins in 'bins'). Only depends on the compositions, so it is made once for all arrays.
+    """
+    membership = {'num_bins': num_bins, 'one_hot': [], 'order': [], 'starts': [], 'bins': []}
+    for g in range(comp_bins.shape[1]):
+        in_bins = np.flatnonzero(comp_bins[:, g] >= 0)
+        membership['one_hot'].append(sparse.csc_matrix((np.ones(len(in_bins)), (in_bins, comp_bins[in_bins, g])),
+                                                       shape=(comp_bins.shape[0], num_bins)))
+        order = in_bins[np.argsort(comp_bins[in_bins, g], kind='stable')]
+        bins, starts = np.unique(comp_bins[order, g], return_index=True)
+        membership['order'].append(order)
+        membership['starts'].append(starts)
+        membership['bins'].append(bins)
+    return membership
+
+
+def bin_array_pmfs(array_pmfs, comp_bins, num_bins, membership=None, maximum=True):
+    """
+    ----- Sums (and takes the max of) the array PMFs over the compositions in each bin -----
+    Keyword arguments:
+        array_pmfs -- (arrays x compositions) array PMFs
+        comp_bins -- bin of each composition and gas from composition_bins
+        num_bins -- number of bins
+        membership -- bin_membership(comp_bins, num_bins), when binning many blocks of arrays
+        maximum -- whether to take the max of the PMFs in each bin
+    Returns two (gases x arrays x bins) matrices, of the sum and the max of the PMFs in each bin
+    (0 for empty bins), as bin_compositions returns for lists of dictionaries; the max is None
+    if maximum is False. The sums of each gas are one product with the sparse bin membership
+    matrix, and the maxima one reduction over the compositions sorted by bin.
+    """
+    if membership is None:
+        membership = bin_membership(comp_bins, num_bins)
+    num_gases = comp_bins.shape[1]
+    binned_sum = np.empty((num_gases, len(array_pmfs), num_bins), dtype=array_pmfs.dtype)
+    binned_max = np.zeros((num_gases, len(array_pmfs), num_bins), dtype=array_pmfs.dtype) if maximum else None
+    for g in range(num_gases):
+        binned_sum[g] = array_pmfs @ membership['one_hot'][g]
+        if maximum and len(membership['order'][g]) and len(array_pmfs):
+            binned_max[g][:, membership['bins'][g]] = \
+                np.maximum.reduceat(array_pmfs[:, membership['order'][g]], membership['starts'][g], axis=1)
+    return binned_sum, binned_max
+
+
+def calculate_kld_vectors(bins, array_pmfs, binned_sum):
+    """
+    ----- Calculates the KLDs of a block of arrays at once -----
+    Keyword arguments:
+        bins -- bin edges from create_bins
+        array_pmfs -- (arrays x compositions) array PMFs
+        binned_sum -- (gases x arrays x bins) binned PMFs from bin_array_pmfs
+    Returns the absolute KLD of each array, the (gases x arrays) KLDs of each gas and the joint
+    KLD of each array, rounded as calculate_kld rounds them. Terms with a PMF of 0 are 0 (xlogy).
+    """
+    # p*log2(p/reference_prob), with reference_prob 1/compositions and 1/len(bins)
+    absolute_kld = np.sum(xlogy(array_pmfs, array_pmfs * array_pmfs.shape[1]), axis=-1) / np.log(2)
+    gas_klds = np.sum(xlogy(binned_sum, binned_sum * len(bins)), axis=-1) / np.log(2)
+    absolute_kld = np.round(absolute_kld, 4)
+    gas_klds = np.round(gas_klds, 4)
+    return absolute_kld, gas_klds, np.prod(gas_klds, axis=0)
+
+
+def calculate_array_klds(gases, list_of_arrays, bins, array_pmfs, binned_sum):
+    """
+    ----- Calculates the KLDs of many arrays -----
+    Keyword arguments:
+        gases -- list of gases
+        list_of_arrays -- the arrays, one per row of array_pmfs
+        bins -- bin edges from create_bins
+        array_pmfs -- (arrays x compositions) array PMFs
+        binned_sum -- (gases x arrays x bins) binned PMFs from bin_array_pmfs
+    Returns one dictionary per array with its absolute, per gas and joint KLD, as calculate_kld.
+    """
+    absolute_kld, gas_klds, joint_kld = calculate_kld_vectors(bins, array_pmfs, binned_sum)
+    absolute_kld, gas_klds, joint_kld = absolute_kld.tolist(), gas_klds.tolist(), joint_kld.tolist()
+    array_kld_results = []
+    for i, array in enumerate(list_of_arrays):
+        dict_temp = {'MOF_Array' : array, 'Absolute_KLD' : absolute_kld[i]}
+        for g, gas in enumerate(gases):
+            dict_temp['%s KLD' % gas] = gas_klds[g][i]
+        dict_temp['Joint_KLD'] = joint_kld[i]
+        dict_temp['Array_Size'] = len(array)
+        array_kld_results.append(dict_temp)
+    return array_kld_results
+
+
+def evaluate_all_arrays(element_pmfs, num_mofs, bins, comp_bins, start=0, stop=None, skipped=None):
+    """
+    ----- Calculates the KLDs of all possible arrays, one at a time -----
+    Keyword arguments:
+        element_pmfs -- element PMFs from create_element_pmfs
+        num_mofs -- lower and upper limit of the number of MOFs in an array
+        bins -- bin edges from create_bins
+        comp_bins -- bin of each composition and gas from composition_bins
+        start, stop -- evaluate only the arrays at positions start to stop-1 (see enumerate_array_pmfs)
+        skipped -- list to append the number of arrays left out of each block to (see enumerate_array_pmfs)
+    Generator of the results of calculate_array_klds for every array, in the order of
+    calculate_all_arrays_list. The arrays are evaluated block by block (see
+    enumerate_array_pmfs), so the PMFs of all arrays are never held in memory at once; pass it
+    to choose_arrays_streaming to rank them.
+    """
+    mofs = element_pmfs['mofs']
+    gases = element_pmfs['gases']
+    membership = bin_membership(comp_bins, len(bins)-1)
+    for arrays, block_pmfs in enumerate_array_pmfs(element_pmfs, num_mofs, start, stop, skipped):
+        block_arrays = [tuple([mofs[i] for i in array]) for array in arrays]
+        binned_sum, _ = bin_array_pmfs(block_pmfs, comp_bins, len(bins)-1, membership, maximum=False)
+        yield from calculate_array_klds(gases, block_arrays, bins, block_pmfs, binned_sum)
+
+
+def array_pmfs_from_dict(list_of_arrays, all_array_pmf_results):
+    # (arrays x compositions) matrix of the array PMFs of calculate_all_arrays
+    array_names = [' '.join(array) for array in list_of_arrays]
+    return np.array([[row[array] for row in all_array_pmf_results] for array in array_names],
+                    dtype=float).reshape(len(array_names), len(all_array_pmf_results))
+
+
+def array_pmfs_as_dict(element_pmfs, list_of_arrays, array_pmfs):
+    """
+    ----- Converts array PMFs to the all_array_pmf_results of calculate_all_arrays -----
+    For the functions saving and plotting the PMFs of arrays.
+    """
+    gases = element_pmfs['gases']
+    array_names = [' '.join(array) for array in list_of_arrays]
+    all_array_pmf_results = []
+    if not array_names:
+        return all_array_pmf_results
+    for index, comp in enumerate(element_pmfs['comps']):
+        pmfs = array_pmfs[:, index].tolist()
+        # Same order of keys as calculate_all_arrays: the first array, the gases, the other arrays
+        array_dict = {array_names[0] : pmfs[0]}
+        array_dict.update({gas: float(comp[g]) for g, gas in enumerate(gases)})
+        array_dict.update(zip(array_names[1:], pmfs[1:]))
+        all_array_pmf_results.append(array_dict)
+    return all_array_pmf_results
+
+
+def binned_pmfs_as_dict(gases, bins, list_of_arrays, binned_pmfs):
+    """
+    ----- Converts binned PMFs to the binned_probabilities of bin_compositions -----
+    For the functions saving and plotting the binned PMFs of arrays.
+    """
+    array_names = [' '.join(array) for array in list_of_arrays]
+    binned_probabilities = []
+    for g, gas in enumerate(gases):
+        for i, bin in enumerate(bins[0:len(bins)-1]):
+            with_pmfs = {'%s bin' % gas : bin[gas]}
+            with_pmfs.update(zip(array_names, binned_pmfs[g, :, i].tolist()))
+            binned_probabilities.append(with_pmfs)
+    return binned_probabilities
+
+
+def binned_pmfs_from_dict(gases, list_of_arrays, binned_probabilities):
+    # (gases x arrays x bins) matrix of the binned_probabilities of bin_compositions
+    array_names = [' '.join(array) for array in list_of_arrays]
+    rows_by_gas = [[row for row in binned_probabilities if '%s bin' % gas in row] for gas in gases]
+    return np.array([[[row[array] for row in rows] for array in array_names] for rows in rows_by_gas],
+                    dtype=float).reshape(len(gases), len(array_names), len(rows_by_gas[0]) if gases else 0)
@@ -26,7 +26,7 @@ import tensorflow_probability as tfp
 # ----- General Use -----
 def yaml_loader(filepath):
     with open(filepath, 'r') as yaml_file:
-        data = yaml.load(yaml_file)
+        data = yaml.safe_load(yaml_file)
     return data
 
 
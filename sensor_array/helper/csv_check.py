@@ -5,6 +5,8 @@ import numpy as np
 import pandas as pd
 import os
 
+from read_results import read_results_dataframe
+
 # ----- RASPA Data -----
 # Break the file down into component parts, and then rejoin. This is just to
 # make sure the format is right for additional processing.
@@ -30,8 +32,7 @@ for filename in os.listdir(results_filepath):
 
     if filename.endswith('.csv'):
         ads_file = results_filepath+'/'+filename
-        ads_results = pd.read_csv(ads_file, delimiter='\t|,|:|;', engine='python', header=None, names=col_names)
-        ads_results = ads_results.drop(index=0)
+        ads_results = read_results_dataframe(ads_file, gases)
 
         # Remove extraneous characters
         ads_results = ads_results.replace({'_eqeq':''}, regex=True)
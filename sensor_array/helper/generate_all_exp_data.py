@@ -6,14 +6,16 @@ import numpy as np
 import pandas as pd
 import os
 
+from read_results import read_results_dataframe
+
 results_filepath = '/Users/brian_day/Desktop/WilmerLab_Research/Research_Projects/Gas_Sensing/CO2_RASPA_Results/CO2_1bar/CO2_Sensing_Results_New_New/exp_Data_files/'
 all_mof_results_filename = '/Users/brian_day/Desktop/WilmerLab_Research/Research_Projects/Gas_Sensing/CO2_RASPA_Results/CO2_1bar/CO2_Sensing_Results_New_New/ALL_MOFS.csv'
 
+gases = ['CO2','O2','N2']
 col_names = np.array(['Run_ID','MOF','Mass','CO2','O2','N2'])
 
 filename = all_mof_results_filename
-all_ads_results = pd.read_csv(filename, delimiter='\t|,|:|;', engine='python', header=None, names=col_names)
-all_ads_results = all_ads_results.drop(index=0)
+all_ads_results = read_results_dataframe(filename, gases)
 all_ads_results = all_ads_results.values
 
 all_run_ids = np.linspace(0,960,961)
@@ -6,14 +6,16 @@ import numpy as np
 import pandas as pd
 import os
 
+from read_results import read_results_dataframe
+
 results_filepath = '/Users/brian_day/Desktop/WilmerLab_Research/Research_Projects/Gas_Sensing/CO2_RASPA_Results/CO2_1bar/CO2_Sensing_Results_New_New/'
 all_mof_results_filename = 'ALL_MOFS.csv'
 
+gases = ['CO2','O2','N2']
 col_names = np.array(['Run_ID','MOF','Mass_Uptake','CO2','O2','N2'])
 
 filename = results_filepath+'/'+all_mof_results_filename
-all_ads_results = pd.read_csv(filename, delimiter='\t|,|:|;', engine='python', header=None, names=col_names)
-all_ads_results = all_ads_results.drop(index=0)
+all_ads_results = read_results_dataframe(filename, gases)
 all_ads_results = all_ads_results.values
 
 exp_run_id = 175
@@ -28,7 +28,7 @@ import tensorflow_probability as tfp
 # ----- General Use -----
 def yaml_loader(filepath):
     with open(filepath, 'r') as yaml_file:
-        data = yaml.load(yaml_file)
+        data = yaml.safe_load(yaml_file)
     return data
 
 
@@ -41,6 +41,9 @@ def import_simulated_data(sim_results, sort_by_gas=False, gas_for_sorting=None):
         for row in reader_list:
             # Isolate Mass Data since currently being assigned to single key
             mass_data_temp = [float(val) for val in row[keys[2]].split(' ')]
+            # Rows written by parse_output already hold one value per column
+            if len(mass_data_temp) == 1:
+                continue
             num_gases = len(row)-len(mass_data_temp)-2
             # Reassign Compositions
             for i in range(num_gases):
@@ -0,0 +1,18 @@
+# Reading the results files of the simulation script, for the helper scripts.
+import pandas as pd
+
+def read_results_dataframe(filename, gases):
+    """
+    ----- Reads a results file by its header -----
+    Keyword arguments:
+        filename -- results file of the simulation script, or a file written by csv_check.py
+        gases -- list of gases
+    Returns a data frame with the columns Run_ID, MOF, Mass_Uptake and the mole fraction of each
+    gas, from the columns of results_header (Run ID, MOF, total_mass, ..., <gas>_comp, ...) or of
+    older results files (Run ID, MOF, Mass, <gases>), so neither is misread by position.
+    """
+    results = pd.read_csv(filename, delimiter='\t|,|:|;', engine='python')
+    columns = {'Run ID': 'Run_ID', 'total_mass': 'Mass_Uptake', 'Mass': 'Mass_Uptake'}
+    columns.update({gas + '_comp': gas for gas in gases})
+    results = results.rename(columns=columns)
+    return results[['Run_ID', 'MOF', 'Mass_Uptake'] + list(gases)]
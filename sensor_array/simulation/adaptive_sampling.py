@@ -0,0 +1,91 @@
+# --------------------------------------------
+# ----- Import Python Commands/Functions -----
+# --------------------------------------------
+import numpy as np
+
+LENGTH_SCALES = [0.05, 0.1, 0.2, 0.4, 0.8]
+
+
+# -----------------------------------------
+# ----- User Defined Python Functions -----
+# -----------------------------------------
+def composition_features(compositions, gases):
+    # the mole fraction of the last gas follows from the others
+    return np.array([[float(composition[gas]) for gas in gases[:-1]] for composition in compositions])
+
+
+def seed_design(features, num_points):
+    """
+    Indices of a space-filling set of num_points candidate compositions: starting from the
+    composition richest in the first gas, each next point is the candidate farthest from every point
+    chosen so far, which picks the corners of the composition space first.
+    """
+    chosen = [int(np.argmax(features[:, 0]))] if features.shape[1] > 0 else [0]
+    distances = np.linalg.norm(features - features[chosen[0]], axis=1)
+    while len(chosen) < min(num_points, len(features)):
+        chosen.append(int(np.argmax(distances)))
+        distances = np.minimum(distances, np.linalg.norm(features - features[chosen[-1]], axis=1))
+    return chosen
+
+
+def kernel(x1, x2, length_scale, variance, trend_variance):
+    """
+    Squared exponential covariance between compositions, plus a linear term so the Gaussian process
+    captures the near-linear trend of the adsorbed mass in the Henry's regime.
+    """
+    squared_distances = np.sum((x1[:, None, :] - x2[None, :, :])**2, axis=2)
+    return variance * np.exp(-squared_distances / (2 * length_scale**2)) + trend_variance * (1 + x1 @ x2.T)
+
+
+def fit_surrogate(features, masses, errors):
+    """
+    Fits a Gaussian process to the simulated masses at the given compositions, with the error of
+    each simulation as its noise, choosing the length scale with the highest marginal likelihood.
+    Returns the fitted surrogate for predict_surrogate and select_batch.
+    """
+    offset = np.mean(masses)
+    variance = max(np.var(masses), 1e-12)
+    noise = np.maximum(np.asarray(errors)**2, 1e-10 * variance)
+    best = None
+    for length_scale in LENGTH_SCALES:
+        covariance = kernel(features, features, length_scale, variance, variance) + np.diag(noise)
+        cholesky = np.linalg.cholesky(covariance)
+        alpha = np.linalg.solve(cholesky.T, np.linalg.solve(cholesky, masses - offset))
+        log_likelihood = -0.5 * (masses - offset) @ alpha - np.sum(np.log(np.diag(cholesky)))
+        if best is None or log_likelihood > best[0]:
+            best = (log_likelihood, length_scale, cholesky, alpha)
+    _, length_scale, cholesky, alpha = best
+    return {'features': features, 'noise': noise, 'offset': offset, 'variance': variance, 'length_scale': length_scale,
+            'cholesky': cholesky, 'alpha': alpha}
+
+
+def predict_surrogate(surrogate, features):
+    # posterior mean and standard deviation of the mass at the given compositions
+    cross = kernel(surrogate['features'], features, surrogate['length_scale'], surrogate['variance'], surrogate['variance'])
+    mean = surrogate['offset'] + cross.T @ surrogate['alpha']
+    reduced = np.linalg.solve(surrogate['cholesky'], cross)
+    prior = surrogate['variance'] * (1 + np.sum(features**2, axis=1)) + surrogate['variance']
+    return mean, np.sqrt(np.maximum(prior - np.sum(reduced**2, axis=0), 0.0))
+
+
+def select_batch(surrogate, features, candidates, batch_size):
+    """
+    Greedily picks up to batch_size of the candidate compositions (indices into features) with the
+    highest predicted uncertainty. After each pick the covariance is updated as if that composition
+    had been simulated, with the median noise so far, so a batch spreads out instead of clustering
+    around a single uncertain region.
+    """
+    candidates = list(candidates)
+    x = features[candidates]
+    cross = kernel(surrogate['features'], x, surrogate['length_scale'], surrogate['variance'], surrogate['variance'])
+    reduced = np.linalg.solve(surrogate['cholesky'], cross)
+    covariance = kernel(x, x, surrogate['length_scale'], surrogate['variance'], surrogate['variance']) - reduced.T @ reduced
+    noise = np.median(surrogate['noise'])
+    chosen = []
+    for _ in range(min(batch_size, len(candidates))):
+        variances = np.diag(covariance).copy()
+        variances[chosen] = -np.inf
+        i = int(np.argmax(variances))
+        chosen.append(i)
+        covariance = covariance - np.outer(covariance[:, i], covariance[i, :]) / (covariance[i, i] + noise)
+    return [candidates[i] for i in chosen]
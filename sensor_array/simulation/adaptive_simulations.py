@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+# ----------------------------------
+# ----- Import Python Packages -----
+# ----------------------------------
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from adaptive_sampling import (composition_features,
+                               seed_design,
+                               fit_surrogate,
+                               predict_surrogate,
+                               select_batch)
+from sensor_array_mof_adsorption import (read_composition_configuration,
+                                         read_gases_configuration,
+                                         read_mof_configuration_csv,
+                                         read_pressure_configuration,
+                                         read_results_rows,
+                                         read_completed_run_ids,
+                                         generate_unique_run_name,
+                                         results_header,
+                                         write_manifest,
+                                         add_submission_arguments,
+                                         submit_simulations,
+                                         sjs_job_queue)
+from sqlite_job_queue import SQLiteJobQueue
+
+# ----------------------------
+# ----- System Arguments -----
+# ----------------------------
+parser = argparse.ArgumentParser(description="Simulate only as many compositions of the composition grid as needed for a surrogate model of the "
+                                             "total mass of every MOF and pressure to reach a target accuracy.")
+parser.add_argument('mofs_filepath')
+parser.add_argument('compositions_filepath', help="the composition grid to sample from")
+parser.add_argument('gases_filepath')
+parser.add_argument('pressures_filepath')
+parser.add_argument('--seed-points', type=int, default=10,
+                    help="compositions simulated for every MOF and pressure before the first fit (default: 10)")
+parser.add_argument('--batch-size', type=int, default=10,
+                    help="compositions added per round for every MOF and pressure that has not converged (default: 10)")
+parser.add_argument('--target-accuracy', type=float, default=0.01,
+                    help="stop once the largest predicted standard deviation of the total mass at the compositions not simulated is below this fraction "
+                         "of the largest predicted total mass (default: 0.01)")
+parser.add_argument('--max-rounds', type=int, default=20, help="most rounds of batches after the seed design (default: 20)")
+parser.add_argument('--poll-seconds', type=float, default=60, help="wait between checks for the results of queued jobs (default: 60)")
+parser.add_argument('--wait-hours', type=float, default=48,
+                    help="longest wait for the jobs of a round; compositions still without results after it are dropped (default: 48)")
+add_submission_arguments(parser)
+args = parser.parse_args()
+
+mofs, unit_cells = read_mof_configuration_csv(args.mofs_filepath)
+compositions = read_composition_configuration(args.compositions_filepath)
+gases = read_gases_configuration(args.gases_filepath)
+pressures = read_pressure_configuration(args.pressures_filepath)
+features = composition_features(compositions, gases)
+
+# -------------------------------
+# ----- Setup the job queue -----
+# -------------------------------
+if args.queue is not None:
+    job_queue = SQLiteJobQueue(args.queue)
+else:
+    job_queue = sjs_job_queue()
+
+# ---------------------------------------------------
+# ----- Setup output directories and CSV files -----
+# ---------------------------------------------------
+output_dirs = {}
+results_files = {}
+for mof in mofs:
+    run_name = generate_unique_run_name()
+    output_dir = 'output_' + mof + '_%s' % run_name
+    os.makedirs(output_dir)
+    output_dirs[mof] = output_dir
+    f = open(os.path.join(output_dir, mof+'.csv'),'w',newline='')
+    writer = csv.writer(f, delimiter='\t')
+    writer.writerow(results_header(gases))
+    f.flush()
+    results_files[(mof, output_dir)] = f
+
+# --- Run IDs are those the full grid would get from write_simulations.py ---
+def grid_run_id(i, j, k):
+    return (i * len(pressures) + j) * len(compositions) + k
+
+def grid_simulation(i, j, k):
+    return (grid_run_id(i, j, k), mofs[i], unit_cells[i], pressures[j], compositions[k], output_dirs[mofs[i]])
+
+def job_failed(job):
+    # the SQLite queue returns job IDs and the Redis queue rq jobs
+    if isinstance(job_queue, SQLiteJobQueue):
+        return job_queue.status(job) == 'failed'
+    return job.is_failed
+
+def wait_for_jobs(jobs):
+    """
+    Waits until every job has written its results rows, has failed or the wait is longer than
+    --wait-hours. Returns the run IDs still without results, of the failed jobs and any left
+    waiting at the timeout.
+    """
+    deadline = time.time() + args.wait_hours * 3600
+    while True:
+        completed = {mof: read_completed_run_ids(output_dirs[mof]) for mof in mofs}
+        missing = []
+        for job, chain in jobs:
+            # run IDs of a job of packed pressures are lists
+            run_ids = set(np.ravel([simulation[0] for simulation in chain]).tolist()) - completed[chain[0][1]]
+            if run_ids:
+                missing.append((job, run_ids))
+        failed = [job for job, run_ids in missing if job_failed(job)]
+        if len(failed) == len(missing):
+            if failed:
+                print("  %s job(s) failed" % len(failed))
+            break
+        if time.time() > deadline:
+            print("  Stopped waiting after %s hours with %s job(s) failed and %s unfinished" %
+                  (args.wait_hours, len(failed), len(missing) - len(failed)))
+            break
+        time.sleep(args.poll_seconds)
+    return set().union(*[run_ids for job, run_ids in missing])
+
+def read_simulated_values(i, j, column):
+    # values of a results column at the compositions simulated so far, by composition index
+    rows = {int(row[0]): row for row in read_results_rows(output_dirs[mofs[i]])}
+    values = {}
+    for k in selected[(i, j)]:
+        row = rows.get(grid_run_id(i, j, k))
+        if row is not None:
+            values[k] = (float(row[column]), float(row[column + 1]))
+    return values
+
+def fit_column(i, j, column):
+    values = read_simulated_values(i, j, column)
+    simulated = sorted(values)
+    return fit_surrogate(features[simulated], np.array([values[k][0] for k in simulated]), np.array([values[k][1] for k in simulated]))
+
+# ------------------------------------------------------------
+# ----- Simulate batches until every surrogate converges -----
+# ------------------------------------------------------------
+selected = {(i, j): [] for i in range(len(mofs)) for j in range(len(pressures))}
+# compositions whose jobs failed or timed out, which are not picked again
+dropped = {key: set() for key in selected}
+batch = {key: seed_design(features, args.seed_points) for key in selected}
+for round_number in range(args.max_rounds + 1):
+    # --- Record and run the new batch ---
+    simulations = []
+    for (i, j), indices in batch.items():
+        selected[(i, j)].extend(indices)
+        simulations.extend([grid_simulation(i, j, k) for k in indices])
+    for i, mof in enumerate(mofs):
+        write_manifest(output_dirs[mof], [grid_simulation(i, j, k) for j in range(len(pressures)) for k in selected[(i, j)]], gases)
+    print("Round %s: simulating %s compositions" % (round_number, len(simulations)))
+    jobs = submit_simulations(simulations, gases, job_queue, results_files, args)
+
+    # --- Wait for queued jobs, dropping the compositions of failed or unfinished ones ---
+    missing = wait_for_jobs(jobs)
+    if missing:
+        for (i, j), indices in selected.items():
+            dropped_indices = [k for k in indices if grid_run_id(i, j, k) in missing]
+            if dropped_indices:
+                print("  Dropping %s composition(s) of %s at %s Pa without results" % (len(dropped_indices), mofs[i], pressures[j]))
+                dropped[(i, j)].update(dropped_indices)
+                indices[:] = [k for k in indices if k not in dropped[(i, j)]]
+        for i, mof in enumerate(mofs):
+            write_manifest(output_dirs[mof], [grid_simulation(i, j, k) for j in range(len(pressures)) for k in selected[(i, j)]], gases)
+
+    # --- Fit the surrogates and pick the next batch where they are least certain ---
+    batch = {}
+    for (i, j), indices in selected.items():
+        candidates = [k for k in range(len(compositions)) if k not in indices and k not in dropped[(i, j)]]
+        if not indices:
+            print("  %s at %s Pa: no compositions simulated" % (mofs[i], pressures[j]))
+            continue
+        if not candidates:
+            continue
+        surrogate = fit_column(i, j, 2)
+        mean, std = predict_surrogate(surrogate, features)
+        accuracy = np.max(std[candidates]) / max(np.max(np.abs(mean)), 1e-12)
+        print("  %s at %s Pa: %s simulated, largest relative uncertainty %.4f" % (mofs[i], pressures[j], len(indices), accuracy))
+        if accuracy > args.target_accuracy:
+            batch[(i, j)] = select_batch(surrogate, features, candidates, args.batch_size)
+    if not batch:
+        break
+else:
+    print("Stopped after %s rounds without reaching the target accuracy everywhere" % args.max_rounds)
+
+for f in results_files.values():
+    f.close()
+
+# -------------------------------------------------------------------
+# ----- Write the surrogate predictions over the whole grid -----
+# -------------------------------------------------------------------
+mass_columns = [2] + [4 + 2 * g for g in range(len(gases))]
+for i, mof in enumerate(mofs):
+    with open(os.path.join(output_dirs[mof], mof + '_surrogate.csv'), 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(results_header(gases)[:-2] + ['pressure', 'simulated'])
+        for j in range(len(pressures)):
+            if not selected[(i, j)]:
+                continue
+            predictions = [predict_surrogate(fit_column(i, j, column), features) for column in mass_columns]
+            for k in range(len(compositions)):
+                row = [grid_run_id(i, j, k), mof]
+                for mean, std in predictions:
+                    row.extend([mean[k], std[k]])
+                row.extend([compositions[k][gas] for gas in gases])
+                row.extend([pressures[j], int(k in selected[(i, j)])])
+                writer.writerow(row)
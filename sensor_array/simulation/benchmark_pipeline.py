@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# ----------------------------------
+# ----- Import Python Packages -----
+# ----------------------------------
+import argparse
+import csv
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from sensor_array_mof_adsorption import (results_header,
+                                         write_manifest,
+                                         add_submission_arguments,
+                                         submit_simulations)
+from sqlite_job_queue import SQLiteJobQueue
+
+# ----------------------------
+# ----- System Arguments -----
+# ----------------------------
+parser = argparse.ArgumentParser(description="Measure the overhead of the simulation pipeline by running synthetic campaigns with the fake simulator, "
+                                             "locally and through a SQLite job queue.")
+parser.add_argument('--mofs', type=int, default=10, help="number of synthetic MOFs (default: 10)")
+parser.add_argument('--compositions', type=int, default=100, help="number of CO2/N2 compositions (default: 100)")
+parser.add_argument('--pressures', type=int, default=1, help="number of pressures (default: 1)")
+parser.add_argument('--sleep', type=float, default=0.0, help="seconds the fake simulator sleeps per 1000 cycles and unit cell (default: 0)")
+parser.add_argument('--modes', nargs='+', choices=['local', 'queue'], default=['local', 'queue'], help="paths to benchmark (default: both)")
+parser.add_argument('--directory', default=None, help="directory to create the campaigns in (default: a temporary directory)")
+add_submission_arguments(parser)
+args = parser.parse_args()
+
+SIMULATION_DIR = os.path.dirname(os.path.abspath(__file__))
+GASES = ['CO2', 'N2']
+
+# --------------------------------------------
+# ----- Setup and run synthetic campaigns -----
+# --------------------------------------------
+def setup_campaign(campaign_dir):
+    """
+    Writes a configuration selecting the fake simulator to campaign_dir, creates an output directory
+    and results file per MOF, and returns the list of simulations along with the open results files.
+    """
+    os.makedirs(os.path.join(campaign_dir, 'config_files'))
+    with open(os.path.join(campaign_dir, 'config_files', 'write_comps_config.yaml'), 'w') as f:
+        f.write("Forcefield_Gas_Names:\n  CO2: CO2\n  N2: N2\n"
+                "Simulator: fake\nFakeSimulator:\n  Sleep: %s\n  HenryCoefficients:\n    CO2: 1.0e-4\n    N2: 1.0e-5\n" % args.sleep)
+
+    compositions = [{'CO2': "%.6f" % x, 'N2': "%.6f" % (1 - x)} for x in np.linspace(0, 1, args.compositions)]
+    pressures = list(np.logspace(4, 6, args.pressures)) if args.pressures > 1 else [1e5]
+    simulations = []
+    results_files = {}
+    for i in range(args.mofs):
+        mof = 'MOF%s' % i
+        output_dir = 'output_%s' % mof
+        os.makedirs(os.path.join(campaign_dir, output_dir))
+        results_files[(mof, output_dir)] = open(os.path.join(campaign_dir, output_dir, mof + '.csv'), 'w', newline='')
+        csv.writer(results_files[(mof, output_dir)], delimiter='\t').writerow(results_header(GASES))
+        mof_simulations = []
+        for pressure in pressures:
+            for composition in compositions:
+                mof_simulations.append((len(simulations) + len(mof_simulations), mof, "%s 1 1" % (1 + i % 3), float(pressure), composition, output_dir))
+        write_manifest(os.path.join(campaign_dir, output_dir), mof_simulations, GASES)
+        simulations.extend(mof_simulations)
+    return simulations, results_files
+
+
+def run_campaign(mode, campaign_dir):
+    # simulations use paths relative to the campaign, like write_simulations.py run from it
+    os.makedirs(campaign_dir)
+    os.chdir(campaign_dir)
+    simulations, results_files = setup_campaign(campaign_dir)
+    start_time = time.time()
+    if mode == 'local':
+        submit_simulations(simulations, GASES, None, results_files, args)
+    else:
+        submit_simulations(simulations, GASES, SQLiteJobQueue('jobs.db'), results_files, args)
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join([SIMULATION_DIR, os.environ.get('PYTHONPATH', '')]))
+        workers = [subprocess.Popen([sys.executable, os.path.join(SIMULATION_DIR, 'sqlite_worker.py'), 'jobs.db', '--burst'],
+                                    env=environment, stdout=subprocess.DEVNULL)
+                   for _ in range(args.workers if args.workers is not None else args.jobs)]
+        for worker in workers:
+            worker.wait()
+    seconds = time.time() - start_time
+    for f in results_files.values():
+        f.close()
+    return len(simulations), seconds
+
+
+def report(mode, num_simulations, seconds, campaign_dir):
+    events = []
+    for filename in glob.glob(os.path.join(campaign_dir, 'output_*', 'telemetry', '*.jsonl')):
+        with open(filename) as f:
+            events.extend([json.loads(line) for line in f])
+    simulation_events = [event for event in events if event['event'] == 'simulation']
+    job_events = [event for event in events if event['event'] == 'job']
+    parallel = args.jobs if mode == 'local' else (args.workers if args.workers is not None else args.jobs)
+    simulator_seconds = sum([event['stages'].get('raspa', 0.0) for event in simulation_events])
+
+    print("\n%s: %s simulations in %s jobs on %s process(es) in %.2f s" % (mode, num_simulations, len(job_events), parallel, seconds))
+    print("  throughput:        %.1f simulations/s, %.1f jobs/s" % (num_simulations / seconds, len(job_events) / seconds))
+    print("  overhead:          %.1f ms per simulation outside of the simulator (wall time x processes)" % (
+          1000 * (seconds * parallel - simulator_seconds) / num_simulations))
+    stage_totals = {}
+    for event in simulation_events:
+        for stage, stage_seconds in event['stages'].items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + stage_seconds
+    print("  within run():      " + ", ".join(["%s %.2f ms" % (stage, 1000 * total / num_simulations) for stage, total in sorted(stage_totals.items())]))
+
+
+base_dir = os.path.abspath(args.directory) if args.directory is not None else tempfile.mkdtemp(prefix='benchmark_pipeline_')
+print("Benchmarking in %s" % base_dir)
+for mode in args.modes:
+    campaign_dir = os.path.join(base_dir, mode)
+    num_simulations, seconds = run_campaign(mode, campaign_dir)
+    report(mode, num_simulations, seconds, campaign_dir)
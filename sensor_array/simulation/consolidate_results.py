@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# ----------------------------------
+# ----- Import Python Packages -----
+# ----------------------------------
+import argparse
+import csv
+import glob
+import os
+
+import numpy as np
+
+from sensor_array_mof_adsorption import (read_manifest,
+                                         read_results_rows)
+
+# ----------------------------
+# ----- System Arguments -----
+# ----------------------------
+parser = argparse.ArgumentParser(description="Merge the results of every worker in one or more output directories into a single "
+                                             "deduplicated results store (NPZ) for the array analysis.")
+parser.add_argument('output_dirs', nargs='+', help="output directories written by write_simulations.py")
+parser.add_argument('-o', '--output', default='results.npz', help="results store to write (default: results.npz)")
+parser.add_argument('--compress', action='store_true',
+                    help="compress the store; smaller, but the analysis can no longer memory-map it")
+args = parser.parse_args()
+
+# --------------------------------------------
+# ----- Read the gases, manifest and rows -----
+# --------------------------------------------
+def read_header_gases(output_dir):
+    """
+    Gases from the header of the results file of the MOF, for output directories without a
+    manifest, and whether it has the layout of results written before the total and component
+    masses were recorded (Run ID, MOF, Mass, <gases>). Returns (None, False) without a header.
+    """
+    for filename in glob.glob(os.path.join(output_dir, '*.csv')):
+        with open(filename, newline='') as csvfile:
+            header = next(csv.reader(csvfile, delimiter='\t'), [])
+        if header[:3] == ['Run ID', 'MOF', 'Mass']:
+            return header[3:], True
+        if header[:1] == ['Run ID']:
+            return [column[:-len('_comp')] for column in header if column.endswith('_comp')], False
+    return None, False
+
+
+def convert_old_row(row, num_gases):
+    # a row of the old layout (Run ID, MOF, Mass, <compositions>) in the layout of results_header,
+    # without the errors, component masses, cycles and seconds it did not record
+    return row[:3] + [''] * (1 + 2 * num_gases) + row[3:3 + num_gases] + ['', '']
+
+
+def composition_key(values):
+    # compositions are written as text, so compare them as rounded floats
+    return tuple([round(float(value), 10) for value in values])
+
+
+# Run IDs start from 0 in every campaign, so rows are told apart by their output directory
+# (campaign), listed once each in the order given.
+campaigns = list(dict.fromkeys([os.path.normpath(output_dir) for output_dir in args.output_dirs]))
+gases = None
+pressures = {}
+compositions_in_order = []
+rows = []
+row_campaigns = []
+for campaign, output_dir in enumerate(campaigns):
+    old_layout = False
+    if os.path.exists(os.path.join(output_dir, 'manifest.csv')):
+        dir_gases, simulations = read_manifest(output_dir)
+        for run_id, mof, _, pressure, composition, _ in sorted(simulations, key=lambda simulation: simulation[0]):
+            pressures[(mof, campaign, run_id)] = pressure
+            compositions_in_order.append(composition_key([composition[gas] for gas in dir_gases]))
+    else:
+        dir_gases, old_layout = read_header_gases(output_dir)
+    if dir_gases is None:
+        print("Skipping %s: no manifest or results header to read the gases from" % output_dir)
+        continue
+    if gases is None:
+        gases = dir_gases
+    elif dir_gases != gases:
+        raise SystemExit("%s has gases %s, but %s has %s" % (output_dir, dir_gases, campaigns[0], gases))
+    dir_rows = read_results_rows(output_dir)
+    if old_layout:
+        dir_rows = [convert_old_row(row, len(dir_gases)) if len(row) == 3 + len(dir_gases) else row for row in dir_rows]
+    rows.extend(dir_rows)
+    row_campaigns.extend([campaign] * len(dir_rows))
+
+if not rows:
+    raise SystemExit("No results in %s" % ", ".join(campaigns))
+
+# ----------------------------------------------------------
+# ----- Deduplicate, keeping the first row of every run -----
+# ----------------------------------------------------------
+num_gases = len(gases)
+unique_rows = {}
+for campaign, row in zip(row_campaigns, rows):
+    unique_rows.setdefault((row[1], campaign, int(row[0])), row)
+print("%s results rows, %s after removing duplicates" % (len(rows), len(unique_rows)))
+keys = sorted(unique_rows)
+rows = [unique_rows[key] for key in keys]
+
+# Compositions are numbered in the order of the compositions file (as recorded by the manifests), with any
+# composition missing from the manifests numbered after those, in order of campaign and run ID.
+compositions = [composition_key(row[4 + 2 * num_gases:4 + 3 * num_gases]) for row in rows]
+composition_ids = {}
+for composition in compositions_in_order + [compositions[i] for i in np.lexsort(([key[2] for key in keys], [key[1] for key in keys]))]:
+    composition_ids.setdefault(composition, len(composition_ids))
+
+# ------------------------------
+# ----- Write the columns -----
+# ------------------------------
+def column(index, dtype=float):
+    # a results column as a numpy array, with empty or missing fields (e.g. cycles and seconds of old results) as NaN
+    return np.array([float(row[index]) if len(row) > index and row[index] != '' else np.nan for row in rows]).astype(dtype)
+
+columns = {
+    'gases': np.array(gases),
+    'mof': np.array([row[1] for row in rows]),
+    'campaigns': np.array(campaigns),
+    'campaign': np.array([key[1] for key in keys], dtype=np.int64),
+    'run_id': np.array([int(row[0]) for row in rows], dtype=np.int64),
+    'pressure': np.array([pressures.get(key, np.nan) for key in keys]),
+    'composition_id': np.array([composition_ids[composition] for composition in compositions], dtype=np.int64),
+    'composition': np.array(compositions).reshape(len(rows), num_gases),
+    'total_mass': column(2),
+    'total_mass_error': column(3),
+    'component_mass': np.column_stack([column(4 + 2 * g) for g in range(num_gases)]),
+    'component_error': np.column_stack([column(5 + 2 * g) for g in range(num_gases)]),
+    'cycles': column(4 + 3 * num_gases),
+    'seconds': column(5 + 3 * num_gases),
+}
+(np.savez_compressed if args.compress else np.savez)(args.output, **columns)
+print("Wrote %s simulations of %s MOFs at %s compositions to %s" % (len(rows), len(set(columns['mof'])), len(composition_ids), args.output))
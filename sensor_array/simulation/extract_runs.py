@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+# ----------------------------------
+# ----- Import Python Packages -----
+# ----------------------------------
+import argparse
+
+from sensor_array_mof_adsorption import extract_run_archive
+
+# ----------------------------
+# ----- System Arguments -----
+# ----------------------------
+parser = argparse.ArgumentParser(description="Extract the archived RASPA files of individual runs from the compressed archives of an output directory.")
+parser.add_argument('output_dir', help="output directory written by write_simulations.py")
+parser.add_argument('run_ids', nargs='+', help="run IDs to extract")
+parser.add_argument('--destination', default='.', help="directory to extract the runs into (default: current directory)")
+args = parser.parse_args()
+
+for run_id in args.run_ids:
+    print("Extracted run %s to %s" % (run_id, extract_run_archive(args.output_dir, run_id, args.destination)))
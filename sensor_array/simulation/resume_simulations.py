@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# ----------------------------------
+# ----- Import Python Packages -----
+# ----------------------------------
+import argparse
+import os
+
+from sqlite_job_queue import SQLiteJobQueue
+from sensor_array_mof_adsorption import (read_manifest,
+                                         read_completed_run_ids,
+                                         add_submission_arguments,
+                                         submit_simulations,
+                                         sjs_job_queue)
+
+# ----------------------------
+# ----- System Arguments -----
+# ----------------------------
+parser = argparse.ArgumentParser(description="Queue (or run locally) only the simulations of a campaign that have no results yet.")
+parser.add_argument('output_dirs', nargs='+', help="output directories written by write_simulations.py")
+add_submission_arguments(parser)
+args = parser.parse_args()
+
+# -------------------------------
+# ----- Setup the job queue -----
+# -------------------------------
+if args.queue is not None:
+    job_queue = SQLiteJobQueue(args.queue)
+else:
+    job_queue = sjs_job_queue()
+
+# -------------------------------------------------
+# ----- Compare the manifests with the results -----
+# -------------------------------------------------
+# the gases of every output directory are those of its own manifest, so campaigns of different gases are
+# submitted separately
+simulations_by_gases = {}
+results_files = {}
+for output_dir in args.output_dirs:
+    gases, expected_simulations = read_manifest(output_dir)
+    completed_run_ids = read_completed_run_ids(output_dir)
+    missing_simulations = [simulation for simulation in expected_simulations if simulation[0] not in completed_run_ids]
+    print("%s: %s of %s runs missing" % (output_dir, len(missing_simulations), len(expected_simulations)))
+    simulations_by_gases.setdefault(tuple(gases), []).extend(missing_simulations)
+
+    # ----- Local runs append to the results file of the MOF in this output directory -----
+    for mof in set([simulation[1] for simulation in missing_simulations]):
+        results_files[(mof, output_dir)] = open(os.path.join(output_dir, mof+'.csv'),'a',newline='')
+
+# -----------------------------------------------
+# ----- Add jobs to job queue (or run here) -----
+# -----------------------------------------------
+for gases, simulations in simulations_by_gases.items():
+    if simulations:
+        submit_simulations(simulations, list(gases), job_queue, results_files, args)
+
+for f in results_files.values():
+    f.close()
@@ -3,12 +3,36 @@
 # --------------------------------------------
 import csv
 from datetime import datetime
+from functools import lru_cache, partial, reduce
+import glob
+import hashlib
+import heapq
+import json
+import math
+import multiprocessing
+import operator
 import os
+import queue
+import re
 import subprocess
 import shutil
+import tarfile
 from textwrap import dedent
+import threading
+import time
+
+import numpy as np
 import yaml
 
+DEFAULT_CONFIG_FILE = 'config_files/write_comps_config.yaml'
+WARM_START_CHAIN_LENGTH = 20
+NUMBER_OF_CYCLES = 2000
+ARCHIVE_RETENTION = ['full', 'essential', 'results']
+# Permanent location that workers running from node scratch copy their results and archives back to
+WRITE_BACK_VARIABLE = 'SENSOR_ARRAY_WRITE_BACK'
+WRITE_BACK_BATCH_SIZE = 32
+WRITE_BACK_QUEUE_SIZE = 256
+
 # -----------------------------------------
 # ----- User Defined Python Functions -----
 # -----------------------------------------
@@ -53,23 +77,60 @@ def read_pressure_configuration(filename):
         return pressures
 
 
+def write_manifest(output_dir, simulations, gases):
+    """
+    Writes every simulation expected in output_dir, one row per run ID with its MOF, unit cells,
+    pressure and composition, so a campaign can later be resumed from what is missing.
+    """
+    with open(os.path.join(output_dir, 'manifest.csv'), 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter='\t')
+        writer.writerow(['Run ID', 'MOF', 'Unit Cells', 'Pressure', *gases])
+        for run_id, mof, unit_cell, pressure, composition, _ in simulations:
+            writer.writerow([run_id, mof, unit_cell, pressure, *[composition[gas] for gas in gases]])
+
+
+def read_manifest(output_dir):
+    with open(os.path.join(output_dir, 'manifest.csv'), newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter='\t')
+        gases = reader.fieldnames[4:]
+        simulations = [(int(row['Run ID']), row['MOF'], row['Unit Cells'], float(row['Pressure']),
+                        {gas: row[gas] for gas in gases}, output_dir) for row in reader]
+    return gases, simulations
+
+
+def read_results_rows(output_dir):
+    """
+    Results rows in output_dir, both from the results file of the MOF (written when running locally)
+    and from the per-process results files (written by queued jobs), without headers.
+    """
+    # predictions of adaptive_simulations.py are not results
+    filenames = [filename for filename in glob.glob(os.path.join(output_dir, '*.csv'))
+                 if os.path.basename(filename) != 'manifest.csv' and not filename.endswith('_surrogate.csv')]
+    filenames.extend(glob.glob(os.path.join(output_dir, 'results', '*.csv')))
+    rows = []
+    for filename in filenames:
+        with open(filename, newline='') as csvfile:
+            rows.extend([row for row in csv.reader(csvfile, delimiter='\t') if row and row[0].isdigit()])
+    return rows
+
+
+def read_completed_run_ids(output_dir):
+    # run IDs with a results row in output_dir
+    return set([int(row[0]) for row in read_results_rows(output_dir)])
+
+
 def yaml_loader(filepath):
     with open(filepath, 'r') as yaml_file:
-        data = yaml.load(yaml_file)
+        data = yaml.safe_load(yaml_file)
     return(data)
 
 
-def write_raspa_file(filename, mof, unit_cell, pressure, gases, composition, config_file):
-    config_data = yaml_loader(config_file)
-    gas_names_def = config_data['Forcefield_Gas_Names']
-    f = open(filename,'w',newline='')
-
-    simulation_file_header = """\
+SIMULATION_FILE_HEADER = """\
 	SimulationType                MonteCarlo
-	NumberOfCycles                2000
-	NumberOfInitializationCycles  1000
+	NumberOfCycles                %s
+	NumberOfInitializationCycles  %s
 	PrintEvery                    200
-
+%s
 	ChargeMethod                  Ewald
 	CutOff                        12.0
 	Forcefield                    JennaUFF2
@@ -82,15 +143,9 @@ def write_raspa_file(filename, mof, unit_cell, pressure, gases, composition, con
 	UseChargesFromCIFFile yes
 	ExternalTemperature 298.0
 	ExternalPressure %s
-	""" % (mof, unit_cell, pressure)
-
-    f.write(dedent(simulation_file_header))
+	"""
 
-    component_number = 0
-    for gas in gases:
-        gas_name = gas_names_def[gas]
-        mole_fraction = composition[gas]
-        simulation_file_gas = """
+SIMULATION_FILE_GAS = """
     Component %s MoleculeName              %s
                  MoleculeDefinition         TraPPE-Zhang
                  MolFraction                %s
@@ -102,45 +157,580 @@ def write_raspa_file(filename, mof, unit_cell, pressure, gases, composition, con
                  SwapProbability            1.0
                  CreateNumberOfMolecules    0
 
-                 """ % (component_number, gas_name, mole_fraction)
+                 """
+
+
+class RaspaInputRenderer:
+    """
+    Renders RASPA simulation.input files. The configuration file is read once, and the header of
+    every MOF and the component block of every set of gases are dedented into templates once, so
+    rendering an input only fills in the cycles, pressure and mole fractions. The output is
+    identical to formatting the whole input for every simulation.
+    """
+
+    def __init__(self, config_file):
+        self.config_data = yaml_loader(config_file)
+        # changes with anything rendering depends on besides the simulation, naming staged inputs
+        with open(config_file, 'rb') as f:
+            self.digest = hashlib.sha256(f.read() + (SIMULATION_FILE_HEADER + SIMULATION_FILE_GAS).encode()).hexdigest()[:12]
+        self.gas_names_def = self.config_data['Forcefield_Gas_Names']
+        self.header_templates = {}
+        self.component_templates = {}
+
+    def header_template(self, mof, unit_cell, restart):
+        key = (mof, unit_cell, restart)
+        if key not in self.header_templates:
+            # Start from the configuration in RestartInitial/System_0 instead of an empty framework
+            restart_line = "\tRestartFile                   yes\n" if restart else ""
+            self.header_templates[key] = dedent(SIMULATION_FILE_HEADER % ('%s', '%s', restart_line, mof.replace('%', '%%'),
+                                                                          unit_cell.replace('%', '%%'), '%s'))
+        return self.header_templates[key]
+
+    def component_template(self, gases):
+        key = tuple(gases)
+        if key not in self.component_templates:
+            self.component_templates[key] = "".join([dedent(SIMULATION_FILE_GAS % (i, self.gas_names_def[gas].replace('%', '%%'), '%s'))
+                                                     for i, gas in enumerate(gases)])
+        return self.component_templates[key]
+
+    def render(self, mof, unit_cell, pressure, gases, composition, cycles=NUMBER_OF_CYCLES, init_cycles=1000, restart=False):
+        # A list of pressures is simulated one after the other within the same RASPA run
+        if isinstance(pressure, list):
+            pressure = " ".join(["%s" % p for p in pressure])
+        header = self.header_template(mof, unit_cell, restart) % (cycles, init_cycles, pressure)
+        return header + self.component_template(gases) % tuple([composition[gas] for gas in gases])
+
+    def write(self, filename, *args, **kwargs):
+        with open(filename, 'w', newline='') as f:
+            f.write(self.render(*args, **kwargs))
+
 
-        f.write(dedent(simulation_file_gas))
-        component_number += 1
+@lru_cache(maxsize=None)
+def get_renderer(config_file):
+    # one renderer per configuration file and process
+    return RaspaInputRenderer(config_file)
 
-    f.close()
+
+def write_raspa_file(filename, mof, unit_cell, pressure, gases, composition, config_file, cycles=NUMBER_OF_CYCLES, init_cycles=1000, restart=False):
+    get_renderer(config_file).write(filename, mof, unit_cell, pressure, gases, composition, cycles=cycles, init_cycles=init_cycles, restart=restart)
+
+
+def staged_input_filename(output_dir, run_id, cycles, digest):
+    # inputs staged with another configuration file (see RaspaInputRenderer.digest) are not used
+    return os.path.join(output_dir, 'inputs', "%s_%s_%s.input" % (run_descriptor(run_id), cycles, digest))
+
+
+def stage_inputs(simulations, gases, cycles, config_file=DEFAULT_CONFIG_FILE):
+    """
+    Renders the input of every simulation, as run() would for a simulation that is not warm
+    started, into the inputs directory of its output directory, so workers copy the file instead
+    of rendering it. The file names carry the digest of the configuration, so inputs staged before
+    the configuration file was edited are rendered again by run().
+    """
+    renderer = get_renderer(config_file)
+    for run_id, mof, unit_cell, pressure, composition, output_dir in simulations:
+        os.makedirs(os.path.join(output_dir, 'inputs'), exist_ok=True)
+        renderer.write(staged_input_filename(output_dir, run_id, cycles, renderer.digest), mof, unit_cell, pressure, gases, composition, cycles=cycles)
+
+
+def read_raspa_input(filename):
+    """
+    Reads the settings of a simulation.input written by write_raspa_file that the fake simulator
+    needs: the framework, unit cells, pressures, cycles and each component with its mole fraction.
+    """
+    settings = {'components': []}
+    with open(filename) as f:
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] in ['FrameworkName', 'UnitCells', 'ExternalPressure', 'ExternalTemperature', 'NumberOfCycles', 'NumberOfInitializationCycles']:
+                settings[words[0]] = words[1:]
+            elif words[0] == 'Component':
+                settings['components'].append({'name': words[3]})
+            elif words[0] == 'MolFraction':
+                settings['components'][-1]['mole_fraction'] = float(words[1])
+    return settings
+
+
+def fake_henry_coefficient(mof, molecule, henry_coefficients):
+    """
+    Henry's coefficient [mg/g framework per Pa] of a molecule in a framework for the fake simulator:
+    the coefficient of the molecule from the configuration (1e-5 if not given), scaled by a factor
+    between 0.5 and 1.5 fixed by the names of the framework and molecule, so frameworks differ.
+    """
+    digest = hashlib.sha256(("%s %s" % (mof, molecule)).encode()).digest()
+    return henry_coefficients.get(molecule, 1e-5) * (0.5 + digest[0] / 255)
+
+
+def fake_simulate(working_dir, fake_settings):
+    """
+    Deterministic stand-in for RASPA, for measuring the rest of the pipeline. Reads the
+    simulation.input in working_dir and writes a RASPA-style output file per pressure, with the
+    loading of each component from Henry's law (see fake_henry_coefficient) and an error of
+    RelativeError (default 0.02) at 1000 cycles, shrinking with the square root of the cycles, plus
+    restart files. It sleeps Sleep seconds (default 0) per 1000 cycles and unit cell.
+    """
+    settings = read_raspa_input(os.path.join(working_dir, 'simulation.input'))
+    mof = settings['FrameworkName'][0]
+    cycles = int(settings['NumberOfCycles'][0])
+    total_cycles = cycles + int(settings['NumberOfInitializationCycles'][0])
+    unit_cell = ".".join(settings['UnitCells'])
+    temperature = float(settings['ExternalTemperature'][0])
+    relative_error = fake_settings.get('RelativeError', 0.02) * math.sqrt(1000 / cycles)
+    time.sleep(fake_settings.get('Sleep', 0.0) * total_cycles / 1000 * number_of_unit_cells(" ".join(settings['UnitCells'])))
+
+    for directory in ['Output', 'Restart']:
+        os.makedirs(os.path.join(working_dir, directory, 'System_0'), exist_ok=True)
+    for pressure in settings['ExternalPressure']:
+        name = "%s_%s_%f_%g" % (mof, unit_cell, temperature, float(pressure))
+        with open(os.path.join(working_dir, 'Output', 'System_0', 'output_%s.data' % name), 'w') as f:
+            f.write("Fake simulation of %s at %s Pa\n\n" % (mof, pressure))
+            for i, component in enumerate(settings['components']):
+                henry_coefficient = fake_henry_coefficient(mof, component['name'], fake_settings.get('HenryCoefficients', {}))
+                mass = henry_coefficient * component['mole_fraction'] * float(pressure)
+                f.write("Component %s [%s]\n" % (i, component['name']))
+                f.write("\tAverage loading absolute [milligram/gram framework] %18.10f +/- %18.10f [-]\n\n" % (mass, mass * relative_error))
+        with open(os.path.join(working_dir, 'Restart', 'System_0', 'restart_%s' % name), 'w') as f:
+            f.write("Fake restart file of %s at %s Pa\n" % (mof, pressure))
+
+
+def run_simulator(working_dir, config_data):
+    # the Simulator key of the configuration picks RASPA (default) or the fake simulator
+    if config_data.get('Simulator', 'raspa') == 'fake':
+        fake_simulate(working_dir, config_data.get('FakeSimulator', {}))
+    else:
+        subprocess.run(['simulate', 'simulation.input'], check=True, cwd=working_dir)
+
+
+COMPONENT_LINE = re.compile(r"^\s*Component (\d+) \[(.*)\]")
+LOADING_LINE = re.compile(r"Average loading absolute \[milligram/gram framework\]\s+(\S+)\s+\+/-\s+(\S+)")
 
 
 def parse_output(output_file):
-    mass = float(subprocess.check_output(['./calculate_mass.sh', output_file]))
-    return mass
+    """
+    Reads a RASPA output file (or a glob pattern matching exactly one file) in a single pass and
+    returns the absolute loading [mg/g framework] and its error for each component, in component
+    order, along with the total mass. The error of the total mass assumes the components are
+    independent, so the component errors are summed in quadrature.
+    """
+    output_files = glob.glob(output_file)
+    if len(output_files) != 1:
+        raise ValueError("Expected one RASPA output file for %s, found %s" % (output_file, len(output_files)))
+
+    component_names = []
+    component_masses = []
+    component_errors = []
+    current_component = None
+    with open(output_files[0]) as f:
+        for line in f:
+            component_match = COMPONENT_LINE.match(line)
+            if component_match:
+                current_component = component_match.group(2)
+                continue
+            loading_match = LOADING_LINE.search(line)
+            if loading_match:
+                component_names.append(current_component)
+                component_masses.append(float(loading_match.group(1)))
+                component_errors.append(float(loading_match.group(2)))
+
+    return {'total_mass': sum(component_masses),
+            'total_mass_error': math.sqrt(sum([error**2 for error in component_errors])),
+            'component_names': component_names,
+            'component_masses': component_masses,
+            'component_errors': component_errors}
+
+
+def output_file_pressure(output_file):
+    # RASPA names its output files output_<framework>_<unit cells>_<temperature>_<pressure>.data
+    return float(os.path.basename(output_file)[:-len('.data')].rsplit('_', 1)[1])
+
+
+def parse_outputs(output_dir, pressures):
+    """
+    Splits the output of a RASPA run over several pressures, with one output file per pressure,
+    back into a result per pressure (see parse_output), in the order the pressures are given.
+    Files are matched to pressures by rank, since RASPA rounds the pressure in the file name.
+    """
+    output_files = sorted(glob.glob(os.path.join(output_dir, '*.data')), key=output_file_pressure)
+    if len(output_files) != len(pressures):
+        raise ValueError("Expected %s RASPA output files in %s, found %s" % (len(pressures), output_dir, len(output_files)))
+    results_by_rank = [parse_output(output_file) for output_file in output_files]
+    ranks = sorted(range(len(pressures)), key=lambda i: pressures[i])
+    results = [None] * len(pressures)
+    for rank, i in enumerate(ranks):
+        results[i] = results_by_rank[rank]
+    return results
+
+
+def parse_simulation_output(working_dir, pressure):
+    # a list of pressures gives a list of results
+    if isinstance(pressure, list):
+        return parse_outputs(os.path.join(working_dir, 'Output', 'System_0'), pressure)
+    return parse_output(os.path.join(working_dir, 'Output', 'System_0', '*.data'))
+
+
+def combine_segment_results(segments):
+    """
+    Combines the results (see parse_output) of consecutive segments of a simulation, all with the
+    same number of production cycles. Masses are averaged over the segments and, as the segments
+    are independent samples, their errors are summed in quadrature and divided by the number of
+    segments.
+    """
+    n = len(segments)
+    component_masses = [sum(masses) / n for masses in zip(*[segment['component_masses'] for segment in segments])]
+    component_errors = [math.sqrt(sum([error**2 for error in errors])) / n for errors in zip(*[segment['component_errors'] for segment in segments])]
+    return {'total_mass': sum(component_masses),
+            'total_mass_error': math.sqrt(sum([error**2 for error in component_errors])),
+            'component_names': segments[0]['component_names'],
+            'component_masses': component_masses,
+            'component_errors': component_errors}
+
+
+def relative_error(result):
+    if result['total_mass'] == 0:
+        return 0.0 if result['total_mass_error'] == 0 else float('inf')
+    return result['total_mass_error'] / abs(result['total_mass'])
+
+
+def results_header(gases):
+    header = ['Run ID', 'MOF', 'total_mass', 'total_mass_error']
+    for gas in gases:
+        header.extend([gas+'_mass', gas+'_error'])
+    header.extend([gas+'_comp' for gas in gases])
+    header.extend(['cycles', 'seconds'])
+    return header
+
+
+def results_row(run_id, mof, result, gases, composition):
+    row = [run_id, mof, result['total_mass'], result['total_mass_error']]
+    for mass, error in zip(result['component_masses'], result['component_errors']):
+        row.extend([mass, error])
+    row.extend([composition[gas] for gas in gases])
+    # results cached before cycles were recorded all ran the fixed number of cycles
+    row.append(result.get('cycles', NUMBER_OF_CYCLES))
+    row.append(result.get('seconds', ''))
+    return row
+
+
+def simulation_input_hash(filename, settings=''):
+    # settings that change the result without appearing in the input (e.g. convergence) extend the hash
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read() + settings.encode()).hexdigest()
+
+
+def cache_settings(config_data, convergence=None, restart=None):
+    """
+    Settings hashed along with simulation.input (see simulation_input_hash): the convergence
+    settings, and the simulator if it is not RASPA, so results of the fake simulator are never
+    returned for RASPA simulations of the same input (or for a fake simulator set up differently).
+    restart is the digest of the configuration a warm-started simulation starts from (see
+    restart_digest), as the same input started from different configurations gives different
+    results.
+    """
+    settings = {} if convergence is None else dict(convergence)
+    if restart is not None:
+        settings['restart'] = restart
+    if config_data.get('Simulator', 'raspa') != 'raspa':
+        settings['simulator'] = {'Simulator': config_data['Simulator'], 'FakeSimulator': config_data.get('FakeSimulator', {})}
+    return json.dumps(settings, sort_keys=True) if settings else ''
+
+
+def restart_digest(restart_dir):
+    # digest of the restart files in restart_dir, by name and contents
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(restart_dir)):
+        with open(os.path.join(restart_dir, name), 'rb') as f:
+            digest.update(name.encode() + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+def cached_result_filename(cache_dir, input_hash):
+    return os.path.join(cache_dir, input_hash[0:2], input_hash + '.json')
+
+
+def read_cached_result(cache_dir, input_hash):
+    """
+    Returns the cache entry, {'result': ..., 'archive': ..., 'member_dir': ...}, for a rendered
+    simulation.input, or None if that input has not been simulated before.
+    """
+    filename = cached_result_filename(cache_dir, input_hash)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return json.load(f)
+
+
+def write_cached_result(cache_dir, input_hash, result, archive, member_dir=None):
+    """
+    Stores the parsed result of a simulation along with the location of its archive and the
+    directory of the run within it. The entry is written to a temporary file first and then
+    renamed, so workers sharing a cache never read a partially written entry.
+    """
+    filename = cached_result_filename(cache_dir, input_hash)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temp_filename = "%s.%s.tmp" % (filename, generate_unique_per_process_filename())
+    with open(temp_filename, 'w') as f:
+        json.dump({'result': result, 'archive': archive, 'member_dir': member_dir}, f)
+    os.replace(temp_filename, filename)
+
+
+def run_descriptor(run_id):
+    # packed simulations have a list of run ids
+    if isinstance(run_id, list):
+        return "_".join(["%s" % i for i in run_id])
+    return "%s" % (run_id)
+
+
+def archive_members(working_dir, retention, restart=False):
+    """
+    Files of a finished simulation to keep in its archive, relative to working_dir: everything in
+    working_dir for 'full', the input and the RASPA output files (of every segment) for 'essential',
+    and nothing for 'results', which keeps only the results row and cache entry. restart also keeps
+    the final configuration (Restart/System_0) for 'essential', from which a warm-started chain
+    continues after a cache hit (see restore_restart_files).
+    """
+    if retention == 'results':
+        return []
+    if retention == 'full':
+        return sorted(os.listdir(working_dir))
+    output_files = glob.glob(os.path.join(working_dir, 'Output', 'System_0', '*.data'))
+    output_files.extend(glob.glob(os.path.join(working_dir, 'Segments', '*', 'System_0', '*.data')))
+    if restart:
+        output_files.extend(glob.glob(os.path.join(working_dir, 'Restart', 'System_0', '*')))
+    return ['simulation.input'] + sorted([os.path.relpath(f, working_dir) for f in output_files])
+
+
+def open_archive(output_dir, name):
+    archive_dir = os.path.join(output_dir, 'archive')
+    os.makedirs(archive_dir, exist_ok=True)
+    return tarfile.open(os.path.join(archive_dir, name + '.tar.gz'), 'w:gz')
+
+
+def write_archive_index(output_dir, rows):
+    # every process appends to an index of its own, like the results files of queued jobs
+    index_dir = os.path.join(output_dir, 'archive', 'index')
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, generate_unique_per_process_filename() + ".csv"), 'a', newline='') as f:
+        csv.writer(f, delimiter='\t').writerows(rows)
+
+
+def read_archive_index(output_dir):
+    """
+    Returns, for each archived run id (as a string), the tarball under output_dir/archive holding
+    its files and the directory they are stored below. Later archives of a run replace earlier ones.
+    """
+    index = {}
+    index_files = sorted(glob.glob(os.path.join(output_dir, 'archive', 'index', '*.csv')), key=os.path.getmtime)
+    for filename in index_files:
+        with open(filename, newline='') as f:
+            for run_id, tarball, member_dir in csv.reader(f, delimiter='\t'):
+                index[run_id] = (os.path.join(output_dir, 'archive', tarball), member_dir)
+    return index
+
+
+def extract_run_archive(output_dir, run_id, destination):
+    """
+    Extracts the archived files of a run into destination/<run>, using the archive index. Returns
+    the directory the files were extracted to.
+    """
+    index = read_archive_index(output_dir)
+    if str(run_id) not in index:
+        raise KeyError("Run %s has no archive in %s" % (run_id, output_dir))
+    tarball, member_dir = index[str(run_id)]
+    with tarfile.open(tarball, 'r:gz') as archive:
+        members = [member for member in archive.getmembers() if member.name.split('/')[0] == member_dir]
+        archive.extractall(destination, members=members)
+    return os.path.join(destination, member_dir)
+
+
+def restore_restart_files(archive_filename, member_dir, restart_dir):
+    """
+    Replaces the files in restart_dir by the final configuration (Restart/System_0) of a run in its
+    archive, for a cache hit within a warm-started chain. Returns False, leaving restart_dir as it
+    was, if the archive or the files are not there, e.g. for retention 'results', or an archive
+    still being written or written back.
+    """
+    if archive_filename is None or member_dir is None:
+        return False
+    prefix = member_dir + '/Restart/System_0/'
+    try:
+        with tarfile.open(archive_filename, 'r:gz') as archive:
+            contents = {member.name[len(prefix):]: archive.extractfile(member).read()
+                        for member in archive.getmembers() if member.name.startswith(prefix) and member.isfile()}
+    except (OSError, EOFError, tarfile.TarError):
+        return False
+    if not contents:
+        return False
+    shutil.rmtree(restart_dir, ignore_errors=True)
+    os.makedirs(restart_dir)
+    for name, data in contents.items():
+        with open(os.path.join(restart_dir, name), 'wb') as f:
+            f.write(data)
+    return True
+
+
+def archive_run(working_dir, output_dir, run_id, retention='essential', archive=None, restart=False):
+    """
+    Adds the files of a finished simulation (see archive_members) to a compressed tarball under
+    output_dir/archive, below a directory named after the run, and records it in the archive index.
+    archive is an open tarball shared by a chain of simulations; without one, the run is written to
+    a tarball of its own. Returns the path of the tarball, or None if nothing is kept; with
+    SENSOR_ARRAY_WRITE_BACK set, the path it is written back to. restart is passed to
+    archive_members.
+    """
+    members = archive_members(working_dir, retention, restart)
+    if not members:
+        return None
+    member_dir = run_descriptor(run_id)
+    own_archive = archive is None
+    if own_archive:
+        archive = open_archive(output_dir, member_dir)
+    try:
+        for member in members:
+            archive.add(os.path.join(working_dir, member), arcname=os.path.join(member_dir, member))
+    finally:
+        if own_archive:
+            archive.close()
+    run_ids = run_id if isinstance(run_id, list) else [run_id]
+    write_archive_index(output_dir, [[i, os.path.basename(archive.name), member_dir] for i in run_ids])
+    # a worker on node scratch copies the tarball back (see start_write_back), where it outlives the job
+    if os.environ.get(WRITE_BACK_VARIABLE):
+        return write_back_filename(archive.name, os.environ[WRITE_BACK_VARIABLE])
+    return os.path.abspath(archive.name)
 
 
-def run(run_id, mof, unit_cell, pressure, gases, composition, config_file, output_dir='output'):
-    # create unique working directory for this simulation
+def telemetry_filename(output_dir):
+    return os.path.join(output_dir, 'telemetry', generate_unique_per_process_filename() + ".jsonl")
+
+
+def write_telemetry_event(output_dir, event):
+    """
+    Appends an event, such as the stage timings of a simulation, as a line of JSON to the telemetry
+    log of this process in output_dir/telemetry (see summarize_telemetry.py).
+    """
+    os.makedirs(os.path.join(output_dir, 'telemetry'), exist_ok=True)
+    event = dict(event, worker=generate_unique_per_process_filename(), time=time.time())
+    with open(telemetry_filename(output_dir), 'a') as f:
+        f.write(json.dumps(event) + "\n")
+
+
+def record_stage(timings, stage, stage_start):
+    # adds the time since stage_start to the stage and returns the start of the next stage
+    now = time.time()
+    timings[stage] = timings.get(stage, 0.0) + now - stage_start
+    return now
+
+
+def run(run_id, mof, unit_cell, pressure, gases, composition, config_file, output_dir='output', cache_dir=None, restart_dir=None, warm_init_cycles=None,
+        convergence=None, retention='essential', archive=None):
+    """
+    Simulates a MOF at one composition and one pressure (or a list of pressures) and returns the
+    result of parse_output (or a list of them). convergence, a dict with keys target_error,
+    segment_cycles and max_cycles, runs RASPA in segments of segment_cycles production cycles, each
+    continuing from the final configuration of the previous one, until the relative error of the
+    total mass (at every pressure) is below target_error or max_cycles would be exceeded. The files
+    of the simulation are then archived according to retention (see archive_run). The time taken
+    by every stage is logged as a telemetry event.
+    """
+    timings = {}
+    stage_start = time.time()
+    event = {'event': 'simulation', 'run_id': run_id, 'mof': mof, 'unit_cell': unit_cell, 'pressure': pressure}
+
+    # create unique working directory for this simulation, clearing what a failed run left behind
     working_dir = os.path.join(output_dir, generate_unique_per_process_filename())
+    shutil.rmtree(working_dir, ignore_errors=True)
     os.makedirs(working_dir, exist_ok=True)
 
-    # run simulation
-    write_raspa_file(os.path.join(working_dir, "simulation.input"), mof, unit_cell, pressure, gases,composition, config_file)
-    subprocess.run(['simulate', 'simulation.input'], check=True, cwd=working_dir)
+    config_data = get_renderer(config_file).config_data
+
+    # warm start from the restart files the previous simulation of a chain left in restart_dir
+    warm_start = restart_dir is not None and os.path.isdir(restart_dir) and len(os.listdir(restart_dir)) > 0
+    if warm_start:
+        shutil.copytree(restart_dir, os.path.join(working_dir, 'RestartInitial', 'System_0'))
+
+    # skip the simulation if this exact input has been simulated before
+    input_filename = os.path.join(working_dir, "simulation.input")
+    cycles = NUMBER_OF_CYCLES if convergence is None else convergence['segment_cycles']
+    staged_input = staged_input_filename(output_dir, run_id, cycles, get_renderer(config_file).digest)
+    if warm_start:
+        write_raspa_file(input_filename, mof, unit_cell, pressure, gases, composition, config_file, cycles=cycles, init_cycles=warm_init_cycles, restart=True)
+    elif os.path.exists(staged_input):
+        shutil.copyfile(staged_input, input_filename)
+    else:
+        write_raspa_file(input_filename, mof, unit_cell, pressure, gases, composition, config_file, cycles=cycles)
+    stage_start = record_stage(timings, 'render', stage_start)
+    if cache_dir is not None:
+        restart = restart_digest(restart_dir) if warm_start else None
+        input_hash = simulation_input_hash(input_filename, cache_settings(config_data, convergence, restart))
+        cached = read_cached_result(cache_dir, input_hash)
+        # within a chain, a hit is only used if the next simulation can continue from its final configuration
+        if cached is not None and restart_dir is not None and \
+                not restore_restart_files(cached['archive'], cached.get('member_dir'), restart_dir):
+            cached = None
+        if cached is not None:
+            shutil.rmtree(working_dir)
+            record_stage(timings, 'cache', stage_start)
+            write_telemetry_event(output_dir, dict(event, cached=True, stages=timings, seconds=sum(timings.values())))
+            return cached['result']
+        stage_start = record_stage(timings, 'cache', stage_start)
+
+    # run simulation, in segments until converged if a convergence target is given
+    start_time = time.time()
+    segments = []
+    while True:
+        run_simulator(working_dir, config_data)
+        stage_start = record_stage(timings, 'raspa', stage_start)
+        segments.append(parse_simulation_output(working_dir, pressure))
+        stage_start = record_stage(timings, 'parse', stage_start)
+        if convergence is None:
+            result = segments[0]
+            break
+
+        if isinstance(pressure, list):
+            result = [combine_segment_results(list(pressure_segments)) for pressure_segments in zip(*segments)]
+            errors = [relative_error(pressure_result) for pressure_result in result]
+        else:
+            result = combine_segment_results(segments)
+            errors = [relative_error(result)]
+        cycles = len(segments) * convergence['segment_cycles']
+        if max(errors) <= convergence['target_error'] or cycles + convergence['segment_cycles'] > convergence['max_cycles']:
+            break
 
-    # parse data from simulation
-    data_filename = os.path.join(working_dir, 'Output', 'System_0', '*.data')
-    mass = parse_output(data_filename)
+        # continue from the final configuration without initialization cycles, keeping the output of each segment
+        os.makedirs(os.path.join(working_dir, 'Segments'), exist_ok=True)
+        shutil.move(os.path.join(working_dir, 'Output'), os.path.join(working_dir, 'Segments', 'Output_%s' % len(segments)))
+        shutil.rmtree(os.path.join(working_dir, 'RestartInitial'), ignore_errors=True)
+        shutil.copytree(os.path.join(working_dir, 'Restart', 'System_0'), os.path.join(working_dir, 'RestartInitial', 'System_0'))
+        write_raspa_file(input_filename, mof, unit_cell, pressure, gases, composition, config_file,
+                         cycles=convergence['segment_cycles'], init_cycles=0, restart=True)
+        stage_start = record_stage(timings, 'render', stage_start)
+
+    # wall time of RASPA, shared evenly by the pressures of a packed simulation
+    seconds = time.time() - start_time
+    for pressure_result in (result if isinstance(pressure, list) else [result]):
+        pressure_result['cycles'] = cycles
+        pressure_result['seconds'] = seconds / len(pressure) if isinstance(pressure, list) else seconds
+
+    # keep the final configuration to seed the next simulation of the chain
+    if restart_dir is not None:
+        shutil.rmtree(restart_dir, ignore_errors=True)
+        shutil.copytree(os.path.join(working_dir, 'Restart', 'System_0'), restart_dir)
 
     # archive data and configuration; delete working_dir
-    run_descriptor = "%s" % (run_id)
-    archive_dir = os.path.join(output_dir, 'archive', run_descriptor)
-    os.makedirs(archive_dir, exist_ok=True)
-    for f in ["Output", "simulation.input"]:
-        shutil.move(os.path.join(working_dir, f), archive_dir)
+    archive_filename = archive_run(working_dir, output_dir, run_id, retention=retention, archive=archive, restart=restart_dir is not None)
+    shutil.rmtree(working_dir)
+    stage_start = record_stage(timings, 'archive', stage_start)
 
-    shutil.rmtree(os.path.join(working_dir))
+    if cache_dir is not None:
+        write_cached_result(cache_dir, input_hash, result, archive_filename, run_descriptor(run_id))
+        record_stage(timings, 'cache', stage_start)
 
-    return (mass)
+    write_telemetry_event(output_dir, dict(event, cached=False, cycles=cycles, stages=timings, seconds=sum(timings.values())))
+    return result
 
 
-def run_composition_simulation(run_id, mof, pressure, gases, composition, csv_writer=None, output_dir='output'):
+def run_composition_simulation(run_id, mof, unit_cell, pressure, gases, composition, csv_writer=None, output_dir='output', config_file=DEFAULT_CONFIG_FILE, cache_dir=None):
     # ----- If there is no csv_writer passed, we write to a file that is unique to this process -----
     csv_file = None
     if csv_writer is None:
@@ -150,8 +740,487 @@ def run_composition_simulation(run_id, mof, pressure, gases, composition, csv_wr
         csv_file = open(filename,'a',newline='')
         csv_writer = csv.writer(csv_file, delimiter='\t')
     # ----- Run the simulation / Output the data -----
-    mass = run(run_id, mof, unit_cell, pressure, gases, composition, 'config_files/write_comps_config.yaml', output_dir=output_dir)
-    csv_writer.writerow([run_id, mof, mass, *[composition[gas] for gas in gases]])
+    result = run(run_id, mof, unit_cell, pressure, gases, composition, config_file, output_dir=output_dir, cache_dir=cache_dir)
+    csv_writer.writerow(results_row(run_id, mof, result, gases, composition))
     # ----- Close the file, if we opened it above -----
     if csv_file is not None:
         csv_file.close()
+
+
+def copy_file_atomically(filename, destination_filename):
+    os.makedirs(os.path.dirname(destination_filename), exist_ok=True)
+    temp_filename = "%s.%s.tmp" % (destination_filename, generate_unique_per_process_filename())
+    shutil.copy2(filename, temp_filename)
+    os.replace(temp_filename, destination_filename)
+
+
+def write_back_filename(filename, destination):
+    # where a file of the working directory is written back to: the same relative path under destination
+    return os.path.abspath(os.path.join(destination, os.path.relpath(filename)))
+
+
+def copy_pending_files(pending, destination):
+    """
+    Copies the files put on the pending queue to the same relative path under destination, taking
+    up to WRITE_BACK_BATCH_SIZE files from the queue at a time and copying each file only once per
+    batch, until it takes None off the queue.
+    """
+    done = False
+    while not done:
+        batch = [pending.get()]
+        while len(batch) < WRITE_BACK_BATCH_SIZE:
+            try:
+                batch.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        done = None in batch
+        for filename in dict.fromkeys([f for f in batch if f is not None]):
+            try:
+                copy_file_atomically(filename, write_back_filename(filename, destination))
+            except OSError as error:
+                print("Could not write back %s to %s: %s" % (filename, destination, error))
+
+
+def start_write_back(destination):
+    """
+    Starts a background thread copying finished results and archives from the working directory
+    of a worker (e.g. node scratch) to destination while the worker goes on simulating. Returns
+    the bounded queue of files to copy, which blocks the worker if the copies fall far behind, and
+    the thread, both to pass to write_back_files and stop_write_back.
+    """
+    pending = queue.Queue(maxsize=WRITE_BACK_QUEUE_SIZE)
+    thread = threading.Thread(target=copy_pending_files, args=(pending, destination), daemon=True)
+    thread.start()
+    return pending, thread
+
+
+def write_back_files(write_back, filenames):
+    pending, _ = write_back
+    for filename in filenames:
+        if os.path.exists(filename):
+            pending.put(filename)
+
+
+def stop_write_back(write_back):
+    # waits for every file passed so far to be copied
+    pending, thread = write_back
+    pending.put(None)
+    thread.join()
+
+
+def append_results_rows(output_dir, rows):
+    """
+    Appends results rows to the results file unique to this process in output_dir/results, and
+    returns its name.
+    """
+    results_dir = os.path.join(output_dir,'results')
+    os.makedirs(results_dir, exist_ok=True)
+    filename = os.path.join(results_dir, generate_unique_per_process_filename() + ".csv")
+    with open(filename,'a',newline='') as csv_file:
+        csv.writer(csv_file, delimiter='\t').writerows(rows)
+    return filename
+
+
+def write_job_event(simulations, start_time, enqueued_at, failed):
+    # the queue wait and duration of a job (or a chain run by the local pool)
+    write_telemetry_event(simulations[0][5], {'event': 'job', 'mof': simulations[0][1], 'run_ids': [simulation[0] for simulation in simulations],
+                                              'queue_wait': None if enqueued_at is None else start_time - enqueued_at,
+                                              'seconds': time.time() - start_time, 'failed': failed})
+
+
+def run_composition_simulation_chunk(simulations, gases, config_file=DEFAULT_CONFIG_FILE, cache_dir=None, warm_init_cycles=None, convergence=None, retention='essential',
+                                     enqueued_at=None):
+    """
+    Runs a chunk of simulations (see iterate_simulation_chain) for a single MOF one after the other,
+    as a single queued job. The results rows are appended to the file unique to this process in one
+    write once the chunk is done, or once a simulation fails, so completed rows are never lost.
+
+    If the environment variable SENSOR_ARRAY_WRITE_BACK names a directory, the worker is taken to
+    run from node scratch: the rows of every simulation are written as soon as it finishes, and
+    its results and archive are copied to the same place under that directory in the background.
+    """
+    start_time = time.time()
+    failed = True
+    output_dir = simulations[0][5]
+    write_back = None
+    if os.environ.get(WRITE_BACK_VARIABLE):
+        write_back = start_write_back(os.environ[WRITE_BACK_VARIABLE])
+    index_filename = os.path.join(output_dir, 'archive', 'index', generate_unique_per_process_filename() + ".csv")
+    rows = []
+    try:
+        chain = iterate_simulation_chain(simulations, gases, config_file=config_file, cache_dir=cache_dir, warm_init_cycles=warm_init_cycles, convergence=convergence,
+                                         retention=retention)
+        for simulation, simulation_rows in zip(simulations, chain):
+            if write_back is None:
+                rows.extend(simulation_rows)
+                continue
+            results_filename = append_results_rows(output_dir, simulation_rows)
+            run_archive = os.path.join(output_dir, 'archive', run_descriptor(simulation[0]) + '.tar.gz')
+            write_back_files(write_back, [results_filename, run_archive, index_filename, telemetry_filename(output_dir)])
+        failed = False
+    finally:
+        if rows:
+            append_results_rows(output_dir, rows)
+        write_job_event(simulations, start_time, enqueued_at, failed)
+        if write_back is not None:
+            # the tarball shared by the chain is only complete once the chain is done
+            write_back_files(write_back, [os.path.join(output_dir, 'archive', chain_archive_name(simulations) + '.tar.gz'), index_filename,
+                                          telemetry_filename(output_dir)])
+            stop_write_back(write_back)
+
+
+def number_of_unit_cells(unit_cell):
+    return reduce(operator.mul, [int(n) for n in unit_cell.split()], 1)
+
+
+def read_wall_times(output_dirs):
+    """
+    Wall times of the finished simulations in the given output directories, as a list of (mof,
+    unit_cell, pressure, seconds), from the seconds column of the results joined with the manifest.
+    Results written before wall times were recorded are skipped.
+    """
+    samples = []
+    for output_dir in output_dirs:
+        if not os.path.exists(os.path.join(output_dir, 'manifest.csv')):
+            continue
+        gases, simulations = read_manifest(output_dir)
+        manifest = {simulation[0]: simulation for simulation in simulations}
+        num_columns = len(results_header(gases))
+        for row in read_results_rows(output_dir):
+            run_id = int(row[0])
+            if len(row) == num_columns and run_id in manifest and row[-1] != '':
+                _, mof, unit_cell, pressure, _, _ = manifest[run_id]
+                samples.append((mof, unit_cell, pressure, float(row[-1])))
+    return samples
+
+
+def cost_features(unit_cell, pressure):
+    # the log wall time is modelled as linear in the log number of unit cells and log pressure, plus an offset per framework
+    return [1.0, math.log(number_of_unit_cells(unit_cell)), math.log(max(pressure, 1.0))]
+
+
+def fit_cost_model(samples):
+    """
+    Least squares fit of the log wall time of a simulation (see cost_features) to the samples of
+    read_wall_times. Returns the model for predict_seconds, or None if there are no samples.
+    The features shared by all frameworks are fit first, and the offset of each framework is then
+    the mean residual of its samples; fitting both at once is rank deficient (the offsets sum to
+    the intercept), and a framework without samples would be predicted from an arbitrary
+    intercept. Frameworks without samples get no offset of their own.
+    """
+    if not samples:
+        return None
+    features = np.array([cost_features(unit_cell, pressure) for _, unit_cell, pressure, _ in samples])
+    log_seconds = np.log([max(sample[3], 1e-3) for sample in samples])
+    coefficients = np.linalg.lstsq(features, log_seconds, rcond=None)[0]
+    residuals = log_seconds - np.dot(features, coefficients)
+    mofs = np.array([sample[0] for sample in samples])
+    offsets = {mof: float(np.mean(residuals[mofs == mof])) for mof in sorted(set(mofs))}
+    return {'coefficients': coefficients, 'offsets': offsets, 'samples': len(samples)}
+
+
+def predict_seconds(model, mof, unit_cell, pressure, job_minutes):
+    """
+    Predicted wall time of a simulation at one pressure, or the sum over a list of pressures. Without
+    a model, a simulation of a single unit cell is taken to run job_minutes.
+    """
+    if isinstance(pressure, list):
+        return sum([predict_seconds(model, mof, unit_cell, p, job_minutes) for p in pressure])
+    if model is None:
+        return job_minutes * 60 * number_of_unit_cells(unit_cell)
+    return float(np.exp(np.dot(model['coefficients'], cost_features(unit_cell, pressure)) + model['offsets'].get(mof, 0.0)))
+
+
+def predicted_makespan(job_seconds, workers):
+    """
+    Time to run jobs of the given lengths, in order, on `workers` workers that each take the next
+    job as soon as they are free.
+    """
+    finish_times = [0.0] * workers
+    for seconds in job_seconds:
+        heapq.heapreplace(finish_times, finish_times[0] + seconds)
+    return max(finish_times)
+
+
+def chunk_size_for_runtime(unit_cell, job_minutes, chunk_hours, max_chunk_size=None):
+    """
+    Number of simulations to run per queued job so that a job takes roughly `chunk_hours`, given
+    an estimated runtime of `job_minutes` per simulation for a single unit cell. The runtime of a
+    simulation is assumed to scale with the number of unit cells.
+    """
+    chunk_size = max(1, int(chunk_hours * 60 // (job_minutes * number_of_unit_cells(unit_cell))))
+    if max_chunk_size is not None:
+        chunk_size = min(chunk_size, max_chunk_size)
+    return chunk_size
+
+
+def chunk_simulations(simulations, chunk_size):
+    return [simulations[i:i+chunk_size] for i in range(0, len(simulations), chunk_size)]
+
+
+def group_simulations(simulations, by_pressure=False):
+    """
+    Splits the simulations into groups of the same MOF (and output directory), and optionally of
+    the same pressure, keeping the order in which they were given.
+    """
+    groups = {}
+    for simulation in simulations:
+        key = (simulation[1], simulation[5])
+        if by_pressure:
+            pressure = simulation[3]
+            key += (tuple(pressure) if isinstance(pressure, list) else pressure,)
+        groups.setdefault(key, []).append(simulation)
+    return list(groups.values())
+
+
+def composition_path_order(compositions, gases):
+    """
+    Order in which to visit a grid of compositions so that consecutive compositions are neighbours:
+    a boustrophedon (snake) path, sweeping the mole fraction of each gas back and forth while
+    stepping through the mole fractions of the gases before it. The last gas is left out since its
+    mole fraction follows from the others. Returns the indices of the compositions in path order.
+    """
+    directions = [False] * len(gases)
+
+    def snake(indices, level):
+        if level >= len(gases) - 1 or len(indices) <= 1:
+            return indices
+        reverse = directions[level]
+        directions[level] = not reverse
+        values = sorted(set([float(compositions[i][gases[level]]) for i in indices]), reverse=reverse)
+        ordered = []
+        for value in values:
+            ordered.extend(snake([i for i in indices if float(compositions[i][gases[level]]) == value], level + 1))
+        return ordered
+
+    return snake(list(range(len(compositions))), 0)
+
+
+def order_simulations_along_path(simulations, gases):
+    order = composition_path_order([simulation[4] for simulation in simulations], gases)
+    return [simulations[i] for i in order]
+
+
+def pack_pressures(simulations):
+    """
+    Combines the simulations of the same MOF and composition at different pressures into a single
+    simulation, whose run_id and pressure are lists, so RASPA sets up the framework only once.
+    """
+    packed_simulations = {}
+    for run_id, mof, unit_cell, pressure, composition, output_dir in simulations:
+        key = (mof, output_dir, tuple(sorted(composition.items())))
+        if key not in packed_simulations:
+            packed_simulations[key] = ([], mof, unit_cell, [], composition, output_dir)
+        packed_simulations[key][0].append(run_id)
+        packed_simulations[key][3].append(pressure)
+    return list(packed_simulations.values())
+
+
+def simulate_composition(simulation, gases, config_file=DEFAULT_CONFIG_FILE, cache_dir=None, restart_dir=None, warm_init_cycles=None, convergence=None,
+                         retention='essential', archive=None):
+    """
+    Runs a single simulation described by the tuple (run_id, mof, unit_cell, pressure, composition,
+    output_dir) and returns the MOF along with its results rows: one row, or one row per pressure
+    for simulations packed by pack_pressures.
+    """
+    run_id, mof, unit_cell, pressure, composition, output_dir = simulation
+    result = run(run_id, mof, unit_cell, pressure, gases, composition, config_file, output_dir=output_dir, cache_dir=cache_dir,
+                 restart_dir=restart_dir, warm_init_cycles=warm_init_cycles, convergence=convergence, retention=retention, archive=archive)
+    if isinstance(run_id, list):
+        return mof, [results_row(run_id[i], mof, result[i], gases, composition) for i in range(len(run_id))]
+    return mof, [results_row(run_id, mof, result, gases, composition)]
+
+
+def chain_archive_name(simulations):
+    # named after the first and last run of the chain
+    return "%s-%s" % (run_descriptor(simulations[0][0]), run_descriptor(simulations[-1][0]))
+
+
+def iterate_simulation_chain(simulations, gases, config_file=DEFAULT_CONFIG_FILE, cache_dir=None, warm_init_cycles=None, convergence=None, retention='essential'):
+    """
+    Runs a chain of simulations (see simulate_composition) one after the other, yielding the results
+    rows of each. If warm_init_cycles is given, every simulation after the first starts from the
+    final configuration of the previous one, with only warm_init_cycles initialization cycles, so
+    the chain should share MOF and pressure and follow a path through composition space. The files
+    kept by retention (see archive_run) of the whole chain go into a single tarball.
+    """
+    restart_dir = None
+    if warm_init_cycles is not None:
+        restart_dir = os.path.join(simulations[0][5], 'restart', generate_unique_per_process_filename())
+        shutil.rmtree(restart_dir, ignore_errors=True)
+
+    # the simulations of a chain share one tarball
+    archive = None
+    if len(simulations) > 1 and retention != 'results':
+        archive = open_archive(simulations[0][5], chain_archive_name(simulations))
+    try:
+        for simulation in simulations:
+            _, rows = simulate_composition(simulation, gases, config_file=config_file, cache_dir=cache_dir, restart_dir=restart_dir,
+                                           warm_init_cycles=warm_init_cycles, convergence=convergence, retention=retention, archive=archive)
+            yield rows
+    finally:
+        if archive is not None:
+            archive.close()
+    if restart_dir is not None:
+        shutil.rmtree(restart_dir, ignore_errors=True)
+
+
+def simulate_chain(simulations, gases, config_file=DEFAULT_CONFIG_FILE, cache_dir=None, warm_init_cycles=None, convergence=None, retention='essential',
+                   enqueued_at=None):
+    start_time = time.time()
+    rows = []
+    for simulation_rows in iterate_simulation_chain(simulations, gases, config_file=config_file, cache_dir=cache_dir, warm_init_cycles=warm_init_cycles, convergence=convergence,
+                                                        retention=retention):
+        rows.extend(simulation_rows)
+    write_job_event(simulations, start_time, enqueued_at, False)
+    return (simulations[0][1], simulations[0][5]), rows
+
+
+def run_composition_simulations_local(chains, gases, results_files, jobs=1, config_file=DEFAULT_CONFIG_FILE, cache_dir=None, warm_init_cycles=None, convergence=None, retention='essential'):
+    """
+    Runs a list of chains of simulations (see iterate_simulation_chain) on this machine using a pool
+    of `jobs` worker processes. Every worker simulates in its own working directory, since run()
+    names it after the host and pid. Results rows are written to the open results file of their MOF
+    and output directory (results_files is keyed by (mof, output_dir), as several campaigns may
+    simulate the same MOF) in the order the chains were given, as soon as all earlier chains have
+    finished.
+    """
+    csv_writers = {key: csv.writer(f, delimiter='\t') for key, f in results_files.items()}
+    simulate = partial(simulate_chain, gases=gases, config_file=config_file, cache_dir=cache_dir, warm_init_cycles=warm_init_cycles,
+                       convergence=convergence, retention=retention, enqueued_at=time.time())
+
+    def write_results(results):
+        for key, rows in results:
+            csv_writers[key].writerows(rows)
+            results_files[key].flush()
+
+    if jobs == 1:
+        write_results(map(simulate, chains))
+    else:
+        with multiprocessing.Pool(processes=jobs) as pool:
+            write_results(pool.imap(simulate, chains, chunksize=1))
+
+
+def add_submission_arguments(parser):
+    """
+    Command line options shared by the scripts that run or queue simulations.
+    """
+    parser.add_argument('--queue', default=None,
+                        help="queue the jobs in this SQLite file, to be run by sqlite_worker.py, instead of the sjs/Redis queue")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="number of simulations to run at once when no job queue is setup (default: 1)")
+    parser.add_argument('--cache-dir', default='gcmc_cache',
+                        help="directory of previously simulated inputs and their results, shared between campaigns (default: gcmc_cache)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always run RASPA, even if an identical input has been simulated before")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="number of simulations per job, run one after the other; the upper limit when --chunk-hours is given (default: 1, or %s with --warm-start)" % WARM_START_CHAIN_LENGTH)
+    parser.add_argument('--chunk-hours', type=float, default=None,
+                        help="size each job of a MOF to take about this many hours, based on --job-minutes")
+    parser.add_argument('--job-minutes', type=float, default=30.0,
+                        help="estimated minutes per simulation of a single unit cell, used with --chunk-hours (default: 30)")
+    parser.add_argument('--pack-pressures', action='store_true',
+                        help="simulate all pressures of a MOF and composition within one RASPA run")
+    parser.add_argument('--warm-start', action='store_true',
+                        help="run the compositions of each job along a path through composition space, starting each simulation from the final configuration of the previous one")
+    parser.add_argument('--warm-init-cycles', type=int, default=200,
+                        help="initialization cycles of a warm-started simulation (default: 200)")
+    parser.add_argument('--longest-first', action='store_true',
+                        help="queue the jobs predicted to take longest first and report the predicted makespan, using a model of the wall times recorded in --cost-history")
+    parser.add_argument('--cost-history', nargs='+', default=None,
+                        help="output directories with recorded wall times to fit the cost model of --longest-first to (default: output_* in this directory)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of workers to predict the makespan for (default: --jobs)")
+    parser.add_argument('--stage-inputs', action='store_true',
+                        help="render the inputs of all simulations before submitting, into the inputs directory of each output directory")
+    parser.add_argument('--retention', choices=ARCHIVE_RETENTION, default='essential',
+                        help="files of each simulation to keep in the compressed archive of its job: all of them, the input and RASPA output files, or none beyond the results (default: essential)")
+    parser.add_argument('--target-error', type=float, default=None,
+                        help="run each simulation in segments until the relative error of the total mass is below this, e.g. 0.02, instead of a fixed %s cycles" % NUMBER_OF_CYCLES)
+    parser.add_argument('--segment-cycles', type=int, default=500,
+                        help="production cycles per segment with --target-error (default: 500)")
+    parser.add_argument('--max-cycles', type=int, default=10000,
+                        help="most production cycles of a simulation with --target-error (default: 10000)")
+
+
+def submission_chunk_size(simulations, args):
+    """
+    Number of simulations per job for a group of simulations of one MOF, given the options added by
+    add_submission_arguments.
+    """
+    if args.chunk_hours is not None:
+        job_minutes = args.job_minutes * (len(simulations[0][3]) if args.pack_pressures else 1)
+        return chunk_size_for_runtime(simulations[0][2], job_minutes, args.chunk_hours, args.chunk_size)
+    if args.chunk_size is not None:
+        return args.chunk_size
+    return WARM_START_CHAIN_LENGTH if args.warm_start else 1
+
+
+def sjs_job_queue():
+    """
+    The sjs/Redis job queue of settings/sjs.yaml, or None to run the simulations on this machine:
+    when sjs sets up no queue, or sjs (and rq) are not installed, as for local runs and the SQLite
+    queue, which do not need them.
+    """
+    try:
+        import sjs
+    except ImportError:
+        return None
+    sjs.load(os.path.join("settings","sjs.yaml"))
+    return sjs.get_job_queue()
+
+
+def submit_simulations(simulations, gases, job_queue, results_files, args):
+    """
+    Splits the simulations into jobs of a single MOF, which are queued onto job_queue or, if there
+    is no job queue, run on this machine writing to the open results file of each MOF and output
+    directory, keyed by (mof, output_dir). args holds
+    the options added by add_submission_arguments. Returns the queued jobs, as (job, simulations)
+    with the job as returned by enqueue (an rq job, or the job ID of a SQLite queue).
+    """
+    # Workers may run from a copy of this directory (e.g. on node scratch), so share the cache by its full path
+    cache_dir = None if args.no_cache else os.path.abspath(args.cache_dir)
+    if args.pack_pressures:
+        simulations = pack_pressures(simulations)
+
+    # --- Render every input now, so workers only copy them ---
+    if args.stage_inputs:
+        stage_inputs(simulations, gases, NUMBER_OF_CYCLES if args.target_error is None else args.segment_cycles)
+
+    # --- Warm-started jobs follow a path through the compositions of a single MOF and pressure ---
+    warm_init_cycles = args.warm_init_cycles if args.warm_start else None
+    convergence = None
+    if args.target_error is not None:
+        convergence = {'target_error': args.target_error, 'segment_cycles': args.segment_cycles, 'max_cycles': args.max_cycles}
+    chains = []
+    for group in group_simulations(simulations, by_pressure=args.warm_start):
+        if args.warm_start:
+            group = order_simulations_along_path(group, gases)
+        chains.extend(chunk_simulations(group, submission_chunk_size(group, args)))
+
+    # --- Start the longest jobs first, so no worker is left with a long job at the end ---
+    if args.longest_first:
+        model = fit_cost_model(read_wall_times(args.cost_history if args.cost_history else glob.glob('output_*')))
+        job_seconds = [sum([predict_seconds(model, mof, unit_cell, pressure, args.job_minutes) for _, mof, unit_cell, pressure, _, _ in chain])
+                       for chain in chains]
+        order = sorted(range(len(chains)), key=lambda i: job_seconds[i], reverse=True)
+        workers = args.workers if args.workers is not None else args.jobs
+        print("Cost model: %s" % ("fit to %s recorded runs" % model['samples'] if model is not None else "no recorded runs, using --job-minutes"))
+        print("Predicted makespan on %s worker(s): %.2f h longest first, %.2f h in submission order (%.1f core-hours in %s jobs)" % (
+              workers, predicted_makespan([job_seconds[i] for i in order], workers) / 3600,
+              predicted_makespan(job_seconds, workers) / 3600, sum(job_seconds) / 3600, len(chains)))
+        chains = [chains[i] for i in order]
+
+    jobs = []
+    if job_queue is not None:
+        print("Queueing jobs onto queue: %s" % job_queue)
+        for chain in chains:
+            job = job_queue.enqueue(run_composition_simulation_chunk, chain, gases, cache_dir=cache_dir, warm_init_cycles=warm_init_cycles,
+                                    convergence=convergence, retention=args.retention, enqueued_at=time.time())
+            jobs.append((job, chain))
+
+    else:
+        print("No job queue is setup. Running locally with %s parallel job(s) rather than on the cluster" % args.jobs)
+        run_composition_simulations_local(chains, gases, results_files, jobs=args.jobs, cache_dir=cache_dir, warm_init_cycles=warm_init_cycles,
+                                          convergence=convergence, retention=args.retention)
+    return jobs
@@ -0,0 +1,167 @@
+# --------------------------------------------
+# ----- Import Python Commands/Functions -----
+# --------------------------------------------
+from contextlib import closing
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import traceback
+
+from sensor_array_mof_adsorption import generate_unique_per_process_filename
+
+DEFAULT_LEASE_MINUTES = 10
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    description TEXT,
+    payload BLOB,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    enqueued_at REAL,
+    ended_at REAL,
+    error TEXT
+)
+"""
+
+
+# -----------------------------------------
+# ----- User Defined Python Functions -----
+# -----------------------------------------
+class SQLiteJobQueue:
+    """
+    Job queue kept in a single SQLite file, a stand-in for the sjs/rq queue that needs no Redis
+    server: enqueue() takes the same arguments, and any number of workers (see sqlite_worker.py) on
+    machines sharing the file claim jobs from it. A claimed job is leased to its worker, which keeps
+    renewing the lease while the job runs; if the worker dies the lease expires and another worker
+    retries the job, up to max_attempts times. Jobs are stored as pickles of the function and its
+    arguments, so workers must be able to import the function's module.
+    """
+
+    def __init__(self, filename, lease_minutes=DEFAULT_LEASE_MINUTES, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.filename = os.path.abspath(filename)
+        self.lease_seconds = lease_minutes * 60
+        self.max_attempts = max_attempts
+        with closing(self.connect()) as connection:
+            connection.execute(SCHEMA)
+
+    def __str__(self):
+        return "sqlite:%s" % self.filename
+
+    def connect(self):
+        # isolation_level=None leaves transactions to the explicit BEGIN IMMEDIATE in claim()
+        return sqlite3.connect(self.filename, timeout=60, isolation_level=None)
+
+    def enqueue(self, f, *args, **kwargs):
+        payload = pickle.dumps((f, args, kwargs))
+        with closing(self.connect()) as connection:
+            cursor = connection.execute("INSERT INTO jobs (description, payload, enqueued_at) VALUES (?, ?, ?)",
+                                        ("%s.%s" % (f.__module__, f.__name__), payload, time.time()))
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """
+        Atomically takes the oldest job that is queued, or whose lease has expired, and leases it to
+        worker. Jobs whose lease expired max_attempts times are marked failed instead. Returns
+        (job_id, f, args, kwargs), or None if there is nothing to claim.
+        """
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            connection.execute("UPDATE jobs SET status = 'failed', ended_at = ?, error = 'lease expired after ' || attempts || ' attempts' "
+                               "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?", (now, now, self.max_attempts))
+            row = connection.execute("SELECT id, payload FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                                     "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                                   (worker, now + self.lease_seconds, row[0]))
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        f, args, kwargs = pickle.loads(row[1])
+        return row[0], f, args, kwargs
+
+    def renew(self, job_id, worker):
+        # only extends a lease the worker still holds; returns whether it did
+        with closing(self.connect()) as connection:
+            cursor = connection.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                                        (time.time() + self.lease_seconds, job_id, worker))
+            return cursor.rowcount == 1
+
+    def finish(self, job_id, worker, error=None):
+        with closing(self.connect()) as connection:
+            connection.execute("UPDATE jobs SET status = ?, ended_at = ?, error = ? WHERE id = ? AND worker = ?",
+                               ('finished' if error is None else 'failed', time.time(), error, job_id, worker))
+
+    def counts(self):
+        # number of jobs by status
+        with closing(self.connect()) as connection:
+            return dict(connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def status(self, job_id):
+        # 'queued', 'running', 'finished' or 'failed', or None for a job not in the queue
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return None if row is None else row[0]
+
+    def pending(self):
+        counts = self.counts()
+        return counts.get('queued', 0) + counts.get('running', 0)
+
+
+def run_job(job_queue, job_id, f, args, kwargs, worker):
+    """
+    Runs a claimed job, renewing its lease from a background thread every third of the lease time,
+    and records whether it finished or failed (with its traceback).
+    """
+    done = threading.Event()
+
+    def renew_lease():
+        while not done.wait(job_queue.lease_seconds / 3):
+            if not job_queue.renew(job_id, worker):
+                print("Lost the lease on job %s" % job_id)
+                return
+
+    heartbeat = threading.Thread(target=renew_lease, daemon=True)
+    heartbeat.start()
+    error = None
+    try:
+        f(*args, **kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        print("Job %s failed:\n%s" % (job_id, error))
+    finally:
+        done.set()
+        heartbeat.join()
+    job_queue.finish(job_id, worker, error)
+
+
+def work(job_queue, poll_seconds=30, burst=False):
+    """
+    Claims and runs jobs until the queue has none left queued or running. Jobs held by other
+    workers may still come back when their lease expires, so the worker keeps polling every
+    poll_seconds while any are running, unless burst is set.
+    """
+    worker = generate_unique_per_process_filename()
+    while True:
+        job = job_queue.claim(worker)
+        if job is not None:
+            job_id, f, args, kwargs = job
+            print("%s: starting job %s" % (worker, job_id))
+            run_job(job_queue, job_id, f, args, kwargs, worker)
+        elif burst or job_queue.pending() == 0:
+            return
+        else:
+            time.sleep(poll_seconds)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+# ----------------------------------
+# ----- Import Python Packages -----
+# ----------------------------------
+import argparse
+
+from sqlite_job_queue import (SQLiteJobQueue,
+                              DEFAULT_LEASE_MINUTES,
+                              DEFAULT_MAX_ATTEMPTS,
+                              work)
+
+# ----------------------------
+# ----- System Arguments -----
+# ----------------------------
+parser = argparse.ArgumentParser(description="Run the jobs of a SQLite job queue (see --queue of write_simulations.py) until none are left.")
+parser.add_argument('queue_file')
+parser.add_argument('--lease-minutes', type=float, default=DEFAULT_LEASE_MINUTES,
+                    help="time a job stays claimed without its worker renewing the lease (default: %s)" % DEFAULT_LEASE_MINUTES)
+parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                    help="times a job is retried after its worker died (default: %s)" % DEFAULT_MAX_ATTEMPTS)
+parser.add_argument('--poll-seconds', type=float, default=30,
+                    help="wait between checks for jobs whose worker died while other jobs are running (default: 30)")
+parser.add_argument('--burst', action='store_true',
+                    help="exit as soon as there is no job to claim")
+parser.add_argument('--status', action='store_true',
+                    help="print the number of jobs by status and exit")
+args = parser.parse_args()
+
+job_queue = SQLiteJobQueue(args.queue_file, lease_minutes=args.lease_minutes, max_attempts=args.max_attempts)
+if args.status:
+    for status, count in sorted(job_queue.counts().items()):
+        print("%s: %s" % (status, count))
+else:
+    work(job_queue, poll_seconds=args.poll_seconds, burst=args.burst)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# ----------------------------------
+# ----- Import Python Packages -----
+# ----------------------------------
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+# ----------------------------
+# ----- System Arguments -----
+# ----------------------------
+parser = argparse.ArgumentParser(description="Summarize the telemetry logged by the simulations of one or more output directories.")
+parser.add_argument('output_dirs', nargs='+', help="output directories written by write_simulations.py")
+args = parser.parse_args()
+
+# ----------------------------
+# ----- Read every event -----
+# ----------------------------
+events = []
+for output_dir in args.output_dirs:
+    for filename in glob.glob(os.path.join(output_dir, 'telemetry', '*.jsonl')):
+        with open(filename) as f:
+            events.extend([json.loads(line) for line in f if line.strip()])
+
+simulations = [event for event in events if event['event'] == 'simulation']
+jobs = [event for event in events if event['event'] == 'job']
+if not simulations:
+    print("No simulations logged in %s" % ", ".join(args.output_dirs))
+    raise SystemExit
+
+def percentiles(values):
+    return "p50 %8.1f s   p90 %8.1f s   p99 %8.1f s   max %8.1f s" % (*np.percentile(values, [50, 90, 99]), max(values))
+
+# ----------------------
+# ----- Throughput -----
+# ----------------------
+start = min([event['time'] - event['seconds'] for event in simulations + jobs])
+end = max([event['time'] for event in simulations + jobs])
+hours = max(end - start, 1e-9) / 3600
+workers = set([event['worker'] for event in simulations])
+cached = [event for event in simulations if event['cached']]
+print("%s simulations (%s from the cache) in %s jobs by %s workers over %.2f h" % (len(simulations), len(cached), len(jobs), len(workers), hours))
+print("Throughput: %.1f simulations/hour, %.1f jobs/hour" % (len(simulations) / hours, len(jobs) / hours))
+failed = [event for event in jobs if event['failed']]
+if failed:
+    print("Failed jobs: %s" % len(failed))
+
+# ---------------------------
+# ----- Stage breakdown -----
+# ---------------------------
+stage_totals = {}
+for event in simulations:
+    for stage, seconds in event['stages'].items():
+        stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+total = sum(stage_totals.values())
+print("\nTime by stage:")
+for stage, seconds in sorted(stage_totals.items(), key=lambda item: item[1], reverse=True):
+    print("  %-8s %10.1f s  %5.1f%%  %8.2f s/simulation" % (stage, seconds, 100 * seconds / total, seconds / len(simulations)))
+queue_waits = [event['queue_wait'] for event in jobs if event['queue_wait'] is not None]
+if queue_waits:
+    print("  %-8s %10.1f s  (outside of simulations)" % ('queue', sum(queue_waits)))
+
+# ----------------------
+# ----- Cost by MOF -----
+# ----------------------
+mof_seconds = {}
+for event in simulations:
+    mof_seconds.setdefault(event['mof'], []).append(event['seconds'])
+print("\nCost by MOF:")
+for mof, seconds in sorted(mof_seconds.items(), key=lambda item: sum(item[1]), reverse=True):
+    print("  %-20s %6s simulations  %8.2f core-hours  %8.1f s/simulation" % (mof, len(seconds), sum(seconds) / 3600, np.mean(seconds)))
+
+# ---------------------------
+# ----- Tail latencies -----
+# ---------------------------
+print("\nLatencies:")
+print("  simulation  %s" % percentiles([event['seconds'] for event in simulations if not event['cached']] or [0.0]))
+if jobs:
+    print("  job         %s" % percentiles([event['seconds'] for event in jobs]))
+if queue_waits:
+    print("  queue wait  %s" % percentiles(queue_waits))
@@ -0,0 +1,35 @@
+import csv
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'consolidate_results.py')
+
+
+def write_rows(filename, rows):
+    with open(filename, 'w', newline='') as csvfile:
+        csv.writer(csvfile, delimiter='\t').writerows(rows)
+
+
+def test_consolidates_results_of_the_old_layout(tmp_path):
+    # results files written before the total and component masses were recorded: Run ID, MOF, Mass, <gases>
+    output_dir = tmp_path / 'output_IRMOF-1_old'
+    output_dir.mkdir()
+    write_rows(output_dir / 'IRMOF-1.csv', [['Run ID', 'MOF', 'Mass', 'CO2', 'N2'],
+                                            [0, 'IRMOF-1', 1.5, 0.25, 0.75],
+                                            [1, 'IRMOF-1', 2.5, 0.75, 0.25],
+                                            [1, 'IRMOF-1', 9.9, 0.75, 0.25]])
+    store = tmp_path / 'results.npz'
+    subprocess.run([sys.executable, SCRIPT, str(output_dir), '-o', str(store)], check=True, cwd=tmp_path)
+
+    results = np.load(store)
+    assert list(results['gases']) == ['CO2', 'N2']
+    assert list(results['run_id']) == [0, 1]
+    assert list(results['total_mass']) == [1.5, 2.5]
+    assert np.all(np.isnan(results['total_mass_error']))
+    assert results['component_mass'].shape == (2, 2) and np.all(np.isnan(results['component_mass']))
+    assert results['composition'].tolist() == [[0.25, 0.75], [0.75, 0.25]]
+    assert list(results['composition_id']) == [0, 1]
+    assert np.all(np.isnan(results['cycles']))
@@ -0,0 +1,38 @@
+import numpy as np
+
+from sensor_array_mof_adsorption import fit_cost_model, predict_seconds
+
+
+def wall_time_samples():
+    # wall times proportional to the number of unit cells, with a framework (MOF-B) that runs twice as long as its size suggests
+    samples = []
+    for mof, unit_cell, factor in [('MOF-A', '1 1 1', 1.0), ('MOF-B', '2 1 1', 2.0), ('MOF-C', '2 2 2', 1.0), ('MOF-D', '3 3 3', 1.0)]:
+        cells = np.prod([int(n) for n in unit_cell.split()])
+        for pressure in [1e4, 1e5, 1e6]:
+            samples.append((mof, unit_cell, pressure, 100.0 * cells * factor))
+    return samples
+
+
+def test_predicts_seen_frameworks():
+    model = fit_cost_model(wall_time_samples())
+    assert np.isclose(predict_seconds(model, 'MOF-B', '2 1 1', 1e5, 30), 400.0, rtol=0.05)
+    assert np.isclose(predict_seconds(model, 'MOF-D', '3 3 3', 1e5, 30), 2700.0, rtol=0.2)
+
+
+def test_predicts_unseen_framework_like_the_seen_ones():
+    # frameworks of the same size, with different run times of their own
+    samples = [(mof, '2 2 2', pressure, seconds) for mof, seconds in [('MOF-A', 800.0), ('MOF-B', 1600.0), ('MOF-C', 400.0), ('MOF-D', 800.0)]
+               for pressure in [1e4, 1e5, 1e6]]
+    model = fit_cost_model(samples)
+    # the geometric mean of the frameworks seen
+    assert np.isclose(predict_seconds(model, 'MOF-new', '2 2 2', 1e5, 30), 800.0, rtol=0.05)
+
+
+def test_predicts_unseen_framework_from_shared_features():
+    model = fit_cost_model(wall_time_samples())
+    # a framework without recorded wall times is scaled by its number of unit cells, like the others
+    small = predict_seconds(model, 'MOF-new', '1 1 1', 1e5, 30)
+    large = predict_seconds(model, 'MOF-new', '3 3 3', 1e5, 30)
+    assert 1500.0 < large < 5400.0
+    assert large > 10 * small
+    assert large > predict_seconds(model, 'MOF-C', '2 2 2', 1e5, 30)
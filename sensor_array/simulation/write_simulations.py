@@ -3,95 +3,82 @@
 # ----------------------------------
 # ----- Import Python Packages -----
 # ----------------------------------
+import argparse
 import csv
 import os
-import sys
-from datetime import datetime
 
-import numpy as np
-import sjs
-
-from sensor_array_mof_adsorption import read_composition_configuration,
-                                        run_composition_simulation,
-                                        read_gases_configuration,
-                                        read_mof_configuration_csv,
-                                        read_pressure_configuration,
-                                        generate_unique_run_name
+from sqlite_job_queue import SQLiteJobQueue
+from sensor_array_mof_adsorption import (read_composition_configuration,
+                                         read_gases_configuration,
+                                         read_mof_configuration_csv,
+                                         read_pressure_configuration,
+                                         generate_unique_run_name,
+                                         results_header,
+                                         write_manifest,
+                                         add_submission_arguments,
+                                         submit_simulations,
+                                         sjs_job_queue)
 
 # ----------------------------
 # ----- System Arguments -----
 # ----------------------------
-mofs_filepath = sys.argv[1]
-compositions_filepath = sys.argv[2]
-gases_filepath = sys.argv[3]
-pressures_filepath = sys.argv[4]
-
-mofs, unit_cells = read_mof_configuration_csv(mofs_filepath)
-compositions = read_composition_configuration(compositions_filepath)
-gases = read_gases_configuration(gases_filepath)
-pressures = read_pressure_configuration(pressures_filepath)
-
-# --------------------------
-# ----- Some sjs stuff -----
-# --------------------------
-sjs.load(os.path.join("settings","sjs.yaml"))
-job_queue = sjs.get_job_queue()
+parser = argparse.ArgumentParser(description="Queue (or run locally) a RASPA simulation for every MOF, pressure and composition.")
+parser.add_argument('mofs_filepath')
+parser.add_argument('compositions_filepath')
+parser.add_argument('gases_filepath')
+parser.add_argument('pressures_filepath')
+add_submission_arguments(parser)
+args = parser.parse_args()
 
-# ---------------------------------
-# ----- Add jobs to job queue -----
-# ---------------------------------
-if job_queue is not None:
-    print("Queueing jobs onto queue: %s" % job_queue)
-    run_id_number = 0
-    for i in range(len(mofs)):
-        # --- Find the correspinging mof and unit cells ---
-        mof = mofs[i]
-        unit_cell = unit_cells[i]
+mofs, unit_cells = read_mof_configuration_csv(args.mofs_filepath)
+compositions = read_composition_configuration(args.compositions_filepath)
+gases = read_gases_configuration(args.gases_filepath)
+pressures = read_pressure_configuration(args.pressures_filepath)
 
-        # --- Generate unique output directory ---
-        run_name = generate_unique_run_name()
-        output_dir = 'output_' + mof + '_%s' % run_name
-        os.makedirs(output_dir)
-
-        # ----- Setup CSV file and write header -----
-        f = open(os.path.join(output_dir, mof+'.csv'),'w',newline='')
-        header = ['Run ID','MOF','Mass']
-        for gas in gases:
-            header.append(gas)
-        writer = csv.writer(f, delimiter='\t')
-        writer.writerow(header)
+# -------------------------------
+# ----- Setup the job queue -----
+# -------------------------------
+if args.queue is not None:
+    job_queue = SQLiteJobQueue(args.queue)
+else:
+    job_queue = sjs_job_queue()
 
-        # --- Queue info for simulating ---
-        for pressure in pressures:
-            for composition in compositions:
-                run_id = run_id_number
-                job_queue.enqueue(run_composition_simulation, run_id, mof, unit_cell, pressure, gases, composition, csv_writer=None, output_dir=output_dir)
-                run_id_number += 1
+# ---------------------------------------------------
+# ----- Setup output directories and CSV files -----
+# ---------------------------------------------------
+output_dirs = {}
+results_files = {}
+for mof in mofs:
+    # --- Generate unique output directory ---
+    run_name = generate_unique_run_name()
+    output_dir = 'output_' + mof + '_%s' % run_name
+    os.makedirs(output_dir)
+    output_dirs[mof] = output_dir
 
-else:
-    print("No job queue is setup. Running in serial mode here rather than on the cluster")
-    for i in range(len(mofs)):
-        # --- Find the correspinging mof and unit cells ---
-        mof = mofs[i]
-        unit_cell = unit_cells[i]
+    # ----- Setup CSV file and write header -----
+    f = open(os.path.join(output_dir, mof+'.csv'),'w',newline='')
+    writer = csv.writer(f, delimiter='\t')
+    writer.writerow(results_header(gases))
+    f.flush()
+    results_files[(mof, output_dir)] = f
 
-        # --- Generate unique output directory ---
-        run_name = generate_unique_run_name()
-        output_dir = 'output_' + mof + '_%s' % run_name
-        os.makedirs(output_dir)
+# --- List every simulation as (run_id, mof, unit_cell, pressure, composition, output_dir) ---
+simulations = []
+run_id_number = 0
+for i in range(len(mofs)):
+    for pressure in pressures:
+        for composition in compositions:
+            simulations.append((run_id_number, mofs[i], unit_cells[i], pressure, composition, output_dirs[mofs[i]]))
+            run_id_number += 1
 
-        # ----- Setup CSV file and write header -----
-        f = open(os.path.join(output_dir, mof+'.csv'),'w',newline='')
-        header = ['Run ID','MOF','Mass']
-        for gas in gases:
-            header.append(gas)
-        writer = csv.writer(f, delimiter='\t')
-        writer.writerow(header)
+# --- Record every expected run, so the campaign can be resumed with resume_simulations.py ---
+for mof in mofs:
+    write_manifest(output_dirs[mof], [simulation for simulation in simulations if simulation[1] == mof], gases)
 
-        # --- Queue info for simulating ---
-        for pressure in pressures:
-            for composition in compositions:
-                run_id = datetime.now().strftime("%Y_%m_%d__%H_%M_%S")
-                run_composition_simulation(run_id, mof, unit_cell, pressure, gases, composition, csv_writer=writer, output_dir=output_dir)
+# -----------------------------------------------
+# ----- Add jobs to job queue (or run here) -----
+# -----------------------------------------------
+submit_simulations(simulations, gases, job_queue, results_files, args)
 
-f.close()
+for f in results_files.values():
+    f.close()